@@ -0,0 +1,10 @@
+"""
+Reproducible performance benchmarks.
+
+    python -m benchmarks                      # run, compare with benchmarks/baseline.json
+    python -m benchmarks --save-baseline      # record a new baseline for this database
+    python -m benchmarks --patients 2000 --only sessions.timeline
+
+Data is generated deterministically into a throwaway test database
+(SQLite, or Postgres when POSTGRES_DB is set), so runs are comparable.
+"""
@@ -0,0 +1,175 @@
+import argparse
+import dataclasses
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases  # noqa: E402
+from benchmarks.data import Scale, generate  # noqa: E402
+from benchmarks.scenarios import SCENARIOS, make_context  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).with_name('baseline.json')
+# Differences below these are noise, whatever the ratio
+MIN_TIME_DELTA_MS = 1.0
+MIN_MEMORY_DELTA_KB = 64
+
+
+def measure(scenario, ctx, repeat):
+    def run():
+        if scenario.reset:
+            scenario.reset(ctx)
+        started = time.perf_counter()
+        scenario.run(ctx)
+        return (time.perf_counter() - started) * 1000
+
+    run()  # warm-up: caches, compiled plans, connection
+    # As timeit does: no GC pauses inside timed runs
+    gc.collect()
+    gc.disable()
+    try:
+        times = [run() for _ in range(repeat)]
+    finally:
+        gc.enable()
+
+    if scenario.reset:
+        scenario.reset(ctx)
+    # The log is a bounded deque; once full, CaptureQueriesContext would see no new entries
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as queries:
+        scenario.run(ctx)
+
+    if scenario.reset:
+        scenario.reset(ctx)
+    tracemalloc.start()
+    scenario.run(ctx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(min(times), 3),
+        'queries': len(queries.captured_queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def host():
+    """What timings depend on; they are only comparable against a baseline from the same host."""
+    return {'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def regressions(results, baseline, threshold, queries_only=False):
+    failures = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            failures.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+        if queries_only:
+            continue
+        # The fastest run is the least noisy estimate on a shared machine
+        if (current['min_ms'] > previous['min_ms'] * threshold
+                and current['min_ms'] - previous['min_ms'] > MIN_TIME_DELTA_MS):
+            failures.append(f"{name}: {previous['min_ms']:.2f} ms -> {current['min_ms']:.2f} ms")
+        if (current['peak_kb'] > previous['peak_kb'] * threshold
+                and current['peak_kb'] - previous['peak_kb'] > MIN_MEMORY_DELTA_KB):
+            failures.append(f"{name}: peak memory {previous['peak_kb']:.0f} KB -> {current['peak_kb']:.0f} KB")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Run the performance benchmark suite.")
+    for field in dataclasses.fields(Scale):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=int, default=field.default)
+    parser.add_argument('--repeat', type=int, default=9, help="Timed runs per scenario (the fastest is compared)")
+    parser.add_argument('--only', nargs='+', default=[], help="Scenario name prefixes to run")
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=1.5, help="Fail when time or memory exceeds baseline x this")
+    parser.add_argument(
+        '--queries-only', action='store_true',
+        help="Compare query counts only, which hold on any machine (times and memory depend on the host that recorded the baseline)",
+    )
+    parser.add_argument('--save-baseline', action='store_true', help="Record these results as the baseline for this database")
+    parser.add_argument('--output', type=Path, help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    scale = Scale(**{field.name: getattr(args, field.name) for field in dataclasses.fields(Scale)})
+    scenarios = [s for s in SCENARIOS if not args.only or any(s.name.startswith(prefix) for prefix in args.only)]
+    vendor = connection.vendor
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        started = time.perf_counter()
+        ctx = make_context(generate(scale))
+        print(f"Generated data on {vendor} in {time.perf_counter() - started:.1f}s: {scale.as_dict()}")
+
+        results = {}
+        print(f"{'scenario':<32} {'median ms':>10} {'min ms':>9} {'queries':>8} {'peak KB':>9}")
+        for scenario in scenarios:
+            results[scenario.name] = result = measure(scenario, ctx, args.repeat)
+            print(f"{scenario.name:<32} {result['median_ms']:>10.2f} {result['min_ms']:>9.2f} {result['queries']:>8} {result['peak_kb']:>9.0f}")
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    report = {
+        'scale': scale.as_dict(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'host': host(),
+        'scenarios': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps({vendor: report}, indent=2) + '\n')
+
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.save_baseline:
+        if vendor in baselines and args.only:
+            # Keep the scenarios that were not re-run
+            report['scenarios'] = {**baselines[vendor]['scenarios'], **results}
+        baselines[vendor] = report
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        print(f"Saved {vendor} baseline to {args.baseline}")
+        return 0
+
+    baseline = baselines.get(vendor)
+    if baseline is None:
+        print(f"No {vendor} baseline in {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    if baseline['scale'] != scale.as_dict():
+        print(f"The {vendor} baseline was recorded at a different scale {baseline['scale']}; not comparing.")
+        return 2
+
+    if not args.queries_only and baseline.get('host') != host():
+        print(
+            f"Warning: the {vendor} baseline was recorded on {baseline.get('host', 'another host')}, this is {host()}. "
+            "Time and memory comparisons are only meaningful on the recording host: re-record with "
+            "--save-baseline here, or pass --queries-only."
+        )
+
+    compared = 'query counts' if args.queries_only else f'threshold x{args.threshold}'
+    failures = regressions(results, baseline['scenarios'], args.threshold, args.queries_only)
+    if failures:
+        print(f"\n{len(failures)} regression(s) against the {vendor} baseline ({compared}):")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"\nNo regressions against the {vendor} baseline ({compared}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Deterministic synthetic clinic data for benchmarks."""
+import io
+import math
+import random
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+from clinic import face_chart
+from clinic.models import ClinicalImage, ImageDerivative, Patient, TreatmentSession, face_chart_stats
+from commerce.models import Course, Product, Transaction, UserCourseBalance
+from tasks.commission_tasks import calculate_commissions_batch
+
+FIRST_NAMES = ['Somchai', 'Somsri', 'Niran', 'Kanya', 'Anan', 'Malee', 'Pim', 'Chai', 'Ploy', 'Nok']
+LAST_NAMES = ['Jaidee', 'Srisuk', 'Wongsa', 'Boonmee', 'Chaiyaporn', 'Thongdee', 'Rattana', 'Sukjai']
+
+
+@dataclass
+class Scale:
+    seed: int = 42
+    patients: int = 500
+    sessions_per_patient: int = 8
+    images_per_session: int = 2
+    strokes_per_chart: int = 30
+    points_per_stroke: int = 120
+    products: int = 50
+    courses: int = 20
+    transactions: int = 5000
+    staff: int = 10
+    days: int = 730
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def synthetic_chart(strokes, points, seed=0, color='#EA580C'):
+    """
+    Canvas-like strokes: smooth curves over a 400x500 face chart sampled at
+    mouse/stylus rate (integer offsets, 1-3 px apart, with hand jitter).
+    """
+    rng = random.Random(seed)
+    chart = []
+    for _ in range(strokes):
+        x, y = rng.uniform(60, 340), rng.uniform(60, 440)
+        heading = rng.uniform(0, 2 * math.pi)
+        turn = rng.uniform(-0.05, 0.05)
+        stroke = []
+        for _ in range(points):
+            heading += turn + rng.gauss(0, 0.03)
+            step = rng.uniform(1, 3)
+            x = min(max(x + step * math.cos(heading), 0), 400)
+            y = min(max(y + step * math.sin(heading), 0), 500)
+            stroke.append({'x': round(x + rng.gauss(0, 0.3)), 'y': round(y + rng.gauss(0, 0.3)), 'color': color})
+        chart.append(stroke)
+    return chart
+
+
+def _uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def generate(scale):
+    """
+    Populate the database. Bulk inserts skip signals, so the derived state
+    the app normally maintains (encoded charts, dashboard rollups,
+    commission logs) is produced explicitly. Returns ids the scenarios use.
+    """
+    rng = random.Random(scale.seed)
+    now = timezone.now().replace(microsecond=0)
+
+    def moment():
+        return now - timedelta(seconds=rng.randrange(scale.days * 86400))
+
+    staff = User.objects.bulk_create([User(username=f"bench-staff-{i}", first_name=f"Staff{i}") for i in range(scale.staff)])
+
+    patients = Patient.objects.bulk_create([
+        Patient(
+            id=_uuid(rng), hn=f"HN{i:06d}",
+            first_name=rng.choice(FIRST_NAMES), last_name=f"{rng.choice(LAST_NAMES)}{i}",
+            phone_number=f"08{rng.randrange(10 ** 8):08d}",
+        )
+        for i in range(scale.patients)
+    ], batch_size=1000)
+
+    # A handful of chart templates, encoded once: per-row RDP would dominate setup time
+    templates = []
+    for template in range(8):
+        blob, stored, _ = face_chart.encode(
+            synthetic_chart(scale.strokes_per_chart, scale.points_per_stroke, seed=scale.seed + template),
+            scale=settings.FACE_CHART_SCALE, tolerance=settings.FACE_CHART_TOLERANCE,
+        )
+        templates.append((blob, *face_chart_stats(stored)))
+
+    sessions = []
+    for patient in patients:
+        for _ in range(scale.sessions_per_patient):
+            blob, strokes, points = rng.choice(templates)
+            sessions.append(TreatmentSession(
+                id=_uuid(rng), patient=patient, doctor=rng.choice(staff),
+                diagnosis_notes="Follow-up. " * rng.randrange(5, 60),
+                face_chart_blob=blob, stroke_count=strokes, point_count=points,
+            ))
+    TreatmentSession.objects.bulk_create(sessions, batch_size=1000)
+    for session in sessions:
+        session.date = moment()
+    TreatmentSession.objects.bulk_update(sessions, ['date'], batch_size=1000)
+
+    images = ClinicalImage.objects.bulk_create([
+        ClinicalImage(id=_uuid(rng), session=session, s3_key=f"uploads/{session.id}-{n}.jpg", image_type=rng.choice(['BEFORE', 'AFTER']))
+        for session in sessions for n in range(scale.images_per_session)
+    ], batch_size=1000)
+    ImageDerivative.objects.bulk_create([
+        ImageDerivative(
+            image=image, variant=variant, s3_key=image.s3_key.replace('.jpg', f'.{variant}'),
+            width=width, height=width * 2 // 3, format=variant.split('.')[1], size_bytes=width * 20,
+        )
+        for image in images
+        for variant, width in (('w256.webp', 256), ('w256.jpg', 256), ('w1024.webp', 1024), ('w1024.jpg', 1024))
+    ], batch_size=2000)
+
+    products = Product.objects.bulk_create([
+        Product(sku=f"SKU{i:04d}", name=f"Product {i}", product_type=rng.choice(['SERVICE', 'DRUG', 'RETAIL']), price=Decimal(rng.randrange(500, 90000)))
+        for i in range(scale.products)
+    ])
+    courses = Course.objects.bulk_create([
+        Course(name=f"Course {i}", product_included=rng.choice(products), total_sessions=rng.choice([5, 10]), price=Decimal(rng.randrange(5000, 150000)))
+        for i in range(scale.courses)
+    ])
+    UserCourseBalance.objects.bulk_create([
+        UserCourseBalance(patient=patient, course=course, remaining_sessions=rng.randrange(0, 10))
+        for patient in patients for course in rng.sample(courses, min(3, len(courses)))
+    ], batch_size=1000)
+
+    transactions = Transaction.objects.bulk_create([
+        Transaction(
+            id=_uuid(rng), patient=rng.choice(patients), staff_1=rng.choice(staff),
+            staff_2=rng.choice(staff) if rng.random() < 0.3 else None,
+            total_amount=Decimal(rng.randrange(50000, 25000000)) / 100,
+            status=rng.choices(['COMPLETED', 'PENDING', 'VOID'], [85, 10, 5])[0],
+        )
+        for _ in range(scale.transactions)
+    ], batch_size=1000)
+    for txn in transactions:
+        txn.created_at = moment()
+    Transaction.objects.bulk_update(transactions, ['created_at'], batch_size=1000)
+
+    completed = [str(txn.id) for txn in transactions if txn.status == 'COMPLETED']
+    for start in range(0, len(completed), 1000):
+        calculate_commissions_batch(completed[start:start + 1000])
+    call_command('rebuild_dashboard_metrics', stdout=io.StringIO())
+
+    busiest_id = Counter(txn.patient_id for txn in transactions).most_common(1)[0][0]
+    busiest = next(patient for patient in patients if patient.id == busiest_id)
+    return {
+        'patient_id': str(busiest.id),
+        'patient_last_name': busiest.last_name,
+        'session_id': str(next(session.id for session in sessions if session.patient_id == busiest.id)),
+        'completed_transaction_ids': completed,
+        'period': now.strftime('%Y-%m'),
+    }
@@ -0,0 +1,59 @@
+"""Benchmark scenarios: the main endpoints (via the Django test client) and commission processing."""
+from dataclasses import dataclass
+from typing import Callable, Optional
+from django.test import Client
+from commerce.ledger import delete_commission_logs
+from commerce.models import CommissionLog
+from tasks.commission_tasks import calculate_commission, calculate_commissions_batch
+
+
+@dataclass
+class Scenario:
+    name: str
+    run: Callable[[dict], object]
+    # Called before every run, outside the measurement
+    reset: Optional[Callable[[dict], None]] = None
+
+
+def _get(url):
+    def run(ctx):
+        response = ctx['client'].get(url.format(**ctx))
+        if response.status_code != 200:
+            raise AssertionError(f"GET {url.format(**ctx)} -> {response.status_code}: {response.content[:200]!r}")
+        return response.content
+    return run
+
+
+def _uncalculate(count):
+    def reset(ctx):
+        delete_commission_logs(CommissionLog.objects.filter(transaction_id__in=ctx['completed_transaction_ids'][:count]))
+    return reset
+
+
+SCENARIOS = [
+    Scenario('patients.list', _get('/api/v1/clinic/patients/?page_size=100')),
+    Scenario('patients.search', _get('/api/v1/clinic/patients/search/?q={patient_last_name}')),
+    Scenario('patients.chart', _get('/api/v1/clinic/patients/{patient_id}/chart/?sessions=50&transactions=50')),
+    Scenario('sessions.timeline', _get('/api/v1/clinic/sessions/?patient={patient_id}&page_size=100')),
+    Scenario('sessions.list_all', _get('/api/v1/clinic/sessions/?page_size=100')),
+    Scenario('sessions.detail', _get('/api/v1/clinic/sessions/{session_id}/')),
+    Scenario('sessions.face_charts', _get('/api/v1/clinic/sessions/?patient={patient_id}&fields=id,date,face_chart_data')),
+    Scenario('transactions.list', _get('/api/v1/commerce/transactions/?page_size=100')),
+    Scenario('commissions.summary', _get('/api/v1/commerce/commissions/summary/?period={period}')),
+    Scenario('dashboard.metrics', _get('/api/v1/dashboard/metrics/?days=30')),
+    Scenario('dashboard.activity', _get('/api/v1/dashboard/activity/?limit=50')),
+    Scenario(
+        'commission.calculate_single',
+        lambda ctx: calculate_commission(ctx['completed_transaction_ids'][0]),
+        reset=_uncalculate(1),
+    ),
+    Scenario(
+        'commission.calculate_batch_200',
+        lambda ctx: calculate_commissions_batch(ctx['completed_transaction_ids'][:200]),
+        reset=_uncalculate(200),
+    ),
+]
+
+
+def make_context(ids):
+    return {**ids, 'client': Client()}
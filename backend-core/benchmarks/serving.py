@@ -0,0 +1,285 @@
+"""
+Load benchmark of the production servers: the same endpoints under
+gunicorn with threaded WSGI workers and with Uvicorn ASGI workers
+(gunicorn.conf.py, SERVER_MODE), same worker count, same data.
+
+    python -m benchmarks.serving --workers 2 --connections 64 --duration 10 --storage-latency 50
+
+Each server runs on a throwaway copy of the benchmark data set
+(benchmarks.data) and talks to a stub S3 endpoint that answers after
+--storage-latency ms; with a latency set, the bucket check runs on every
+upload-token request (AWS_S3_BUCKET_CHECK_TTL=0), standing in for a slow
+storage call. Keep-alive HTTP/1.1 clients on one asyncio loop hold
+--connections requests in flight per endpoint; reported are requests per
+second and latency percentiles. The load generator shares the machine with
+the servers, so compare modes within one run rather than across machines.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_databases, teardown_databases  # noqa: E402
+from benchmarks.data import Scale, generate  # noqa: E402
+
+MODES = ('wsgi', 'asgi')
+ENDPOINTS = {
+    'upload-token': '/api/v1/clinic/upload-token/?ext=jpg',
+    'dashboard.metrics': '/api/v1/dashboard/metrics/?days=30',
+    'patients.search': '/api/v1/clinic/patients/search/?q={patient_last_name}',
+    # A sync DRF view, for what ASGI costs the endpoints that were not converted
+    'patients.list': '/api/v1/clinic/patients/?page_size=50',
+}
+SERVER_START_TIMEOUT = 60
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_storage(latency):
+    """An S3 stand-in answering every request with an empty 200 after `latency` seconds."""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _answer(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        do_HEAD = do_GET = do_PUT = _answer
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Server:
+    """gunicorn -c gunicorn.conf.py in one SERVER_MODE, on the benchmark database."""
+
+    def __init__(self, mode, env, log_dir):
+        self.port = free_port()
+        self.log_path = Path(log_dir) / f'{mode}.log'
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+            cwd=settings.BASE_DIR,
+            env={**env, 'SERVER_MODE': mode, 'GUNICORN_BIND': f'127.0.0.1:{self.port}'},
+            stdout=self.log_path.open('w'), stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        self.wait_ready()
+
+    def wait_ready(self):
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{self.port}/metrics', timeout=1).read()
+                return
+            except urllib.error.HTTPError:
+                return  # Answering (METRICS_TOKEN set)
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Server did not start; see {self.log_path}:\n{self.log_path.read_text()[-2000:]}")
+
+    def stop(self):
+        if self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+
+
+async def _read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    length, chunked = 0, False
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if not chunked:
+        await reader.readexactly(length)
+        return status
+    while size := int((await reader.readline()).split(b';')[0], 16):
+        await reader.readexactly(size + 2)
+    await reader.readline()
+    return status
+
+
+async def _client(port, request, deadline, latencies, errors):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await _read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError, IndexError, ValueError) as e:
+            # Closed by the server (worker recycled, timeout): reconnect
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _load(port, path, connections, duration):
+    request = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: application/json\r\n\r\n'.encode()
+    latencies, errors = [], []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(_client(port, request, deadline, latencies, errors) for _ in range(connections)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def run_load(port, path, connections, duration, warmup):
+    if warmup:
+        asyncio.run(_load(port, path, connections, warmup))
+    latencies, errors, elapsed = asyncio.run(_load(port, path, connections, duration))
+    latencies.sort()
+
+    def percentile(q):
+        return round(latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1000, 1) if latencies else None
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': percentile(0.5),
+        'p99_ms': percentile(0.99),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 1) if latencies else None,
+        'errors': len(errors),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.serving', description=__doc__.strip().splitlines()[0])
+    for field in dataclasses.fields(Scale):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=int, default=field.default)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--only', nargs='+', default=[], help="Endpoint name prefixes to load")
+    parser.add_argument('--workers', type=int, default=2, help="Server worker processes (both modes)")
+    parser.add_argument('--threads', type=int, default=4, help="Threads per WSGI worker")
+    parser.add_argument('--connections', type=int, default=64, help="Requests in flight")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds of load per endpoint")
+    parser.add_argument('--warmup', type=float, default=2, help="Seconds of unmeasured load first")
+    parser.add_argument('--storage-latency', type=float, default=50, help="Stub S3 response time in ms; 0 keeps the bucket check cached")
+    parser.add_argument('--output', type=Path, help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    scale = Scale(**{field.name: getattr(args, field.name) for field in dataclasses.fields(Scale)})
+    endpoints = {name: path for name, path in ENDPOINTS.items() if not args.only or any(name.startswith(p) for p in args.only)}
+
+    work_dir = tempfile.mkdtemp(prefix='benchmark-serving-')
+    if connection.vendor == 'sqlite':
+        # Servers are separate processes: a database file rather than the in-memory test database
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(work_dir, 'benchmark.sqlite3')
+    old_config = setup_databases(verbosity=0, interactive=False)
+    storage = start_stub_storage(args.storage_latency / 1000)
+    results = {}
+    try:
+        started = time.perf_counter()
+        ids = generate(scale)
+        print(f"Generated data on {connection.vendor} in {time.perf_counter() - started:.1f}s: {scale.as_dict()}")
+        connection.close()
+
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'benchmarks.serving_settings',
+            'BENCHMARK_DATABASE_NAME': str(connection.settings_dict['NAME']),
+            'DEBUG': 'False',
+            'ALLOWED_HOSTS': '127.0.0.1',
+            'WEB_CONCURRENCY': str(args.workers),
+            'GUNICORN_THREADS': str(args.threads),
+            'AWS_S3_ENDPOINT_URL': f'http://127.0.0.1:{storage.server_port}',
+            'AWS_S3_PUBLIC_ENDPOINT_URL': f'http://127.0.0.1:{storage.server_port}',
+            'AWS_S3_BUCKET_CHECK_TTL': '0' if args.storage_latency else '300',
+        }
+        print(
+            f"{args.workers} workers ({args.threads} threads each under WSGI), {args.connections} connections, "
+            f"{args.duration:g}s per endpoint, storage latency {args.storage_latency:g} ms"
+        )
+        print(f"{'endpoint':<20} {'mode':<5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for mode in args.modes:
+            server = Server(mode, env, work_dir)
+            try:
+                for name, path in endpoints.items():
+                    result = run_load(server.port, path.format(**ids), args.connections, args.duration, args.warmup)
+                    results.setdefault(name, {})[mode] = result
+                    print(
+                        f"{name:<20} {mode:<5} {result['rps']:>9.1f} {result['p50_ms'] or 0:>8.1f} "
+                        f"{result['p99_ms'] or 0:>8.1f} {result['errors']:>7}"
+                    )
+            finally:
+                server.stop()
+    finally:
+        storage.shutdown()
+        teardown_databases(old_config, verbosity=0)
+
+    if set(args.modes) == set(MODES):
+        print("\nASGI vs WSGI:")
+        for name, by_mode in results.items():
+            wsgi, asgi = by_mode['wsgi'], by_mode['asgi']
+            if wsgi['rps'] and wsgi['p99_ms'] and asgi['p99_ms']:
+                print(f"  {name:<20} throughput x{asgi['rps'] / wsgi['rps']:.2f}, p99 x{asgi['p99_ms'] / wsgi['p99_ms']:.2f}")
+
+    if args.output:
+        args.output.write_text(json.dumps({
+            'vendor': connection.vendor,
+            'scale': scale.as_dict(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'cpus': os.cpu_count(),
+            'settings': {
+                'workers': args.workers, 'threads': args.threads, 'connections': args.connections,
+                'duration': args.duration, 'storage_latency_ms': args.storage_latency,
+            },
+            'endpoints': results,
+        }, indent=2) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,7 @@
+"""Settings of the servers started by benchmarks.serving: core.settings on the benchmark's throwaway database."""
+import os
+
+from core.settings import *  # noqa: F401,F403
+from core.settings import DATABASES
+
+DATABASES['default']['NAME'] = os.environ['BENCHMARK_DATABASE_NAME']
@@ -0,0 +1,318 @@
+"""
+Storage codec for TreatmentSession face charts.
+
+The canvas sends strokes as JSON: [[{"x": 12, "y": 40, "color": "#EA580C"}, ...], ...].
+Stylus input is dense and redundant, so charts are stored as:
+
+* coordinates quantized to 1/scale px (FACE_CHART_SCALE),
+* each stroke simplified with Ramer-Douglas-Peucker to within
+  FACE_CHART_TOLERANCE px of the drawn line,
+* the first point of each stroke absolute, the rest as (dx, dy) deltas,
+  packed into an int32 array with a per-chart colour palette and zlib'd,
+* optionally as a delta against the patient's previous chart: strokes that
+  are unchanged are stored as (start, length) runs copied from the base.
+
+A blob is a 7-byte header (magic, version, kind, scale, delta depth)
+followed by the body. Charts that are not in the canvas shape are stored
+as zlib'd JSON (KIND_JSON) so nothing is ever lost.
+"""
+import json
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+MAGIC = b'FC'
+VERSION = 1
+KIND_JSON = 0
+KIND_PACKED = 1
+HEADER = struct.Struct('<2sBBHB')
+
+OP_COPY = 0
+OP_LITERAL = 1
+MIXED_COLOR = -1
+
+
+class FaceChartError(ValueError):
+    pass
+
+
+def _quantize(value, scale):
+    return round(value * scale)
+
+
+def _dequantize(value, scale):
+    # Integral canvas offsets come back as ints, as the canvas sent them
+    if value % scale == 0:
+        return value // scale
+    return value / scale
+
+
+def _canvas_strokes(strokes):
+    """True if `strokes` is the canvas shape the packed format can represent."""
+    if not isinstance(strokes, list):
+        return False
+    for stroke in strokes:
+        if not isinstance(stroke, list):
+            return False
+        for point in stroke:
+            if not isinstance(point, dict) or point.keys() != {'x', 'y', 'color'}:
+                return False
+            if not isinstance(point['x'], (int, float)) or not isinstance(point['y'], (int, float)):
+                return False
+            if isinstance(point['x'], bool) or isinstance(point['y'], bool):
+                return False
+            if not isinstance(point['color'], str):
+                return False
+    return True
+
+
+def simplify(xs, ys, tolerance):
+    """
+    Ramer-Douglas-Peucker over integer coordinates; returns the indices to
+    keep (always including both endpoints). Iterative, so long strokes do
+    not hit the recursion limit.
+    """
+    n = len(xs)
+    if n < 3 or tolerance <= 0:
+        return list(range(n))
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        x0, y0 = xs[first], ys[first]
+        dx, dy = xs[last] - x0, ys[last] - y0
+        length_sq = dx * dx + dy * dy
+        worst, worst_index = -1.0, -1
+        for i in range(first + 1, last):
+            px, py = xs[i] - x0, ys[i] - y0
+            if length_sq:
+                # Squared distance to the chord's line, or to the nearer endpoint past its ends
+                t = (px * dx + py * dy) / length_sq
+                if t <= 0:
+                    dist_sq = px * px + py * py
+                elif t >= 1:
+                    ex, ey = xs[i] - xs[last], ys[i] - ys[last]
+                    dist_sq = ex * ex + ey * ey
+                else:
+                    cross = px * dy - py * dx
+                    dist_sq = cross * cross / length_sq
+            else:
+                dist_sq = px * px + py * py
+            if dist_sq > worst:
+                worst, worst_index = dist_sq, i
+        if worst > tolerance_sq:
+            keep[worst_index] = True
+            stack.append((first, worst_index))
+            stack.append((worst_index, last))
+    return [i for i in range(n) if keep[i]]
+
+
+def _stroke_key(xs, ys, colors):
+    return (tuple(xs), tuple(ys), tuple(colors))
+
+
+def _prepare(stroke, scale, tolerance):
+    """Quantize and simplify one stroke: (raw key, (xs, ys, colors) kept)."""
+    xs = [_quantize(point['x'], scale) for point in stroke]
+    ys = [_quantize(point['y'], scale) for point in stroke]
+    colors = [point['color'] for point in stroke]
+    raw_key = _stroke_key(xs, ys, colors)
+    keep = simplify(xs, ys, tolerance * scale)
+    if len(keep) != len(xs):
+        # A colour change is never simplified away
+        keep = sorted(set(keep) | {i for i in range(1, len(colors)) if colors[i] != colors[i - 1]})
+        xs, ys, colors = [xs[i] for i in keep], [ys[i] for i in keep], [colors[i] for i in keep]
+    return raw_key, (xs, ys, colors)
+
+
+def _pack_literal(strokes, palette, out):
+    out.append(OP_LITERAL)
+    out.append(len(strokes))
+    for xs, ys, colors in strokes:
+        indices = [palette.setdefault(color, len(palette)) for color in colors]
+        if indices and all(index == indices[0] for index in indices):
+            out.append(indices[0])
+            out.append(len(xs))
+        else:
+            out.append(MIXED_COLOR)
+            out.append(len(xs))
+            out.extend(indices)
+        if xs:
+            out.append(xs[0])
+            out.append(ys[0])
+            for i in range(1, len(xs)):
+                out.append(xs[i] - xs[i - 1])
+                out.append(ys[i] - ys[i - 1])
+
+
+def _to_le_bytes(values):
+    if sys.byteorder != 'little':
+        values = array('i', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le_bytes(data):
+    values = array('i')
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def encode(strokes, scale=10, tolerance=0.5, base=None, base_depth=0):
+    """
+    Encode canvas strokes. Returns (blob, stored strokes, uses_base), where
+    stored strokes is what decode() will return (quantized and simplified)
+    and uses_base says whether the blob depends on `base` (the base chart's
+    stored strokes, as returned by decode()).
+    """
+    if strokes is None:
+        return None, None, False
+    if _canvas_strokes(strokes):
+        try:
+            return _encode_packed(strokes, scale, tolerance, base, base_depth)
+        except (OverflowError, ValueError, struct.error):
+            # Coordinates outside int32 after quantizing, NaN/inf, or an oversized palette
+            pass
+    body = zlib.compress(json.dumps(strokes, separators=(',', ':')).encode())
+    return HEADER.pack(MAGIC, VERSION, KIND_JSON, scale, 0) + body, strokes, False
+
+
+def _encode_packed(strokes, scale, tolerance, base, base_depth):
+    base_index = {}
+    if base and _canvas_strokes(base):
+        for index, stroke in enumerate(base):
+            key = _stroke_key(
+                [_quantize(point['x'], scale) for point in stroke],
+                [_quantize(point['y'], scale) for point in stroke],
+                [point['color'] for point in stroke],
+            )
+            base_index.setdefault(key, index)
+
+    # ops: ('copy', start, length) runs from the base, or ('literal', [stroke, ...])
+    ops = []
+    for stroke in strokes:
+        raw_key, prepared = _prepare(stroke, scale, tolerance)
+        base_at = base_index.get(raw_key, base_index.get(_stroke_key(*prepared)))
+        if base_at is not None:
+            if ops and ops[-1][0] == 'copy' and ops[-1][1] + ops[-1][2] == base_at:
+                ops[-1] = ('copy', ops[-1][1], ops[-1][2] + 1)
+            else:
+                ops.append(('copy', base_at, 1))
+        elif ops and ops[-1][0] == 'literal':
+            ops[-1][1].append(prepared)
+        else:
+            ops.append(('literal', [prepared]))
+
+    uses_base = any(op[0] == 'copy' for op in ops)
+    palette = {}
+    values = array('i', [len(ops)])
+    for op in ops:
+        if op[0] == 'copy':
+            values.extend((OP_COPY, op[1], op[2]))
+        else:
+            _pack_literal(op[1], palette, values)
+
+    palette_json = json.dumps(list(palette), separators=(',', ':')).encode()
+    header = HEADER.pack(MAGIC, VERSION, KIND_PACKED, scale, base_depth + 1 if uses_base else 0)
+    blob = header + struct.pack('<H', len(palette_json)) + palette_json + zlib.compress(_to_le_bytes(values))
+    return blob, decode(blob, base if uses_base else None), uses_base
+
+
+def delta_depth(blob):
+    """Number of delta links below this blob (0 for a self-contained chart)."""
+    if blob is None:
+        return 0
+    return HEADER.unpack_from(bytes(blob[:HEADER.size]))[4]
+
+
+def decode(blob, base=None):
+    """Decode a blob to canvas strokes; `base` is the decoded base chart for deltas."""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    magic, version, kind, scale, depth = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise FaceChartError("Not a face chart blob")
+    if kind == KIND_JSON:
+        return json.loads(zlib.decompress(blob[HEADER.size:]))
+    if depth and base is None:
+        raise FaceChartError("Delta-encoded chart decoded without its base")
+
+    offset = HEADER.size
+    (palette_len,) = struct.unpack_from('<H', blob, offset)
+    offset += 2
+    palette = json.loads(blob[offset:offset + palette_len])
+    values = _from_le_bytes(zlib.decompress(blob[offset + palette_len:]))
+
+    strokes = []
+    pos = 1
+    for _ in range(values[0]):
+        op = values[pos]
+        if op == OP_COPY:
+            start, length = values[pos + 1], values[pos + 2]
+            strokes.extend(base[start:start + length])
+            pos += 3
+            continue
+        count = values[pos + 1]
+        pos += 2
+        for _ in range(count):
+            color_index, n = values[pos], values[pos + 1]
+            pos += 2
+            if color_index == MIXED_COLOR:
+                colors = [palette[i] for i in values[pos:pos + n]]
+                pos += n
+            else:
+                colors = [palette[color_index]] * n if n else []
+            coords = values[pos:pos + 2 * n]
+            pos += 2 * n
+            xs = accumulate(coords[0::2])
+            ys = accumulate(coords[1::2])
+            strokes.append([
+                {'x': _dequantize(x, scale), 'y': _dequantize(y, scale), 'color': color}
+                for x, y, color in zip(xs, ys, colors)
+            ])
+    return strokes
+
+
+def resolve(rows, fetch):
+    """
+    Decode many charts, including delta chains.
+
+    rows: {id: (blob, base_id)} for the charts wanted.
+    fetch(ids): returns {id: (blob, base_id)} for base charts not in `rows`;
+    called once per chain level, so a list costs at most max-depth queries.
+    Returns {id: strokes}.
+    """
+    rows = dict(rows)
+    missing = {base_id for _, base_id in rows.values() if base_id and base_id not in rows}
+    while missing:
+        fetched = fetch(missing)
+        if missing - fetched.keys():
+            raise FaceChartError(f"Face chart base(s) missing: {sorted(map(str, missing - fetched.keys()))}")
+        rows.update(fetched)
+        missing = {base_id for _, base_id in fetched.values() if base_id and base_id not in rows}
+
+    decoded = {}
+
+    def _decode(chart_id):
+        # Iterative walk down the chain, then decode back up
+        chain = []
+        while chart_id not in decoded:
+            chain.append(chart_id)
+            chart_id = rows[chart_id][1]
+            if chart_id is None:
+                break
+        for link in reversed(chain):
+            blob, base_id = rows[link]
+            decoded[link] = decode(blob, decoded[base_id] if base_id else None)
+
+    for chart_id in list(rows):
+        if chart_id not in decoded:
+            _decode(chart_id)
+    return decoded
@@ -0,0 +1,188 @@
+"""
+Bulk patient import from CSV or NDJSON, for migrating a clinic onto the system.
+
+The input is read as a stream and handled in chunks of
+PATIENT_IMPORT_CHUNK_SIZE rows. Each chunk is validated, checked against
+existing HNs with a single `hn IN (...)` query, and inserted with
+bulk_create in its own transaction, so memory stays flat whatever the
+file size and a failure loses at most one chunk.
+
+bulk_create skips model signals, so the dashboard rollup is updated here
+(one apply_deltas per day per chunk).
+"""
+import csv
+import io
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import islice
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from dashboard.rollups import apply_deltas, metric_day
+from .models import Patient
+
+FORMATS = ('csv', 'ndjson')
+REQUIRED_FIELDS = ('hn', 'first_name', 'last_name', 'phone_number')
+OPTIONAL_FIELDS = ('date_of_birth',)
+
+
+class ImportFormatError(ValueError):
+    """The file as a whole cannot be imported (unknown format, missing columns)."""
+
+
+@dataclass
+class ChunkResult:
+    rows: int = 0
+    created: int = 0
+    # [(line number, reason, raw row)], in file order
+    rejected: list = field(default_factory=list)
+
+
+def detect_format(filename, content_type=None):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if name.endswith('.csv') or content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    raise ImportFormatError("Cannot tell the file format; use a .csv or .ndjson file")
+
+
+def read_records(fileobj, fmt):
+    """
+    Iterator of (line number, dict or None, raw) over a binary file object,
+    read lazily. A None dict marks a line that is not a JSON object. The CSV
+    header is checked here, before any row is read.
+    """
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Unknown format '{fmt}'")
+    # utf-8-sig: spreadsheet exports often start with a BOM
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', errors='replace', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        missing = [name for name in REQUIRED_FIELDS if name not in (reader.fieldnames or ())]
+        if missing:
+            raise ImportFormatError(f"CSV header is missing column(s): {', '.join(missing)}")
+        return ((reader.line_num, row, row) for row in reader)
+    return _ndjson_records(text)
+
+
+def _ndjson_records(text):
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None, line.rstrip('\r\n')
+
+
+_MAX_LENGTHS = {name: Patient._meta.get_field(name).max_length for name in REQUIRED_FIELDS}
+
+
+def validate(record):
+    """Return (Patient, None) or (None, reason)."""
+    if record is None:
+        return None, "not a JSON object"
+
+    values = {}
+    for name in REQUIRED_FIELDS:
+        value = record.get(name)
+        value = '' if value is None else str(value).strip()
+        if not value:
+            return None, f"{name} is required"
+        if len(value) > _MAX_LENGTHS[name]:
+            return None, f"{name} is longer than {_MAX_LENGTHS[name]} characters"
+        values[name] = value
+
+    date_of_birth = record.get('date_of_birth')
+    date_of_birth = '' if date_of_birth is None else str(date_of_birth).strip()
+    if date_of_birth:
+        try:
+            values['date_of_birth'] = date.fromisoformat(date_of_birth)
+        except ValueError:
+            return None, "date_of_birth must be YYYY-MM-DD"
+
+    return Patient(**values), None
+
+
+def _insert(patients):
+    """bulk_create in one transaction and count the new patients on the dashboard."""
+    with db_transaction.atomic():
+        Patient.objects.bulk_create(patients, batch_size=settings.PATIENT_IMPORT_BATCH_SIZE)
+        for day, count in Counter(metric_day(patient.created_at) for patient in patients).items():
+            apply_deltas(day, new_patients=count)
+
+
+def import_chunk(records):
+    """Validate, dedupe and insert one chunk of (line number, record, raw) tuples."""
+    result = ChunkResult(rows=len(records))
+    candidates = {}  # hn -> (line number, raw, Patient); first occurrence in the file wins
+    for line_number, record, raw in records:
+        patient, reason = validate(record)
+        if patient is None:
+            result.rejected.append((line_number, reason, raw))
+        elif patient.hn in candidates:
+            result.rejected.append((line_number, f"duplicate hn {patient.hn} in file (line {candidates[patient.hn][0]})", raw))
+        else:
+            candidates[patient.hn] = (line_number, raw, patient)
+
+    for attempt in range(2):
+        existing = set(Patient.objects.filter(hn__in=list(candidates)).values_list('hn', flat=True))
+        for hn in existing:
+            line_number, raw, _ = candidates.pop(hn)
+            result.rejected.append((line_number, f"hn {hn} already exists", raw))
+        try:
+            _insert([patient for _, _, patient in candidates.values()])
+            break
+        except IntegrityError:
+            # An HN was registered concurrently between the check and the insert; check again once
+            if attempt:
+                raise
+            for _, _, patient in candidates.values():
+                patient._state.adding = True
+
+    result.created = len(candidates)
+    result.rejected.sort(key=lambda rejected: rejected[0])
+    return result
+
+
+def import_patients(records, chunk_size=None):
+    """Import an iterable of (line number, record, raw); yields a ChunkResult per chunk."""
+    chunk_size = chunk_size or settings.PATIENT_IMPORT_CHUNK_SIZE
+    records = iter(records)
+    while chunk := list(islice(records, chunk_size)):
+        yield import_chunk(chunk)
+
+
+def reject_line(line_number, reason, raw):
+    """Rejected row as a JSON-serialisable dict (for the rejected-rows stream)."""
+    return {'line': line_number, 'error': reason, 'row': raw}
+
+
+class RejectWriter:
+    """
+    Rejected-rows file in the input's format, so it can be fixed and
+    re-imported: CSV gets `line` and `error` columns in front of the patient
+    columns (the importer ignores unknown columns); NDJSON gets one
+    {"line", "error", "row"} object per line.
+    """
+
+    def __init__(self, textfile, fmt):
+        self.fmt = fmt
+        self.textfile = textfile
+        self.count = 0
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(
+                textfile, fieldnames=['line', 'error', *REQUIRED_FIELDS, *OPTIONAL_FIELDS], extrasaction='ignore'
+            )
+            self.writer.writeheader()
+
+    def write(self, line_number, reason, raw):
+        self.count += 1
+        if self.fmt == 'csv':
+            self.writer.writerow({**raw, 'line': line_number, 'error': reason})
+        else:
+            self.textfile.write(json.dumps(reject_line(line_number, reason, raw), ensure_ascii=False) + '\n')
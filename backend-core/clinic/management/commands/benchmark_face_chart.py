@@ -0,0 +1,50 @@
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from benchmarks.data import synthetic_chart
+from clinic import face_chart
+
+
+def _timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best * 1000
+
+
+class Command(BaseCommand):
+    help = "Benchmark face chart storage size and encode/decode time on synthetic canvas strokes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strokes', type=int, nargs='+', default=[10, 40, 150])
+        parser.add_argument('--points', type=int, default=150, help="Points per stroke")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--tolerance', type=float, default=settings.FACE_CHART_TOLERANCE)
+
+    def handle(self, *args, strokes, points, repeat, tolerance, **options):
+        scale = settings.FACE_CHART_SCALE
+        self.stdout.write(
+            f"{'strokes':>7} {'points':>7} {'json B':>9} {'packed B':>9} {'ratio':>6} {'kept pts':>8} "
+            f"{'delta B':>8} {'enc ms':>7} {'dec ms':>7} {'json dec ms':>11}"
+        )
+        for count in strokes:
+            chart = synthetic_chart(count, points, seed=count)
+            raw = json.dumps(chart, separators=(',', ':')).encode()
+
+            (blob, stored, _), encode_ms = _timed(
+                lambda: face_chart.encode(chart, scale=scale, tolerance=tolerance), repeat
+            )
+            _, decode_ms = _timed(lambda: face_chart.decode(blob), repeat)
+            _, json_decode_ms = _timed(lambda: json.loads(raw), repeat)
+
+            # Next visit: the previous chart plus five new strokes
+            follow_up = stored + synthetic_chart(5, points, seed=count + 1)
+            delta_blob, _, _ = face_chart.encode(follow_up, scale=scale, tolerance=tolerance, base=stored)
+
+            self.stdout.write(
+                f"{count:>7} {count * points:>7} {len(raw):>9} {len(blob):>9} {len(raw) / len(blob):>5.1f}x "
+                f"{sum(map(len, stored)):>8} {len(delta_blob):>8} {encode_ms:>7.2f} {decode_ms:>7.2f} {json_decode_ms:>11.2f}"
+            )
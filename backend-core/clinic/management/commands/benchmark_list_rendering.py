@@ -0,0 +1,79 @@
+import time
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+from clinic.models import Patient
+from clinic.views import PatientViewSet
+from commerce.models import Transaction
+from commerce.views import TransactionViewSet
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare list rendering throughput (rows/s) with and without FAST_LIST_RENDERING "
+        "on synthetic data, and check both paths produce identical bytes. Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, rows, page_size, repeat, **options):
+        try:
+            with db_transaction.atomic():
+                self._seed(rows)
+                for label, viewset, path in (
+                    ('patients', PatientViewSet, '/api/v1/clinic/patients/'),
+                    ('transactions', TransactionViewSet, '/api/v1/commerce/transactions/'),
+                ):
+                    self._compare(label, viewset.as_view({'get': 'list'}), f"{path}?page_size={page_size}", repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _seed(self, rows):
+        staff = User.objects.create_user('benchmark-staff')
+        patients = Patient.objects.bulk_create([
+            Patient(hn=f"BENCH-{i}", first_name=f"ชื่อ{i}", last_name=f"Surname{i}", phone_number=f"08{i:08d}")
+            for i in range(rows)
+        ])
+        Transaction.objects.bulk_create([
+            Transaction(patient=patients[i], staff_1=staff, total_amount=Decimal(i % 50000) + Decimal('0.50'), status='COMPLETED')
+            for i in range(rows)
+        ])
+
+    def _render(self, view, url):
+        response = view(APIRequestFactory().get(url, HTTP_HOST='localhost'))
+        response.render()
+        return response.content
+
+    def _time(self, view, url, repeat):
+        best, content = float('inf'), b''
+        for _ in range(repeat):
+            started = time.perf_counter()
+            content = self._render(view, url)
+            best = min(best, time.perf_counter() - started)
+        return best, content
+
+    def _compare(self, label, view, url, repeat):
+        with override_settings(FAST_LIST_RENDERING=False):
+            slow, slow_content = self._time(view, url, repeat)
+        with override_settings(FAST_LIST_RENDERING=True):
+            fast, fast_content = self._time(view, url, repeat)
+
+        if slow_content != fast_content:
+            raise CommandError(f"{label}: fast path output differs from the serializer output")
+
+        page_rows = slow_content.count(b'"id":')
+        self.stdout.write(
+            f"{label:<13} {page_rows} rows/page  serializer {page_rows / slow:>9,.0f} rows/s  "
+            f"fast {page_rows / fast:>9,.0f} rows/s  ({slow / fast:.1f}x, identical bytes)"
+        )
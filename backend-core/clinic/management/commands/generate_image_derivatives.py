@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from clinic.models import ClinicalImage
+from tasks.image_tasks import enqueue_image_derivatives, generate_image_derivatives
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails/WebP for clinical images that are missing some (backfill or broker outage)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true', help="Generate in this process instead of enqueueing")
+        parser.add_argument('--limit', type=int, help="Process at most this many images")
+
+    def handle(self, *args, sync, limit=None, **options):
+        expected = len(settings.IMAGE_DERIVATIVE_WIDTHS) * len(settings.IMAGE_DERIVATIVE_FORMATS)
+        image_ids = (
+            ClinicalImage.objects.annotate(derivative_count=Count('derivatives'))
+            .filter(derivative_count__lt=expected)
+            .order_by('uploaded_at', 'id')
+            .values_list('id', flat=True)
+        )
+        if limit:
+            image_ids = image_ids[:limit]
+
+        if not sync:
+            image_ids = list(image_ids)
+            enqueue_image_derivatives(image_ids)
+            self.stdout.write(self.style.SUCCESS(f"Enqueued {len(image_ids)} image(s)."))
+            return
+
+        images = generated = 0
+        for image_id in image_ids.iterator():
+            images += 1
+            try:
+                generated += generate_image_derivatives(image_id)
+            except Exception as e:
+                self.stderr.write(f"{image_id}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Generated {generated} derivative(s) for {images} image(s)."))
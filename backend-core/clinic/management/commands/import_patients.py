@@ -0,0 +1,55 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from clinic.importer import FORMATS, ImportFormatError, RejectWriter, detect_format, import_patients, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Import patients from a CSV or NDJSON file (columns hn, first_name, last_name, phone_number, "
+        "optional date_of_birth). Streams the file in chunks; rows whose HN already exists, duplicates "
+        "and invalid rows are written to a rejected-rows file in the same format."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension")
+        parser.add_argument('--chunk-size', type=int, default=settings.PATIENT_IMPORT_CHUNK_SIZE)
+        parser.add_argument('--rejects', help="Rejected-rows file (default: <path>.rejects.<format>)")
+
+    def handle(self, *args, path, format=None, chunk_size, rejects=None, **options):
+        try:
+            fmt = format or detect_format(path)
+        except ImportFormatError as e:
+            raise CommandError(f"{e} (or pass --format)")
+        rejects = rejects or f"{path}.rejects.{fmt}"
+
+        rows = created = 0
+        started = last_report = time.monotonic()
+        try:
+            with open(path, 'rb') as source, open(rejects, 'w', encoding='utf-8', newline='') as rejects_file:
+                writer = RejectWriter(rejects_file, fmt)
+                for result in import_patients(read_records(source, fmt), chunk_size=chunk_size):
+                    rows += result.rows
+                    created += result.created
+                    for rejected in result.rejected:
+                        writer.write(*rejected)
+                    if time.monotonic() - last_report >= 2:
+                        last_report = time.monotonic()
+                        self._progress(rows, created, writer.count, last_report - started)
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        self._progress(rows, created, writer.count, time.monotonic() - started)
+        if not writer.count:
+            os.remove(rejects)
+        style = self.style.WARNING if writer.count else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Imported {created} of {rows} row(s); {writer.count} rejected"
+            + (f" (see {rejects})." if writer.count else ".")
+        ))
+
+    def _progress(self, rows, created, rejected, elapsed):
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(f"{rows:>10,} rows  {created:>10,} created  {rejected:>8,} rejected  {rate:>8,.0f} rows/s")
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+# Backend-specific search indexes for clinic.search.search_patients.
+#
+# Postgres: pg_trgm GIN indexes on the name columns and varchar_pattern_ops
+# btree indexes so `LIKE 'prefix%'` on hn/phone_number can use an index.
+#
+# SQLite (dev): an external-content FTS5 table with the trigram tokenizer,
+# kept in sync by triggers. Note that a migration which makes Django rebuild
+# clinic_patient on SQLite drops these triggers; re-run this migration's
+# forward step (or `INSERT INTO clinic_patient_fts(clinic_patient_fts)
+# VALUES('rebuild')`) afterwards.
+
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS clinic_patient_hn_prefix_idx ON clinic_patient (hn varchar_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS clinic_patient_phone_prefix_idx ON clinic_patient (phone_number varchar_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS clinic_patient_first_name_trgm_idx ON clinic_patient USING gin (first_name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS clinic_patient_last_name_trgm_idx ON clinic_patient USING gin (last_name gin_trgm_ops)',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS clinic_patient_last_name_trgm_idx',
+    'DROP INDEX IF EXISTS clinic_patient_first_name_trgm_idx',
+    'DROP INDEX IF EXISTS clinic_patient_phone_prefix_idx',
+    'DROP INDEX IF EXISTS clinic_patient_hn_prefix_idx',
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS clinic_patient_fts USING fts5("
+    "first_name, last_name, content='clinic_patient', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS clinic_patient_fts_ai AFTER INSERT ON clinic_patient BEGIN "
+    "INSERT INTO clinic_patient_fts(rowid, first_name, last_name) "
+    "VALUES (new.rowid, new.first_name, new.last_name); END",
+    "CREATE TRIGGER IF NOT EXISTS clinic_patient_fts_ad AFTER DELETE ON clinic_patient BEGIN "
+    "INSERT INTO clinic_patient_fts(clinic_patient_fts, rowid, first_name, last_name) "
+    "VALUES ('delete', old.rowid, old.first_name, old.last_name); END",
+    "CREATE TRIGGER IF NOT EXISTS clinic_patient_fts_au AFTER UPDATE ON clinic_patient BEGIN "
+    "INSERT INTO clinic_patient_fts(clinic_patient_fts, rowid, first_name, last_name) "
+    "VALUES ('delete', old.rowid, old.first_name, old.last_name); "
+    "INSERT INTO clinic_patient_fts(rowid, first_name, last_name) "
+    "VALUES (new.rowid, new.first_name, new.last_name); END",
+    "INSERT INTO clinic_patient_fts(clinic_patient_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS clinic_patient_fts_au',
+    'DROP TRIGGER IF EXISTS clinic_patient_fts_ad',
+    'DROP TRIGGER IF EXISTS clinic_patient_fts_ai',
+    'DROP TABLE IF EXISTS clinic_patient_fts',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        statements = statements_by_vendor.get(schema_editor.connection.vendor, [])
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0002_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
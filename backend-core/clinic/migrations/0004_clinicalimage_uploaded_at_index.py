@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0003_patient_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clinicalimage',
+            index=models.Index(fields=['uploaded_at', 'id'], name='clinic_clin_uploade_68405e_idx'),
+        ),
+    ]
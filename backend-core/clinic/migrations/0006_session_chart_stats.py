@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def face_chart_stats(face_chart_data):
+    """(stroke count, point count) as clinic.models.face_chart_stats computed them at this migration."""
+    if not isinstance(face_chart_data, list):
+        return 0, 0
+    strokes = [stroke for stroke in face_chart_data if isinstance(stroke, list)]
+    return len(strokes), sum(len(stroke) for stroke in strokes)
+
+
+def backfill_chart_stats(apps, schema_editor):
+    TreatmentSession = apps.get_model('clinic', 'TreatmentSession')
+    sessions = TreatmentSession.objects.filter(face_chart_data__isnull=False).only('id', 'face_chart_data')
+    batch = []
+    for session in sessions.iterator(chunk_size=500):
+        session.stroke_count, session.point_count = face_chart_stats(session.face_chart_data)
+        batch.append(session)
+        if len(batch) == 500:
+            TreatmentSession.objects.bulk_update(batch, ['stroke_count', 'point_count'])
+            batch = []
+    TreatmentSession.objects.bulk_update(batch, ['stroke_count', 'point_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0005_image_derivative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treatmentsession',
+            name='point_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='treatmentsession',
+            name='stroke_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_chart_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,192 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:16
+
+import json
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# A frozen copy of the version 1 blob format from clinic.face_chart, so that
+# later codec changes cannot change what this migration writes or reads.
+# Existing charts are only quantized (scale 10), never simplified or delta-encoded.
+MAGIC = b'FC'
+VERSION = 1
+KIND_JSON = 0
+KIND_PACKED = 1
+HEADER = struct.Struct('<2sBBHB')
+OP_COPY = 0
+OP_LITERAL = 1
+MIXED_COLOR = -1
+SCALE = 10
+
+
+def _canvas_strokes(strokes):
+    if not isinstance(strokes, list):
+        return False
+    for stroke in strokes:
+        if not isinstance(stroke, list):
+            return False
+        for point in stroke:
+            if not isinstance(point, dict) or point.keys() != {'x', 'y', 'color'}:
+                return False
+            for axis in ('x', 'y'):
+                if not isinstance(point[axis], (int, float)) or isinstance(point[axis], bool):
+                    return False
+            if not isinstance(point['color'], str):
+                return False
+    return True
+
+
+def _pack(strokes):
+    palette = {}
+    values = array('i', [1 if strokes else 0])
+    if strokes:
+        values.extend((OP_LITERAL, len(strokes)))
+    for stroke in strokes:
+        xs = [round(point['x'] * SCALE) for point in stroke]
+        ys = [round(point['y'] * SCALE) for point in stroke]
+        indices = [palette.setdefault(point['color'], len(palette)) for point in stroke]
+        if indices and all(index == indices[0] for index in indices):
+            values.extend((indices[0], len(xs)))
+        else:
+            values.extend((MIXED_COLOR, len(xs)))
+            values.extend(indices)
+        if xs:
+            values.extend((xs[0], ys[0]))
+            for i in range(1, len(xs)):
+                values.extend((xs[i] - xs[i - 1], ys[i] - ys[i - 1]))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    palette_json = json.dumps(list(palette), separators=(',', ':')).encode()
+    return (
+        HEADER.pack(MAGIC, VERSION, KIND_PACKED, SCALE, 0) + struct.pack('<H', len(palette_json))
+        + palette_json + zlib.compress(values.tobytes())
+    )
+
+
+def encode(strokes):
+    if _canvas_strokes(strokes):
+        try:
+            return _pack(strokes)
+        except (OverflowError, ValueError, struct.error):
+            # Coordinates outside int32 after quantizing, NaN/inf, or an oversized palette
+            pass
+    body = zlib.compress(json.dumps(strokes, separators=(',', ':')).encode())
+    return HEADER.pack(MAGIC, VERSION, KIND_JSON, SCALE, 0) + body
+
+
+def _dequantize(value, scale):
+    if value % scale == 0:
+        return value // scale
+    return value / scale
+
+
+def decode(blob, base):
+    blob = bytes(blob)
+    _, _, kind, scale, _ = HEADER.unpack_from(blob)
+    if kind == KIND_JSON:
+        return json.loads(zlib.decompress(blob[HEADER.size:]))
+    offset = HEADER.size
+    (palette_len,) = struct.unpack_from('<H', blob, offset)
+    offset += 2
+    palette = json.loads(blob[offset:offset + palette_len])
+    values = array('i')
+    values.frombytes(zlib.decompress(blob[offset + palette_len:]))
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    strokes = []
+    pos = 1
+    for _ in range(values[0]):
+        if values[pos] == OP_COPY:
+            start, length = values[pos + 1], values[pos + 2]
+            strokes.extend(base[start:start + length])
+            pos += 3
+            continue
+        count = values[pos + 1]
+        pos += 2
+        for _ in range(count):
+            color_index, n = values[pos], values[pos + 1]
+            pos += 2
+            if color_index == MIXED_COLOR:
+                colors = [palette[i] for i in values[pos:pos + n]]
+                pos += n
+            else:
+                colors = [palette[color_index]] * n
+            coords = values[pos:pos + 2 * n]
+            pos += 2 * n
+            strokes.append([
+                {'x': _dequantize(x, scale), 'y': _dequantize(y, scale), 'color': color}
+                for x, y, color in zip(accumulate(coords[0::2]), accumulate(coords[1::2]), colors)
+            ])
+    return strokes
+
+
+def encode_charts(apps, schema_editor):
+    TreatmentSession = apps.get_model('clinic', 'TreatmentSession')
+    sessions = TreatmentSession.objects.filter(face_chart_data__isnull=False).only('id', 'face_chart_data')
+    batch = []
+    for session in sessions.iterator(chunk_size=500):
+        session.face_chart_blob = encode(session.face_chart_data)
+        batch.append(session)
+        if len(batch) == 500:
+            TreatmentSession.objects.bulk_update(batch, ['face_chart_blob'])
+            batch = []
+    TreatmentSession.objects.bulk_update(batch, ['face_chart_blob'])
+
+
+def decode_charts(apps, schema_editor):
+    TreatmentSession = apps.get_model('clinic', 'TreatmentSession')
+    rows = {
+        pk: (blob, base_id)
+        for pk, blob, base_id in TreatmentSession.objects.filter(face_chart_blob__isnull=False)
+        .values_list('id', 'face_chart_blob', 'face_chart_base_id')
+    }
+    # Charts written since may be deltas: decode each base before its dependents
+    decoded = {}
+    pending = list(rows)
+    while pending:
+        ready = [pk for pk in pending if rows[pk][1] is None or rows[pk][1] in decoded]
+        if not ready:
+            raise RuntimeError(f"Face chart bases missing for {len(pending)} session(s)")
+        for pk in ready:
+            blob, base_id = rows[pk]
+            decoded[pk] = decode(blob, decoded.get(base_id))
+        pending = [pk for pk in pending if pk not in decoded]
+
+    pks = list(decoded)
+    for start in range(0, len(pks), 500):
+        TreatmentSession.objects.bulk_update(
+            [TreatmentSession(id=pk, face_chart_data=decoded[pk]) for pk in pks[start:start + 500]],
+            ['face_chart_data'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0006_session_chart_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treatmentsession',
+            name='face_chart_base',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='face_chart_dependents', to='clinic.treatmentsession'),
+        ),
+        migrations.AddField(
+            model_name='treatmentsession',
+            name='face_chart_blob',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(encode_charts, decode_charts),
+        migrations.RemoveField(
+            model_name='treatmentsession',
+            name='face_chart_data',
+        ),
+    ]
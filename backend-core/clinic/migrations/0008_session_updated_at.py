@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0007_face_chart_codec'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treatmentsession',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
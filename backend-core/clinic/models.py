@@ -1,6 +1,8 @@
 import uuid
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction as db_transaction
 from django.contrib.auth.models import User
+from . import face_chart
 
 class Patient(models.Model):
     """
@@ -21,6 +23,8 @@ class Patient(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['first_name', 'last_name']),
+            # Keyset pagination ordering for the patient list
+            models.Index(fields=['created_at', 'id']),
         ]
 
     def __str__(self):
@@ -34,15 +38,155 @@ class TreatmentSession(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.PROTECT, related_name='sessions')
     doctor = models.ForeignKey(User, on_delete=models.PROTECT, related_name='doctor_sessions')
     date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     diagnosis_notes = models.TextField(blank=True)
     
-    # Drawing JSON data from the Canvas Frontend (EMR Module)
-    # Stores coordinates of injection points
-    face_chart_data = models.JSONField(null=True, blank=True)
+    # Drawing data from the Canvas Frontend (EMR Module): coordinates of
+    # injection points. Stored packed by clinic.face_chart (quantized,
+    # simplified, optionally a delta against face_chart_base); read and
+    # write it as JSON strokes through the face_chart_data property.
+    face_chart_blob = models.BinaryField(null=True, editable=False)
+    face_chart_base = models.ForeignKey(
+        'self', null=True, blank=True, editable=False,
+        on_delete=models.PROTECT, related_name='face_chart_dependents',
+    )
+    # Summary of the chart kept in sync by save(), so timelines can
+    # show it without loading the stroke payload
+    stroke_count = models.PositiveIntegerField(default=0, editable=False)
+    point_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination ordering, also used per patient timeline
+            models.Index(fields=['date', 'id']),
+            models.Index(fields=['patient', 'date', 'id']),
+        ]
 
     def __str__(self):
         return f"Session {self.date.date()} - {self.patient.hn}"
 
+    @property
+    def face_chart_data(self):
+        """Canvas strokes, [[{x, y, color}, ...], ...], as stored (simplified)."""
+        if '_face_chart_pending' in self.__dict__:
+            return self._face_chart_pending
+        if '_face_chart_cache' not in self.__dict__:
+            load_face_charts([self])
+        return self._face_chart_cache
+
+    @face_chart_data.setter
+    def face_chart_data(self, value):
+        # Encoded on save()
+        self._face_chart_pending = value
+        self.__dict__.pop('_face_chart_cache', None)
+
+    def save(self, *args, **kwargs):
+        if '_face_chart_pending' not in self.__dict__:
+            return super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if 'face_chart_data' not in update_fields:
+                return super().save(*args, **kwargs)
+            kwargs['update_fields'] = {*update_fields, *FACE_CHART_FIELDS} - {'face_chart_data'}
+
+        with db_transaction.atomic():
+            if not self._state.adding:
+                # Charts stored as deltas against this one must not change with it
+                self._detach_face_chart_dependents()
+            self._encode_face_chart(self.__dict__.pop('_face_chart_pending'))
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            self._detach_face_chart_dependents()
+            return super().delete(*args, **kwargs)
+
+    def _encode_face_chart(self, strokes):
+        base = self._face_chart_delta_base() if strokes and settings.FACE_CHART_DELTAS else None
+        blob, stored, uses_base = face_chart.encode(
+            strokes,
+            scale=settings.FACE_CHART_SCALE,
+            tolerance=settings.FACE_CHART_TOLERANCE,
+            base=base.face_chart_data if base else None,
+            base_depth=face_chart.delta_depth(base.face_chart_blob) if base else 0,
+        )
+        self.face_chart_blob = blob
+        self.face_chart_base = base if uses_base else None
+        self._face_chart_cache = stored
+        self.stroke_count, self.point_count = face_chart_stats(stored)
+
+    def _face_chart_delta_base(self):
+        """The patient's latest earlier chart, unless its delta chain is already at the limit."""
+        previous = TreatmentSession.objects.filter(
+            patient_id=self.patient_id, face_chart_blob__isnull=False
+        ).exclude(pk=self.pk)
+        if not self._state.adding:
+            previous = previous.filter(date__lt=self.date)
+        base = previous.order_by('-date', '-id').only('id', 'face_chart_blob', 'face_chart_base_id').first()
+        if base is None or face_chart.delta_depth(base.face_chart_blob) >= settings.FACE_CHART_MAX_DELTA_DEPTH:
+            return None
+        return base
+
+    def _detach_face_chart_dependents(self):
+        """Re-store charts that are deltas against this one as self-contained charts."""
+        dependents = list(
+            TreatmentSession.objects.filter(face_chart_base_id=self.pk)
+            .only('id', 'face_chart_blob', 'face_chart_base_id')
+        )
+        if not dependents:
+            return
+        load_face_charts(dependents)
+        for dependent in dependents:
+            # Tolerance 0: the strokes are already simplified
+            dependent.face_chart_blob, _, _ = face_chart.encode(
+                dependent._face_chart_cache, scale=settings.FACE_CHART_SCALE, tolerance=0
+            )
+            dependent.face_chart_base = None
+        TreatmentSession.objects.bulk_update(dependents, ['face_chart_blob', 'face_chart_base'])
+
+
+FACE_CHART_FIELDS = ('face_chart_blob', 'face_chart_base', 'stroke_count', 'point_count')
+
+
+def load_face_charts(sessions):
+    """
+    Decode the face charts of many sessions at once. Delta bases are
+    fetched one chain level per query, so a page of sessions costs at most
+    FACE_CHART_MAX_DELTA_DEPTH queries rather than one per session.
+    """
+    sessions = [
+        session for session in sessions
+        if '_face_chart_cache' not in session.__dict__ and '_face_chart_pending' not in session.__dict__
+    ]
+    if not sessions:
+        return
+
+    def fetch(ids):
+        return {
+            pk: (blob, base_id)
+            for pk, blob, base_id in TreatmentSession.objects.filter(pk__in=ids)
+            .values_list('id', 'face_chart_blob', 'face_chart_base_id')
+        }
+
+    # Sessions loaded with the blob deferred are fetched together, not one by one
+    deferred = fetch([s.pk for s in sessions if 'face_chart_blob' in s.get_deferred_fields()])
+    rows = {
+        s.pk: deferred[s.pk] if s.pk in deferred else (s.face_chart_blob, s.face_chart_base_id)
+        for s in sessions
+    }
+    decoded = face_chart.resolve(rows, fetch)
+    for session in sessions:
+        session._face_chart_cache = decoded[session.pk]
+
+
+def face_chart_stats(face_chart_data):
+    """(stroke count, point count) for canvas data shaped [[{x, y, color}, ...], ...]."""
+    if not isinstance(face_chart_data, list):
+        return 0, 0
+    strokes = [stroke for stroke in face_chart_data if isinstance(stroke, list)]
+    return len(strokes), sum(len(stroke) for stroke in strokes)
+
 class ClinicalImage(models.Model):
     """
     Links a high-res photo in MinIO to a treatment session.
@@ -63,5 +207,34 @@ class ClinicalImage(models.Model):
     image_type = models.CharField(max_length=20, choices=IMAGE_TYPES, default='BEFORE')
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Activity feed ordering
+            models.Index(fields=['uploaded_at', 'id']),
+        ]
+
     def __str__(self):
         return f"{self.image_type} - {self.session}"
+
+class ImageDerivative(models.Model):
+    """
+    A resized/re-encoded rendition of a ClinicalImage (thumbnail, WebP).
+    Stored next to the original, e.g. "uploads/<uuid>.jpg" ->
+    "uploads/<uuid>.w256.webp". Generated by tasks.image_tasks.
+    """
+    image = models.ForeignKey(ClinicalImage, on_delete=models.CASCADE, related_name='derivatives')
+    variant = models.CharField(max_length=50)  # e.g. "w256.webp"
+    s3_key = models.CharField(max_length=500)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    size_bytes = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'variant'], name='unique_image_variant'),
+        ]
+
+    def __str__(self):
+        return f"{self.variant} - {self.image_id}"
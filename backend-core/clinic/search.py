@@ -0,0 +1,101 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from .models import Patient
+
+# FTS5 shadow table maintained by triggers on SQLite (see migration 0003)
+SQLITE_FTS_TABLE = 'clinic_patient_fts'
+
+MIN_TRIGRAM_LENGTH = 3
+
+
+def search_patients(query, limit=20, unmasked=False):
+    """
+    Ranked patient lookup for the front desk.
+    Order of results:
+    - Exact HN match
+    - HN prefix, then phone number prefix (btree pattern indexes)
+    - Fuzzy first/last name match (pg_trgm on Postgres, FTS5 trigram on SQLite)
+    Every branch is an indexed, LIMITed query, so cost does not grow with the
+    size of the patient table.
+
+    Phone prefixes only match for `unmasked` (DOCTOR/ADMIN) callers: masked
+    roles see 081-XXX-5678, and probing prefixes would reveal the hidden
+    digits. They only match a full, exact number.
+    """
+    query = query.strip()
+    if not query:
+        return []
+
+    results = {}
+
+    def collect(patients):
+        for patient in patients:
+            if len(results) >= limit:
+                return
+            results.setdefault(patient.pk, patient)
+
+    if ' ' not in query:
+        collect(Patient.objects.filter(hn=query)[:1])
+        collect(Patient.objects.filter(hn__startswith=query).order_by('hn')[:limit])
+
+        digits = re.sub(r'\D', '', query)
+        if digits and len(digits) >= len(query) // 2:
+            if unmasked:
+                collect(Patient.objects.filter(phone_number__startswith=digits).order_by('phone_number')[:limit])
+            else:
+                collect(Patient.objects.filter(phone_number=digits).order_by('pk')[:limit])
+
+    if len(results) < limit:
+        collect(_search_names(query, limit))
+
+    return list(results.values())
+
+
+def _search_names(query, limit):
+    if len(query) < MIN_TRIGRAM_LENGTH:
+        # Too short for trigrams; fall back to a plain name prefix.
+        return Patient.objects.filter(
+            Q(first_name__istartswith=query) | Q(last_name__istartswith=query)
+        ).order_by('first_name', 'last_name')[:limit]
+
+    if connection.vendor == 'postgresql':
+        return _search_names_postgres(query, limit)
+    if connection.vendor == 'sqlite':
+        return _search_names_sqlite(query, limit)
+
+    return Patient.objects.filter(
+        Q(first_name__icontains=query) | Q(last_name__icontains=query)
+    )[:limit]
+
+
+def _search_names_postgres(query, limit):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+    from django.db.models.functions import Greatest
+
+    # `trigram_word_similar` compiles to the `%>` operator, which is served by
+    # the gin_trgm_ops indexes; the similarity annotation is only for ranking.
+    return Patient.objects.filter(
+        Q(first_name__trigram_word_similar=query) | Q(last_name__trigram_word_similar=query)
+    ).annotate(
+        rank=Greatest(
+            TrigramWordSimilarity(query, 'first_name'),
+            TrigramWordSimilarity(query, 'last_name'),
+        )
+    ).order_by('-rank')[:limit]
+
+
+def _search_names_sqlite(query, limit):
+    # OR together the query's trigrams so near-misses still match (the same
+    # idea as pg_trgm); bm25 rank puts rows sharing the most trigrams first.
+    text = query.lower()
+    trigrams = {text[i:i + 3] for i in range(len(text) - 2)}
+    match = ' OR '.join('"%s"' % t.replace('"', '""') for t in sorted(trigrams))
+
+    return Patient.objects.raw(
+        f'SELECT p.* FROM {SQLITE_FTS_TABLE} f '
+        f'JOIN clinic_patient p ON p.rowid = f.rowid '
+        f'WHERE {SQLITE_FTS_TABLE} MATCH %s ORDER BY f.rank LIMIT %s',
+        [match, limit],
+    )
@@ -1,8 +1,10 @@
+from django.conf import settings
 from rest_framework import serializers
-from core.serializers import PDPAMaskingField
-from .models import Patient, TreatmentSession, ClinicalImage
+from core.serializers import PDPAMaskingField, SparseFieldsMixin
+from core.services.storage import MAX_UPLOAD_PARTS, MinIOService
+from .models import Patient, TreatmentSession, ClinicalImage, load_face_charts
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Apply the custom masking field to the phone number
     phone_number = PDPAMaskingField()
 
@@ -19,15 +21,133 @@ class PatientSerializer(serializers.ModelSerializer):
         ]
 
 class ClinicalImageSerializer(serializers.ModelSerializer):
+    # Presigned GET URL; cached per process so lists do not re-sign every image
+    url = serializers.SerializerMethodField()
+    # Smallest rendition (WebP preferred), falling back to the original until derivatives exist
+    thumbnail_url = serializers.SerializerMethodField()
+    # All renditions, smallest first, so the client can pick the one that fits its layout
+    renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = ClinicalImage
         fields = '__all__'
 
-class TreatmentSessionSerializer(serializers.ModelSerializer):
+    def _derivatives(self, obj):
+        # .all() uses prefetch_related('images__derivatives') when the view set it up
+        return sorted(obj.derivatives.all(), key=lambda d: (d.width, d.format != 'webp', d.size_bytes))
+
+    def get_url(self, obj):
+        return MinIOService().presigned_get_url(obj.s3_key)
+
+    def get_thumbnail_url(self, obj):
+        derivatives = self._derivatives(obj)
+        key = derivatives[0].s3_key if derivatives else obj.s3_key
+        return MinIOService().presigned_get_url(key)
+
+    def get_renditions(self, obj):
+        service = MinIOService()
+        return [
+            {
+                'variant': d.variant,
+                'width': d.width,
+                'height': d.height,
+                'format': d.format,
+                'size_bytes': d.size_bytes,
+                'url': service.presigned_get_url(d.s3_key),
+            }
+            for d in self._derivatives(obj)
+        ]
+
+class TreatmentSessionBatchSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        sessions = list(data.all() if hasattr(data, 'all') else data)
+        if 'face_chart_data' in self.child.fields:
+            # Decode every chart (and delta base) on the page in a few queries
+            load_face_charts(sessions)
+        return super().to_representation(sessions)
+
+class TreatmentSessionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Full session, including the face chart strokes. Used for detail and writes."""
     images = ClinicalImageSerializer(many=True, read_only=True)
+    image_count = serializers.SerializerMethodField()
+    # Stored packed (clinic.face_chart); the API keeps the canvas JSON shape
+    face_chart_data = serializers.JSONField(required=False, allow_null=True)
 
     class Meta:
         model = TreatmentSession
-        fields = '__all__'
+        exclude = ('face_chart_blob', 'face_chart_base')
         read_only_fields = ('doctor',)
+        list_serializer_class = TreatmentSessionBatchSerializer
+
+    def get_image_count(self, obj):
+        # Annotated by the viewset; computed from the (prefetched) images otherwise
+        if hasattr(obj, 'image_count'):
+            return obj.image_count
+        return len(obj.images.all())
+
+class TreatmentSessionListSerializer(serializers.ModelSerializer):
+    """
+    Timeline entry: summary stats instead of the stroke payload and images.
+    Expects the viewset's annotations (image_count, notes_preview).
+    """
+    image_count = serializers.IntegerField(read_only=True)
+    notes_preview = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = TreatmentSession
+        fields = [
+            'id',
+            'patient',
+            'doctor',
+            'date',
+            'notes_preview',
+            'stroke_count',
+            'point_count',
+            'image_count',
+        ]
+
+
+class UploadFileSerializer(serializers.Serializer):
+    ext = serializers.RegexField(r'^[A-Za-z0-9]{1,10}$', default='jpg')
+    content_type = serializers.CharField(max_length=100, required=False)
+    size = serializers.IntegerField(min_value=0, default=0)
+
+    def validate_size(self, value):
+        limit = min(settings.UPLOAD_MAX_FILE_SIZE, settings.UPLOAD_MULTIPART_PART_SIZE * MAX_UPLOAD_PARTS)
+        if value > limit:
+            raise serializers.ValidationError(f"Files are limited to {limit} bytes")
+        return value
+
+class BatchUploadTokenSerializer(serializers.Serializer):
+    files = serializers.ListField(child=UploadFileSerializer(), min_length=1, max_length=settings.UPLOAD_BATCH_MAX_FILES)
+
+class MultipartPartsSerializer(serializers.Serializer):
+    key = serializers.CharField(max_length=500)
+    upload_id = serializers.CharField(max_length=1024)
+    part_numbers = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_UPLOAD_PARTS),
+        max_length=MAX_UPLOAD_PARTS, default=list,
+    )
+
+class UploadedPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1, max_value=MAX_UPLOAD_PARTS)
+    etag = serializers.CharField(max_length=200)
+
+class MultipartCompleteSerializer(serializers.Serializer):
+    key = serializers.CharField(max_length=500)
+    upload_id = serializers.CharField(max_length=1024)
+    abort = serializers.BooleanField(default=False)
+    parts = serializers.ListField(child=UploadedPartSerializer(), max_length=MAX_UPLOAD_PARTS, required=False)
+
+    def validate(self, attrs):
+        if not attrs['abort'] and not attrs.get('parts'):
+            raise serializers.ValidationError({'parts': "Send the uploaded parts, or abort"})
+        return attrs
+
+class ConfirmImageSerializer(serializers.Serializer):
+    key = serializers.CharField(max_length=500)
+    image_type = serializers.ChoiceField(choices=ClinicalImage.IMAGE_TYPES, default='BEFORE')
 
+class BatchConfirmSerializer(serializers.Serializer):
+    session_id = serializers.UUIDField()
+    images = serializers.ListField(child=ConfirmImageSerializer(), min_length=1, max_length=settings.UPLOAD_BATCH_MAX_FILES)
@@ -0,0 +1,9 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.response_cache import bump
+from .models import Patient
+
+
+@receiver([post_save, post_delete], sender=Patient)
+def invalidate_patient_responses(sender, instance, **kwargs):
+    bump(f'patient:{instance.pk}')
@@ -1,3 +1,476 @@
-from django.test import TestCase
+import json
+import math
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from moto import mock_aws
+from rest_framework.test import APIClient
+from commerce.models import Course, Product, Transaction, UserCourseBalance
+from core.services.storage import MinIOService, reset_storage_clients
+from dashboard.models import DailyMetric
+from . import face_chart
+from .models import ClinicalImage, ImageDerivative, Patient, TreatmentSession, load_face_charts
 
-# Create your tests here.
+
+class PatientChartQueryBudgetTest(TestCase):
+    """GET /clinic/patients/{id}/chart/ must not grow its query count with history."""
+
+    # patient, sessions (+ image counts), images, derivatives, course balances, transactions
+    QUERY_BUDGET = 6
+
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = User.objects.create_user('doctor')
+        self.product = Product.objects.create(sku='BTX', name='Botox', product_type='SERVICE', price=Decimal('100'))
+
+    def _patient_with_history(self, hn, visits):
+        patient = Patient.objects.create(hn=hn, first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+        for visit in range(visits):
+            session = TreatmentSession.objects.create(
+                patient=patient, doctor=self.doctor, diagnosis_notes=f"Visit {visit}",
+                face_chart_data=[[{'x': 10, 'y': 10, 'color': '#EA580C'}, {'x': 20, 'y': 25, 'color': '#EA580C'}]],
+            )
+            for image_type in ('BEFORE', 'AFTER'):
+                image = ClinicalImage.objects.create(session=session, s3_key=f'uploads/{session.id}-{image_type}.jpg', image_type=image_type)
+                ImageDerivative.objects.create(
+                    image=image, variant='w256.webp', s3_key=f'uploads/{image.id}.w256.webp',
+                    width=256, height=171, format='webp', size_bytes=2000,
+                )
+            course = Course.objects.create(name=f"Course {hn}-{visit}", product_included=self.product, total_sessions=5, price=Decimal('400'))
+            UserCourseBalance.objects.create(patient=patient, course=course, remaining_sessions=visit % 3)
+            Transaction.objects.create(patient=patient, staff_1=self.doctor, total_amount=Decimal('1000'), status='PENDING')
+        return patient
+
+    def _get_chart(self, patient):
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(f'/api/v1/clinic/patients/{patient.id}/chart/?sessions=50&transactions=50')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_query_count_is_independent_of_history_length(self):
+        short = self._get_chart(self._patient_with_history('HN-SHORT', 1))
+        long = self._get_chart(self._patient_with_history('HN-LONG', 30))
+
+        self.assertEqual(len(short['sessions']), 1)
+        self.assertEqual(len(long['sessions']), 30)
+        self.assertEqual(len(long['transactions']), 30)
+        # Only balances with sessions left are "active"
+        self.assertEqual(len(long['course_balances']), 20)
+
+    def test_bundle_contents(self):
+        chart = self._get_chart(self._patient_with_history('HN-1', 3))
+
+        self.assertEqual(chart['patient']['phone_number'], '081-XXX-5678')
+        session = chart['sessions'][0]
+        self.assertEqual(session['diagnosis_notes'], 'Visit 2')
+        self.assertEqual(session['image_count'], 2)
+        self.assertEqual(session['stroke_count'], 1)
+        self.assertNotIn('face_chart_data', session)
+        self.assertEqual(len(session['images'][0]['renditions']), 1)
+        self.assertEqual(chart['course_balances'][0]['course_name'], 'Course HN-1-1')
+
+    def test_unknown_patient(self):
+        response = self.client.get('/api/v1/clinic/patients/00000000-0000-0000-0000-000000000000/chart/')
+        self.assertEqual(response.status_code, 404)
+
+
+class PatientSearchTest(TestCase):
+    URL = '/api/v1/clinic/patients/search/'
+
+    def setUp(self):
+        for hn, first_name, last_name, phone in [
+            ('HN-1001', 'Malee', 'Jaiyen', '0899000001'),
+            ('HN-100', 'Somchai', 'Jaidee', '0812345678'),
+            ('HN-1002', 'Niran', 'Suk', '0812349999'),
+            ('HN-2000', 'Ploy', 'Sai', '0800000000'),
+        ]:
+            Patient.objects.create(hn=hn, first_name=first_name, last_name=last_name, phone_number=phone)
+
+    def _search(self, query, **params):
+        response = self.client.get(self.URL, {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_exact_hn_ranks_before_hn_prefix(self):
+        results = self._search('HN-100')
+        self.assertEqual([p['hn'] for p in results], ['HN-100', 'HN-1001', 'HN-1002'])
+        self.assertEqual([p['hn'] for p in self._search('HN-100', limit=2)], ['HN-100', 'HN-1001'])
+
+    def test_phone_prefix_matches_for_unmasked_roles(self):
+        with mock.patch('clinic.views.can_view_unmasked', return_value=True), \
+                mock.patch('core.serializers.can_view_unmasked', return_value=True):
+            results = self._search('081-234')
+        self.assertEqual([p['hn'] for p in results], ['HN-100', 'HN-1002'])
+        self.assertEqual([p['phone_number'] for p in results], ['0812345678', '0812349999'])
+
+    def test_masked_roles_cannot_probe_hidden_digits(self):
+        # The mask shows 081-XXX-5678; prefixes into the hidden digits must not narrow anything down
+        for prefix in ['081', '0812', '0813', '081234', '081-234', '081234567']:
+            self.assertEqual(self._search(prefix), [], prefix)
+        results = self._search('081-234-5678')
+        self.assertEqual([(p['hn'], p['phone_number']) for p in results], [('HN-100', '081-XXX-5678')])
+
+    def test_names_are_ranked_by_closeness(self):
+        results = self._search('jaide')
+        self.assertEqual(results[0]['hn'], 'HN-100')
+        self.assertNotIn('HN-2000', [p['hn'] for p in results])
+        # Below trigram length: first or last name prefix
+        self.assertEqual([p['hn'] for p in self._search('Sa')], ['HN-2000'])
+        self.assertEqual(self._search('   '), [])
+
+    def test_renamed_patient_is_found_by_the_new_name(self):
+        patient = Patient.objects.get(hn='HN-2000')
+        patient.last_name = 'Wongsawat'
+        patient.save()
+
+        self.assertEqual([p['hn'] for p in self._search('wongsawat')], ['HN-2000'])
+        self.assertEqual(self._search('Sai'), [])
+
+
+class PatientImportTest(TestCase):
+    URL = '/api/v1/clinic/patients/import/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('registrar'))
+        Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+
+    def _import(self, name, content, **kwargs):
+        upload = SimpleUploadedFile(name, content.encode())
+        response = self.client.post(self.URL, {'file': upload}, format='multipart', **kwargs)
+        return response, [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    @override_settings(PATIENT_IMPORT_CHUNK_SIZE=2)
+    def test_csv_import_dedupes_and_reports_rejected_rows(self):
+        response, events = self._import('patients.csv', (
+            "hn,first_name,last_name,phone_number,date_of_birth\n"
+            "HN-1,Existing,Patient,0800000001,\n"
+            "HN-2,Malee,Dee,0800000002,1990-01-31\n"
+            "HN-2,Again,Dee,0800000003,\n"
+            "HN-3,Bad,Date,0800000004,31/01/1990\n"
+            "HN-4,,NoFirstName,0800000005,\n"
+            "HN-5,Niran,Suk,0800000006,\n"
+        ))
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(events[-1], {'event': 'done', 'rows': 6, 'created': 2, 'rejected': 4})
+        rejected = {event['line']: event['error'] for event in events if event['event'] == 'rejected'}
+        self.assertEqual(rejected, {
+            2: 'hn HN-1 already exists',
+            # Next chunk: the first HN-2 is already committed
+            4: 'hn HN-2 already exists',
+            5: 'date_of_birth must be YYYY-MM-DD',
+            6: 'first_name is required',
+        })
+        self.assertEqual(sum(event['event'] == 'progress' for event in events), 3)
+        self.assertEqual(str(Patient.objects.get(hn='HN-2').date_of_birth), '1990-01-31')
+        # bulk_create skips signals; the importer updates the rollup itself (HN-1 + 2 imported)
+        self.assertEqual(DailyMetric.objects.get().new_patients, 3)
+
+    def test_ndjson_import(self):
+        _, events = self._import('patients.ndjson', (
+            '{"hn": "HN-9", "first_name": "Ploy", "last_name": "Sai", "phone_number": "0899999999"}\n'
+            '\n'
+            'not json\n'
+            '{"hn": "HN-9", "first_name": "Ploy", "last_name": "Sai", "phone_number": "0899999999"}\n'
+        ))
+
+        self.assertEqual(events[0], {'event': 'rejected', 'line': 3, 'error': 'not a JSON object', 'row': 'not json'})
+        self.assertEqual(events[1]['error'], 'duplicate hn HN-9 in file (line 1)')
+        self.assertEqual(events[-1], {'event': 'done', 'rows': 3, 'created': 1, 'rejected': 2})
+        self.assertTrue(Patient.objects.filter(hn='HN-9').exists())
+
+    def test_requires_authentication_and_known_columns(self):
+        response = APIClient().post(self.URL, {'file': SimpleUploadedFile('p.csv', b'hn\n')}, format='multipart')
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.post(self.URL, {'file': SimpleUploadedFile('p.csv', b'hn,first_name\nHN-7,A\n')}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('last_name', response.json()['error'])
+
+
+class AsyncEndpointTest(TestCase):
+    """Search and upload endpoints are async views (core.async_views); async_client goes through ASGI."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user('doctor')
+        self.patient = Patient.objects.create(hn='HN-100', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+        self.session = TreatmentSession.objects.create(patient=self.patient, doctor=self.doctor)
+
+    async def test_search(self):
+        response = await self.async_client.get('/api/v1/clinic/patients/search/?q=HN-10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(p['hn'], p['phone_number']) for p in response.json()['results']], [('HN-100', '081-XXX-5678')]
+        )
+        response = await self.async_client.get('/api/v1/clinic/patients/search/?q=HN&limit=many')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_upload_token(self):
+        with mock.patch('core.services.storage.MinIOService.ensure_bucket_exists', return_value=True) as check:
+            response = await self.async_client.get('/api/v1/clinic/upload-token/?ext=png')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['key'].endswith('.png'))
+        self.assertIn('X-Amz-Signature', response.json()['upload_url'])
+        self.assertEqual(check.call_count, 1)
+
+    def test_confirm_upload(self):
+        # Sync client (the view runs under async_to_sync), so the on_commit callback is captured
+        with mock.patch('clinic.views.enqueue_image_derivatives') as enqueue, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/v1/clinic/confirm-upload/', {'session_id': str(self.session.pk), 'key': 'uploads/a.jpg'},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 201)
+        image = ClinicalImage.objects.get(session=self.session)
+        self.assertEqual((response.json()['id'], image.s3_key), (str(image.pk), 'uploads/a.jpg'))
+        enqueue.assert_called_once_with([image.pk])
+
+        response = self.client.post(
+            '/api/v1/clinic/confirm-upload/', {'session_id': str(self.patient.pk), 'key': 'uploads/b.jpg'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    AWS_S3_ENDPOINT_URL='https://s3.amazonaws.com', AWS_S3_PUBLIC_ENDPOINT_URL='https://s3.amazonaws.com',
+    UPLOAD_MULTIPART_THRESHOLD=1024, UPLOAD_MULTIPART_PART_SIZE=5 * 1024 * 1024,
+)
+class UploadBatchTest(TestCase):
+    """Batch presign, multipart resume/complete and batch confirm against an in-memory S3 (moto)."""
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        reset_storage_clients()
+        self.addCleanup(reset_storage_clients)
+        self.service = MinIOService()
+        self.service.ensure_bucket_exists()
+        self.client = APIClient()
+        self.session = TreatmentSession.objects.create(
+            patient=Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678'),
+            doctor=User.objects.create_user('doctor'),
+        )
+
+    def _post(self, url, body):
+        return self.client.post(f'/api/v1/clinic/{url}/', body, format='json')
+
+    def _open_uploads(self):
+        return self.service.s3_client.list_multipart_uploads(Bucket=self.service.bucket_name).get('Uploads', [])
+
+    def test_multipart_upload_round_trip(self):
+        response = self._post('upload-tokens', {'files': [{'ext': 'png', 'size': 100}, {'size': 11 * 1024 * 1024}]})
+        self.assertEqual(response.status_code, 200)
+        single, multipart = response.json()['uploads']
+        self.assertEqual((single['multipart'], single['key'][-4:]), (False, '.png'))
+        self.assertEqual([part['part_number'] for part in multipart['parts']], [1, 2, 3])
+
+        key, upload_id = multipart['key'], multipart['upload_id']
+        part = self.service.s3_client.upload_part(
+            Bucket=self.service.bucket_name, Key=key, UploadId=upload_id, PartNumber=1, Body=b'x' * 100,
+        )
+        response = self._post('multipart-upload/parts', {'key': key, 'upload_id': upload_id, 'part_numbers': [2]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['part_number'] for p in response.json()['uploaded_parts']], [1])
+        self.assertEqual([p['part_number'] for p in response.json()['parts']], [2])
+
+        response = self._post('multipart-upload/complete', {
+            'key': key, 'upload_id': upload_id, 'parts': [{'part_number': 1, 'etag': part['ETag']}],
+        })
+        self.assertEqual(response.json(), {'key': key, 'completed': True})
+        self.assertTrue(self.service.object_exists(key))
+
+        with mock.patch('clinic.views.enqueue_image_derivatives') as enqueue, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self._post('confirm-uploads', {
+                'session_id': str(self.session.pk), 'images': [{'key': key, 'image_type': 'AFTER'}],
+            })
+        self.assertEqual(response.status_code, 201)
+        image = ClinicalImage.objects.get(session=self.session)
+        self.assertEqual((image.s3_key, image.image_type), (key, 'AFTER'))
+        enqueue.assert_called_once_with([image.pk])
+
+    def test_abort(self):
+        upload = self._post('upload-tokens', {'files': [{'size': 2048}]}).json()['uploads'][0]
+        response = self._post('multipart-upload/complete', {'key': upload['key'], 'upload_id': upload['upload_id']})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parts', response.json())
+
+        response = self._post('multipart-upload/complete', {'key': upload['key'], 'upload_id': upload['upload_id'], 'abort': True})
+        self.assertEqual(response.json(), {'key': upload['key'], 'aborted': True})
+        self.assertEqual(self._open_uploads(), [])
+
+    @override_settings(UPLOAD_MAX_FILE_SIZE=10 ** 15)
+    def test_invalid_bodies_are_rejected(self):
+        too_many_parts = 5 * 1024 * 1024 * 10000 + 1
+        for body in [
+            {'files': [{'size': too_many_parts}]},
+            {'files': ['photo.jpg']},
+            {'files': [{'ext': '../x'}]},
+            {'files': []},
+        ]:
+            self.assertEqual(self._post('upload-tokens', body).status_code, 400, body)
+        self.assertEqual(self._open_uploads(), [])
+
+        response = self._post('multipart-upload/parts', {'key': 'k', 'upload_id': 'u', 'part_numbers': [0, 'x']})
+        self.assertEqual(set(response.json()['part_numbers']), {'0', '1'})
+        for body in [
+            {'session_id': str(self.session.pk), 'images': ['uploads/a.jpg']},
+            {'session_id': str(self.session.pk), 'images': [{'key': 'uploads/a.jpg', 'image_type': 'XRAY'}]},
+            {'session_id': 'nope', 'images': [{'key': 'uploads/a.jpg'}]},
+        ]:
+            self.assertEqual(self._post('confirm-uploads', body).status_code, 400, body)
+
+    def test_confirm_requires_every_object(self):
+        self.service.put_object('uploads/a.jpg', b'jpeg', 'image/jpeg')
+        response = self._post('confirm-uploads', {
+            'session_id': str(self.session.pk), 'images': [{'key': 'uploads/a.jpg'}, {'key': 'uploads/b.jpg'}],
+        })
+        self.assertEqual((response.status_code, response.json()['missing']), (400, ['uploads/b.jpg']))
+        self.assertFalse(ClinicalImage.objects.exists())
+
+    def test_failed_batch_aborts_started_uploads(self):
+        with mock.patch.object(MinIOService, 'generate_presigned_url', return_value=(None, None)):
+            response = self._post('upload-tokens', {'files': [{'size': 2048}, {'size': 100}]})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self._open_uploads(), [])
+
+
+def _stroke(points, color='#EA580C'):
+    return [{'x': x, 'y': y, 'color': color} for x, y in points]
+
+
+def _distance_to_polyline(x, y, stroke):
+    best = float('inf')
+    for a, b in zip(stroke, stroke[1:]):
+        dx, dy = b['x'] - a['x'], b['y'] - a['y']
+        length_sq = dx * dx + dy * dy
+        t = 0 if not length_sq else max(0, min(1, ((x - a['x']) * dx + (y - a['y']) * dy) / length_sq))
+        best = min(best, math.hypot(x - a['x'] - t * dx, y - a['y'] - t * dy))
+    return best
+
+
+class FaceChartCodecTest(TestCase):
+    def test_round_trip_is_exact_to_the_quantum(self):
+        strokes = [
+            _stroke([(10, 10), (20.04, 25.55), (31.3, 40)]),
+            [{'x': 1, 'y': 2, 'color': '#000'}, {'x': 3, 'y': 4, 'color': '#FFF'}],
+            [],
+        ]
+        blob, stored, uses_base = face_chart.encode(strokes, scale=10, tolerance=0)
+        self.assertFalse(uses_base)
+        self.assertEqual(face_chart.decode(blob), stored)
+        self.assertEqual(stored[0], _stroke([(10, 10), (20, 25.6), (31.3, 40)]))
+        # Integral offsets stay ints, as the canvas sent them
+        self.assertIs(type(stored[0][0]['x']), int)
+        self.assertEqual(stored[1:], strokes[1:])
+        self.assertEqual(face_chart.decode(face_chart.encode([], tolerance=0)[0]), [])
+        self.assertEqual(face_chart.encode(None), (None, None, False))
+
+    def test_other_shapes_are_stored_as_json(self):
+        for strokes in [{'legacy': True}, [[{'x': 1, 'y': 2}]], [_stroke([(1e12, 0)])], [_stroke([(True, 0)])]]:
+            blob, stored, _ = face_chart.encode(strokes)
+            self.assertEqual(blob[3], face_chart.KIND_JSON, strokes)
+            self.assertEqual((face_chart.decode(blob), stored), (strokes, strokes))
+
+    def test_simplification_stays_within_tolerance(self):
+        points = [(i * 0.7, 50 + 20 * math.sin(i / 9) + (i % 3) * 0.13) for i in range(300)]
+        stroke = _stroke(points)
+        stroke[150]['color'] = '#000'
+        _, stored, _ = face_chart.encode([stroke], scale=10, tolerance=0.5)
+
+        simplified = stored[0]
+        self.assertLess(len(simplified), len(stroke) / 3)
+        self.assertEqual((simplified[0]['x'], simplified[-1]['y']), (0, round(points[-1][1], 1)))
+        # RDP bound, plus half a quantum on each axis
+        bound = 0.5 + math.hypot(0.05, 0.05)
+        for x, y in points:
+            self.assertLessEqual(_distance_to_polyline(x, y, simplified), bound)
+        # A colour change is never simplified away
+        self.assertEqual([point['color'] for point in simplified].count('#000'), 1)
+
+    def test_simplify_keeps_endpoints_and_corners(self):
+        xs, ys = [0, 10, 20, 30, 30, 30], [0, 0, 1, 0, 10, 20]
+        self.assertEqual(face_chart.simplify(xs, ys, tolerance=2), [0, 3, 5])
+        self.assertEqual(face_chart.simplify(xs, ys, tolerance=0), list(range(6)))
+
+    def test_delta_against_a_base(self):
+        base = [_stroke([(1, 1), (2, 2)]), _stroke([(5, 5), (6, 7)]), _stroke([(9, 9), (9, 10)])]
+        strokes = base[:2] + [_stroke([(3, 3), (4, 4)])] + base[2:]
+        blob, stored, uses_base = face_chart.encode(strokes, tolerance=0, base=base, base_depth=2)
+        self.assertTrue(uses_base)
+        self.assertEqual(face_chart.delta_depth(blob), 3)
+        self.assertEqual(face_chart.decode(blob, base), strokes)
+        self.assertEqual(stored, strokes)
+        with self.assertRaises(face_chart.FaceChartError):
+            face_chart.decode(blob)
+
+    def test_migration_blobs_decode_with_the_codec(self):
+        migration = import_module('clinic.migrations.0007_face_chart_codec')
+        for strokes in [
+            [_stroke([(10, 10), (20.04, 25.55)]), [{'x': 1, 'y': 2, 'color': '#000'}, {'x': 3, 'y': 4, 'color': '#FFF'}], []],
+            [],
+            {'legacy': True},
+            [_stroke([(1e12, 0)])],
+        ]:
+            blob = migration.encode(strokes)
+            self.assertEqual(face_chart.decode(blob), face_chart.encode(strokes, tolerance=0)[1], strokes)
+            self.assertEqual(migration.decode(blob, None), face_chart.decode(blob))
+
+
+@override_settings(FACE_CHART_DELTAS=True, FACE_CHART_MAX_DELTA_DEPTH=2)
+class FaceChartDeltaChainTest(TestCase):
+    def setUp(self):
+        doctor = User.objects.create_user('doctor')
+        self.patient = Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+        strokes = []
+        self.sessions = []
+        for visit in range(4):
+            strokes = strokes + [_stroke([(visit, 0), (visit, 10)])]
+            self.sessions.append(TreatmentSession.objects.create(patient=self.patient, doctor=doctor, face_chart_data=strokes))
+        self.charts = [session.face_chart_data for session in self.sessions]
+
+    def _reload(self):
+        sessions = {s.pk: s for s in TreatmentSession.objects.filter(patient=self.patient)}
+        return [sessions[s.pk] for s in self.sessions if s.pk in sessions]
+
+    def test_chain_is_capped_and_decodes(self):
+        sessions = self._reload()
+        self.assertEqual(
+            [(s.face_chart_base_id, face_chart.delta_depth(s.face_chart_blob)) for s in sessions],
+            [(None, 0), (sessions[0].pk, 1), (sessions[1].pk, 2), (None, 0)],
+        )
+        # The whole chain is on the page: no extra queries for bases
+        with self.assertNumQueries(0):
+            load_face_charts(sessions)
+        self.assertEqual([s.face_chart_data for s in sessions], self.charts)
+
+        # Alone, the tip costs one query per chain level
+        tip = TreatmentSession.objects.get(pk=self.sessions[2].pk)
+        with self.assertNumQueries(2):
+            self.assertEqual(tip.face_chart_data, self.charts[2])
+
+    def test_deleting_a_base_detaches_its_dependents(self):
+        TreatmentSession.objects.get(pk=self.sessions[0].pk).delete()
+        sessions = self._reload()
+        self.assertEqual(
+            [(s.face_chart_base_id, face_chart.delta_depth(s.face_chart_blob)) for s in sessions],
+            [(None, 0), (sessions[0].pk, 2), (None, 0)],
+        )
+        self.assertEqual([s.face_chart_data for s in sessions], self.charts[1:])
+
+    def test_editing_a_base_leaves_dependents_unchanged(self):
+        base = TreatmentSession.objects.get(pk=self.sessions[1].pk)
+        base.face_chart_data = [_stroke([(50, 50), (60, 60)])]
+        base.save()
+
+        sessions = self._reload()
+        self.assertIsNone(sessions[2].face_chart_base_id)
+        self.assertEqual(sessions[1].face_chart_data, [_stroke([(50, 50), (60, 60)])])
+        self.assertEqual(sessions[2].face_chart_data, self.charts[2])
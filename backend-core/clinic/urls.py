@@ -1,14 +1,23 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PatientViewSet, TreatmentSessionViewSet, UploadTokenView, ConfirmUploadView
+from .views import (
+    PatientViewSet, PatientSearchView, TreatmentSessionViewSet, UploadTokenView, ConfirmUploadView,
+    BatchUploadTokenView, MultipartUploadPartsView, MultipartUploadCompleteView, BatchConfirmUploadView,
+)
 
 router = DefaultRouter()
 router.register(r'patients', PatientViewSet)
 router.register(r'sessions', TreatmentSessionViewSet)
 
 urlpatterns = [
+    # Before the router, whose patient detail route would otherwise take "search" for an id
+    path('patients/search/', PatientSearchView.as_view(), name='patient-search'),
     path('', include(router.urls)),
     path('upload-token/', UploadTokenView.as_view(), name='upload-token'),
     path('confirm-upload/', ConfirmUploadView.as_view(), name='confirm-upload'),
+    path('upload-tokens/', BatchUploadTokenView.as_view(), name='upload-tokens'),
+    path('multipart-upload/parts/', MultipartUploadPartsView.as_view(), name='multipart-upload-parts'),
+    path('multipart-upload/complete/', MultipartUploadCompleteView.as_view(), name='multipart-upload-complete'),
+    path('confirm-uploads/', BatchConfirmUploadView.as_view(), name='confirm-uploads'),
 ]
 
@@ -1,21 +1,159 @@
-from rest_framework import viewsets, views, status
+import logging
+import uuid
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Count
+from django.db.models.functions import Substr
+from django.http import StreamingHttpResponse
+from rest_framework import parsers, permissions, viewsets, views, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from commerce.models import Transaction
+from commerce.serializers import TransactionSerializer, UserCourseBalanceSerializer
+from core.async_views import AsyncAPIView
+from core.conditional import ConditionalMixin
+from core.fast_list import FastListMixin
+from core.response_cache import cached_response
+from core.serializers import can_view_unmasked, requested_fields
 from core.services.storage import MinIOService
+from tasks.image_tasks import enqueue_image_derivatives
+from .importer import ImportFormatError, detect_format, import_patients, read_records, reject_line
 from .models import Patient, TreatmentSession, ClinicalImage
-from .serializers import PatientSerializer, TreatmentSessionSerializer, ClinicalImageSerializer
+from .search import search_patients
+from .serializers import (
+    BatchConfirmSerializer,
+    BatchUploadTokenSerializer,
+    ClinicalImageSerializer,
+    MultipartCompleteSerializer,
+    MultipartPartsSerializer,
+    PatientSerializer,
+    TreatmentSessionListSerializer,
+    TreatmentSessionSerializer,
+)
 
-class PatientViewSet(viewsets.ModelViewSet):
+logger = logging.getLogger(__name__)
+
+# Session fields in the patient chart bundle; strokes are fetched per session when opened
+CHART_SESSION_FIELDS = [
+    'id', 'date', 'doctor', 'diagnosis_notes', 'stroke_count', 'point_count', 'image_count', 'images',
+]
+
+def patient_generation(pk, **kwargs):
+    # Canonical form, matching the name the Patient signals bump
+    return f'patient:{uuid.UUID(pk)}'
+
+class PatientViewSet(ConditionalMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
+    ordering = ('-created_at', '-id')
+    etag_pdpa = True
+
+    @cached_response('patient', [patient_generation], pdpa=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(
+        detail=False, methods=['post'], url_path='import',
+        permission_classes=[permissions.IsAuthenticated], parser_classes=[parsers.MultiPartParser],
+    )
+    def bulk_import(self, request):
+        """
+        POST /clinic/patients/import/ (multipart, `file`: .csv or .ndjson)
+        Streams NDJSON back while importing: a `rejected` line per rejected
+        row, a `progress` line per chunk, then `done` with the totals.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Missing file"}, status=400)
+        try:
+            fmt = detect_format(upload.name, upload.content_type)
+            # Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are already spooled to disk
+            records = read_records(upload.file, fmt)
+        except ImportFormatError as e:
+            return Response({"error": str(e)}, status=400)
+
+        def events():
+            rows = created = rejected = 0
+            for result in import_patients(records):
+                rows += result.rows
+                created += result.created
+                rejected += len(result.rejected)
+                for line in result.rejected:
+                    yield orjson.dumps({"event": "rejected", **reject_line(*line)}) + b'\n'
+                yield orjson.dumps({"event": "progress", "rows": rows, "created": created, "rejected": rejected}) + b'\n'
+            yield orjson.dumps({"event": "done", "rows": rows, "created": created, "rejected": rejected}) + b'\n'
+
+        return StreamingHttpResponse(events(), content_type='application/x-ndjson')
+
+    @action(detail=True, methods=['get'])
+    def chart(self, request, pk=None):
+        """
+        GET /clinic/patients/{id}/chart/?sessions=10&transactions=10
+        Everything the EMR needs to open a patient, in one response and a
+        fixed number of queries (6) however long the history is.
+        """
+        try:
+            session_limit = min(max(int(request.query_params.get('sessions', 10)), 1), 50)
+            transaction_limit = min(max(int(request.query_params.get('transactions', 10)), 1), 50)
+        except ValueError:
+            return Response({"error": "sessions and transactions must be integers"}, status=400)
 
-class TreatmentSessionViewSet(viewsets.ModelViewSet):
+        patient = self.get_object()
+        sessions = (
+            patient.sessions.defer('face_chart_blob')
+            .annotate(image_count=Count('images'))
+            .prefetch_related('images__derivatives')
+            .order_by('-date', '-id')[:session_limit]
+        )
+        balances = patient.course_balances.filter(remaining_sessions__gt=0).select_related('course').order_by('purchased_date')
+        transactions = Transaction.objects.filter(patient=patient).order_by('-created_at', '-id')[:transaction_limit]
+
+        context = self.get_serializer_context()
+        return Response({
+            "patient": self.get_serializer(patient).data,
+            "sessions": TreatmentSessionSerializer(sessions, many=True, context=context, fields=CHART_SESSION_FIELDS).data,
+            "course_balances": UserCourseBalanceSerializer(balances, many=True, context=context).data,
+            "transactions": TransactionSerializer(transactions, many=True, context=context).data,
+        })
+
+# Length of the diagnosis_notes excerpt on timeline entries
+NOTES_PREVIEW_LENGTH = 200
+
+class TreatmentSessionViewSet(ConditionalMixin, viewsets.ModelViewSet):
+    """
+    The list is a lightweight timeline (TreatmentSessionListSerializer):
+    face_chart_data and diagnosis_notes are deferred and replaced by
+    summary stats. Detail returns everything. Either can be narrowed with
+    ?fields=id,date,face_chart_data, which loads only what is asked for.
+
+    Detail responses carry an ETag for If-Match on PUT/PATCH, but GETs are
+    never answered with 304: image URLs in the body are presigned and expire.
+    """
     queryset = TreatmentSession.objects.all()
     serializer_class = TreatmentSessionSerializer
+    ordering = ('-date', '-id')
+    # API field -> column holding it
+    heavy_fields = {'face_chart_data': 'face_chart_blob', 'diagnosis_notes': 'diagnosis_notes'}
+    conditional_get = False
+
+    def get_serializer_class(self):
+        if self.action == 'list' and requested_fields(self.request) is None:
+            return TreatmentSessionListSerializer
+        return TreatmentSessionSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            fields = requested_fields(self.request)
+            if fields is not None:
+                kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if not serializer.is_valid():
-            print("TreatmentSession validation errors:", serializer.errors)
+            logger.info(f"TreatmentSession validation errors: {serializer.errors}")
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
@@ -32,19 +170,60 @@ class TreatmentSessionViewSet(viewsets.ModelViewSet):
             
         serializer.save(doctor=doctor)
 
+    def get_etag_queryset(self):
+        return TreatmentSession.objects.all()
+
     def get_queryset(self):
-        queryset = TreatmentSession.objects.all()
+        queryset = TreatmentSession.objects.annotate(image_count=Count('images'))
         patient_id = self.request.query_params.get('patient')
         if patient_id:
             queryset = queryset.filter(patient_id=patient_id)
+
+        if self.request.method != 'GET':
+            return queryset.prefetch_related('images__derivatives')
+
+        fields = requested_fields(self.request)
+        if fields is None and self.action == 'list':
+            return queryset.defer(*self.heavy_fields.values()).annotate(
+                notes_preview=Substr('diagnosis_notes', 1, NOTES_PREVIEW_LENGTH)
+            )
+        if fields is None:
+            return queryset.prefetch_related('images__derivatives')
+
+        queryset = queryset.defer(*[column for name, column in self.heavy_fields.items() if name not in fields])
+        if 'images' in fields:
+            queryset = queryset.prefetch_related('images__derivatives')
         return queryset
 
-class UploadTokenView(views.APIView):
+class PatientSearchView(AsyncAPIView):
+    """
+    GET /clinic/patients/search/?q=<hn|phone|name>&limit=20
+    Small ranked result set; phone numbers stay PDPA-masked, and masked
+    roles can only find a patient by the full phone number.
+    """
+    async def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+
+        # Up to four queries plus the PDPA role lookup: one thread hop for all of them
+        data = await sync_to_async(self.search)(query, limit)
+        return Response({"results": data})
+
+    def search(self, query, limit):
+        patients = search_patients(query, limit=limit, unmasked=can_view_unmasked(self.request))
+        return PatientSerializer(patients, many=True, context={'request': self.request}).data
+
+class UploadTokenView(AsyncAPIView):
     """
     Generates a presigned URL for direct-to-MinIO uploads.
     """
-    def get(self, request):
+    async def get(self, request):
         service = MinIOService()
+        # Cached per process (AWS_S3_BUCKET_CHECK_TTL), in a thread when due; signing itself is offline
+        await service.aensure_bucket_exists()
         # Optional: get extension from query param, default to jpg
         file_extension = request.query_params.get('ext', 'jpg')
         content_type = request.query_params.get('content_type')
@@ -59,11 +238,11 @@ class UploadTokenView(views.APIView):
             "key": key
         })
 
-class ConfirmUploadView(views.APIView):
+class ConfirmUploadView(AsyncAPIView):
     """
     Links an uploaded S3 key to a Treatment Session.
     """
-    def post(self, request):
+    async def post(self, request):
         session_id = request.data.get('session_id')
         s3_key = request.data.get('key')
         image_type = request.data.get('image_type', 'BEFORE')
@@ -72,14 +251,148 @@ class ConfirmUploadView(views.APIView):
             return Response({"error": "Missing session_id or key"}, status=400)
         
         try:
-            session = TreatmentSession.objects.get(id=session_id)
-            image = ClinicalImage.objects.create(
+            session = await TreatmentSession.objects.only('id').aget(id=session_id)
+            image = await ClinicalImage.objects.acreate(
                 session=session,
                 s3_key=s3_key,
                 image_type=image_type
             )
-            return Response(ClinicalImageSerializer(image).data, status=201)
+            # Publishing to the broker and the serializer's derivative lookups block: in a thread
+            return Response(await sync_to_async(self.created)(image), status=201)
         except TreatmentSession.DoesNotExist:
             return Response({"error": "Session not found"}, status=404)
         except Exception as e:
              return Response({"error": str(e)}, status=500)
+
+    def created(self, image):
+        # Thumbnails/WebP are generated by a Celery worker once the row is committed
+        db_transaction.on_commit(lambda: enqueue_image_derivatives([image.id]))
+        return ClinicalImageSerializer(image).data
+
+
+class BatchUploadTokenView(views.APIView):
+    """
+    Presigns uploads for several files in one call.
+    Body: {"files": [{"ext": "jpg", "content_type": "image/jpeg", "size": 123456}, ...]}
+    Files above UPLOAD_MULTIPART_THRESHOLD get a multipart upload with one
+    presigned URL per part; the rest get a single PUT URL. Files above
+    UPLOAD_MAX_FILE_SIZE are rejected.
+    """
+    def post(self, request):
+        serializer = BatchUploadTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        service = MinIOService()
+        service.ensure_bucket_exists()
+
+        tokens = []
+        for spec in serializer.validated_data['files']:
+            file_extension = spec['ext']
+            content_type = spec.get('content_type')
+
+            if spec['size'] > settings.UPLOAD_MULTIPART_THRESHOLD:
+                upload = service.create_multipart_upload(spec['size'], file_extension=file_extension, content_type=content_type)
+                if upload:
+                    tokens.append({"multipart": True, **upload})
+                    continue
+            else:
+                url, key = service.generate_presigned_url(file_extension=file_extension, content_type=content_type)
+                if url:
+                    tokens.append({"multipart": False, "upload_url": url, "key": key})
+                    continue
+
+            # Nothing is returned for the batch, so uploads already started would never be completed
+            self.abort_started(service, tokens)
+            return Response({"error": "Storage service unavailable"}, status=503)
+
+        return Response({"uploads": tokens})
+
+    def abort_started(self, service, tokens):
+        for token in tokens:
+            if not token['multipart']:
+                continue
+            try:
+                service.abort_multipart_upload(token['key'], token['upload_id'])
+            except Exception as e:
+                logger.warning(f"Could not abort multipart upload {token['key']}: {e}")
+
+
+class MultipartUploadPartsView(views.APIView):
+    """
+    Resumes a multipart upload: lists the parts already stored and presigns
+    fresh URLs for the requested (failed or expired) part numbers.
+    Body: {"key": "...", "upload_id": "...", "part_numbers": [3, 5]}
+    """
+    def post(self, request):
+        serializer = MultipartPartsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        key, upload_id = serializer.validated_data['key'], serializer.validated_data['upload_id']
+
+        service = MinIOService()
+        try:
+            uploaded = service.list_uploaded_parts(key, upload_id)
+        except Exception as e:
+            return Response({"error": str(e)}, status=404)
+
+        return Response({
+            "key": key,
+            "upload_id": upload_id,
+            "uploaded_parts": uploaded,
+            "parts": service.presign_upload_parts(key, upload_id, serializer.validated_data['part_numbers']),
+        })
+
+
+class MultipartUploadCompleteView(views.APIView):
+    """
+    Assembles a multipart upload.
+    Body: {"key": "...", "upload_id": "...", "parts": [{"part_number": 1, "etag": "..."}, ...]}
+    Send {"abort": true} instead of parts to discard the upload.
+    """
+    def post(self, request):
+        serializer = MultipartCompleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        key, upload_id = data['key'], data['upload_id']
+
+        service = MinIOService()
+        try:
+            if data['abort']:
+                service.abort_multipart_upload(key, upload_id)
+                return Response({"key": key, "aborted": True})
+            service.complete_multipart_upload(key, upload_id, data['parts'])
+        except Exception as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({"key": key, "completed": True})
+
+
+class BatchConfirmUploadView(views.APIView):
+    """
+    Links several uploaded keys to one Treatment Session in a single DB transaction.
+    Body: {"session_id": "...", "images": [{"key": "...", "image_type": "BEFORE"}, ...]}
+    Every key must exist in storage; nothing is linked otherwise.
+    """
+    def post(self, request):
+        serializer = BatchConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session_id = serializer.validated_data['session_id']
+        images = serializer.validated_data['images']
+
+        if not TreatmentSession.objects.filter(id=session_id).exists():
+            return Response({"error": "Session not found"}, status=404)
+
+        try:
+            missing = MinIOService().missing_objects(image['key'] for image in images)
+        except Exception as e:
+            return Response({"error": f"Storage service unavailable: {e}"}, status=503)
+        if missing:
+            return Response({"error": "Objects not found in storage", "missing": missing}, status=400)
+
+        with db_transaction.atomic():
+            created = ClinicalImage.objects.bulk_create([
+                ClinicalImage(session_id=session_id, s3_key=image['key'], image_type=image['image_type'])
+                for image in images
+            ])
+            db_transaction.on_commit(lambda: enqueue_image_derivatives([image.id for image in created]))
+
+        return Response(ClinicalImageSerializer(created, many=True).data, status=201)
@@ -0,0 +1,108 @@
+"""
+Course balance changes: purchase, top-up and redemption.
+
+Every change is one conditional UPDATE on the balance row, e.g. for a
+redemption of n sessions:
+
+    UPDATE ... SET remaining_sessions = remaining_sessions - n
+    WHERE id = :id AND remaining_sessions >= n
+
+so two terminals redeeming the same package at once cannot both spend the
+last session, and no row is read or locked beforehand (the UPDATE holds
+its row only until the short transaction commits). A history entry with
+the resulting balance is written in the same transaction.
+"""
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import CourseBalanceEntry, UserCourseBalance
+
+
+class InsufficientSessions(Exception):
+    """A redemption asked for more sessions than a balance holds; nothing was redeemed."""
+
+    def __init__(self, shortfalls):
+        # {balance id (str): remaining sessions}
+        self.shortfalls = shortfalls
+        super().__init__(f"Not enough sessions on {len(shortfalls)} balance(s)")
+
+
+def _change(balance_id, sessions, kind, **entry):
+    """Apply a signed change to one balance; returns its unsaved history entry, or None if refused."""
+    filters = {'pk': balance_id}
+    values = {'remaining_sessions': F('remaining_sessions') + sessions}
+    if sessions < 0:
+        filters['remaining_sessions__gte'] = -sessions
+        values['last_used_date'] = timezone.now()
+    if not UserCourseBalance.objects.filter(**filters).update(**values):
+        return None
+    # Our UPDATE holds the row until commit, so this reads our own result
+    remaining = UserCourseBalance.objects.filter(pk=balance_id).values_list('remaining_sessions', flat=True).get()
+    return CourseBalanceEntry(balance_id=balance_id, kind=kind, sessions=sessions, remaining_after=remaining, **entry)
+
+
+def redeem_many(redemptions, staff=None, treatment_session=None, note=''):
+    """
+    Redeem [(balance id, sessions)] all-or-nothing (a group booking).
+    Raises InsufficientSessions, rolling everything back, if any balance
+    falls short, or UserCourseBalance.DoesNotExist if one does not exist.
+    Returns the history entries, in balance id order.
+    """
+    totals = {}
+    for balance_id, sessions in redemptions:
+        totals[str(balance_id)] = totals.get(str(balance_id), 0) + sessions
+
+    with db_transaction.atomic():
+        entries, refused = [], []
+        # Sorted so concurrent group bookings update shared rows in the same order
+        for balance_id, sessions in sorted(totals.items()):
+            entry = _change(
+                balance_id, -sessions, 'REDEEM', staff=staff, treatment_session=treatment_session, note=note
+            )
+            if entry is None:
+                refused.append(balance_id)
+            else:
+                entries.append(entry)
+        if refused:
+            remaining = {
+                str(pk): count
+                for pk, count in UserCourseBalance.objects.filter(pk__in=refused).values_list('id', 'remaining_sessions')
+            }
+            missing = [balance_id for balance_id in refused if balance_id not in remaining]
+            if missing:
+                raise UserCourseBalance.DoesNotExist(missing[0])
+            raise InsufficientSessions({balance_id: remaining[balance_id] for balance_id in refused})
+        CourseBalanceEntry.objects.bulk_create(entries)
+    return entries
+
+
+def redeem(balance_id, sessions=1, **kwargs):
+    """Redeem sessions from one balance; see redeem_many."""
+    return redeem_many([(balance_id, sessions)], **kwargs)[0]
+
+
+def top_up(balance_id, sessions, staff=None, note=''):
+    """Add sessions to an existing balance. Raises UserCourseBalance.DoesNotExist."""
+    with db_transaction.atomic():
+        entry = _change(balance_id, sessions, 'TOP_UP', staff=staff, note=note)
+        if entry is None:
+            raise UserCourseBalance.DoesNotExist(balance_id)
+        entry.save()
+    return entry
+
+
+def purchase(patient_id, course, quantity=1, staff=None, transaction=None, note=''):
+    """
+    Credit `quantity` packages of `course` to the patient, creating the
+    balance on first purchase. Returns the history entry.
+    """
+    with db_transaction.atomic():
+        UserCourseBalance.objects.bulk_create(
+            [UserCourseBalance(patient_id=patient_id, course=course, remaining_sessions=0)], ignore_conflicts=True
+        )
+        balance_id = UserCourseBalance.objects.filter(patient_id=patient_id, course=course).values_list('id', flat=True).get()
+        entry = _change(
+            balance_id, course.total_sessions * quantity, 'PURCHASE', staff=staff, transaction=transaction, note=note
+        )
+        entry.save()
+    return entry
@@ -0,0 +1,87 @@
+"""
+Checkout: a whole sale in one request and one DB transaction.
+
+The cart is priced from one query per catalogue (products, courses), the
+transaction and its lines are inserted with a single bulk_create, and
+course lines are credited to the patient's balances (commerce.balances).
+Commission is queued through the CommissionOutbox row written by the
+Transaction post_save signal, so it is only dispatched once the sale
+commits.
+"""
+from django.db import transaction as db_transaction
+from clinic.models import Patient
+from . import balances
+from .models import Course, Product, Transaction, TransactionLine
+
+
+class CheckoutError(ValueError):
+    """The cart or patient cannot be checked out; `errors` is keyed like a validation error."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(str(errors))
+
+
+def resolve_patient(reference):
+    """
+    A patient id, or {"hn": ...}: the patient with that HN, registered on
+    the spot (walk-in) when first_name, last_name and phone_number are given.
+    """
+    if not isinstance(reference, dict):
+        try:
+            return Patient.objects.get(pk=reference)
+        except Patient.DoesNotExist:
+            raise CheckoutError({"patient": "Patient not found"})
+
+    details = {name: reference[name] for name in ('first_name', 'last_name', 'phone_number') if reference.get(name)}
+    if len(details) == 3:
+        return Patient.objects.get_or_create(hn=reference['hn'], defaults=details)[0]
+    try:
+        return Patient.objects.get(hn=reference['hn'])
+    except Patient.DoesNotExist:
+        raise CheckoutError({"patient": "No patient with this HN; send first_name, last_name and phone_number to register one"})
+
+
+def price_lines(items):
+    """
+    Unsaved TransactionLines for [{"product" or "course": id, "quantity": n}],
+    priced from the current catalogue. Unknown or inactive items raise CheckoutError.
+    """
+    products = Product.objects.filter(is_active=True).in_bulk({item['product'] for item in items if item.get('product')})
+    courses = Course.objects.in_bulk({item['course'] for item in items if item.get('course')})
+
+    lines, errors = [], []
+    for index, item in enumerate(items):
+        kind = 'product' if item.get('product') else 'course'
+        catalogued = (products if kind == 'product' else courses).get(item[kind])
+        if catalogued is None:
+            errors.append(f"items[{index}]: {kind} not found or inactive")
+            continue
+        lines.append(TransactionLine(
+            **{kind: catalogued}, name=catalogued.name, quantity=item['quantity'],
+            unit_price=catalogued.price, line_total=catalogued.price * item['quantity'],
+        ))
+    if errors:
+        raise CheckoutError({"items": errors})
+    return lines
+
+
+def checkout(patient, items, staff_1, staff_2=None):
+    """
+    Record a completed sale of `items` to `patient`. Returns
+    (transaction, lines, course balance entries).
+    """
+    lines = price_lines(items)
+    with db_transaction.atomic():
+        transaction = Transaction.objects.create(
+            patient=patient, staff_1=staff_1, staff_2=staff_2,
+            total_amount=sum(line.line_total for line in lines), status='COMPLETED',
+        )
+        for line in lines:
+            line.transaction = transaction
+        TransactionLine.objects.bulk_create(lines)
+        entries = [
+            balances.purchase(patient.pk, line.course, line.quantity, staff=staff_1, transaction=transaction)
+            for line in lines if line.course is not None
+        ]
+    return transaction, lines, entries
@@ -0,0 +1,136 @@
+from bisect import bisect_left
+from decimal import Decimal
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from .models import CommissionRuleSet, TransactionLine
+
+# Fixed-point scales: money in satang (1/100), rates and shares in ppm (1/1,000,000)
+CENTS = 100
+PPM = 1_000_000
+
+
+def _to_cents(value):
+    return int((Decimal(value) * CENTS).to_integral_value())
+
+
+def _to_ppm(value):
+    return int((Decimal(value) * PPM).to_integral_value())
+
+
+def _round_ppm(value):
+    """Round a (cents * ppm) product back to cents, half-up, in integers."""
+    return (value + PPM // 2) // PPM
+
+
+def _cents_str(cents):
+    return str(Decimal(cents).scaleb(-2))
+
+
+class CommissionEngine:
+    """
+    Evaluates one CommissionRuleSet over a whole batch of transactions.
+
+    Amounts are converted to integer satang once, tiers are resolved with a
+    binary search over integer thresholds, and pools/splits are computed in
+    integer ppm arithmetic with half-up rounding. Results are exact to the
+    satang (the two split amounts always sum to the pool) and identical on
+    every run, unlike the previous float math. With product type rates, the
+    pool is the sum of each part's amount times its rate, rounded once.
+    """
+
+    def __init__(self, rule_set):
+        tiers = sorted(rule_set.tiers, key=lambda tier: Decimal(tier['above']))
+        self.version = rule_set.version
+        self.thresholds = [_to_cents(tier['above']) for tier in tiers]
+        self.rates = [_to_ppm(tier['rate']) for tier in tiers]
+        self.rate_labels = [str(Decimal(tier['rate'])) for tier in tiers]
+        self.rules = [tier['rule'] for tier in tiers]
+        self.primary_split = _to_ppm(rule_set.primary_split)
+        self.type_rates = {
+            product_type: _to_ppm(rate) for product_type, rate in (rule_set.product_type_rates or {}).items()
+        }
+        self.type_rate_labels = {
+            product_type: str(Decimal(rate)) for product_type, rate in (rule_set.product_type_rates or {}).items()
+        }
+
+    @property
+    def uses_lines(self):
+        """Whether evaluate() needs the sales' line amounts (see line_amounts)."""
+        return bool(self.type_rates)
+
+    def evaluate(self, rows, lines=None):
+        """
+        rows: iterable of (transaction_id, total_amount, staff_1_id, staff_2_id).
+        lines: {transaction_id: {product_type: amount}} when the rules have
+        product type rates; sales without lines earn the tier rate throughout.
+        Returns a list of dicts ready for CommissionLog(**row).
+        """
+        thresholds, rates, primary_split, type_rates = self.thresholds, self.rates, self.primary_split, self.type_rates
+        lines = lines or {}
+        results = []
+        for transaction_id, total_amount, staff_1_id, staff_2_id in rows:
+            # The same person in both slots is a single-staff sale (one log per transaction and staff)
+            staff_ids = [staff_id for staff_id in dict.fromkeys((staff_1_id, staff_2_id)) if staff_id]
+            if not staff_ids:
+                continue
+
+            amount = _to_cents(total_amount)
+            tier = max(bisect_left(thresholds, amount) - 1, 0)
+            # (cents * ppm) parts, rounded to satang once
+            weighted = 0
+            rest = amount
+            by_type = {}
+            for product_type, line_amount in lines.get(transaction_id, {}).items():
+                if product_type in type_rates:
+                    cents = _to_cents(line_amount)
+                    weighted += cents * type_rates[product_type]
+                    rest -= cents
+                    by_type[product_type] = {"amount": _cents_str(cents), "rate": self.type_rate_labels[product_type]}
+            pool = _round_ppm(weighted + max(rest, 0) * rates[tier])
+
+            if len(staff_ids) == 2:
+                primary = _round_ppm(pool * primary_split)
+                shares = [(staff_ids[0], primary, primary_split), (staff_ids[1], pool - primary, PPM - primary_split)]
+            else:
+                shares = [(staff_ids[0], pool, PPM)]
+
+            details = {
+                "rules_version": self.version,
+                "rule": self.rules[tier],
+                "rate": self.rate_labels[tier],
+                "total_txn_amount": _cents_str(amount),
+                "total_commission_pool": _cents_str(pool),
+                "split_count": len(staff_ids),
+            }
+            if by_type:
+                details["product_type_rates"] = by_type
+            for staff_id, cents, share in shares:
+                results.append({
+                    'transaction_id': transaction_id,
+                    'staff_id': staff_id,
+                    'amount': Decimal(cents).scaleb(-2),
+                    'calculation_details': {**details, "share": str(Decimal(share) / PPM)},
+                })
+        return results
+
+
+def line_amounts(transaction_ids):
+    """
+    {transaction_id: {product_type: amount}} of the sales' TransactionLines,
+    in one grouped query. A course line counts as its product's type.
+    """
+    amounts = {}
+    rows = TransactionLine.objects.filter(transaction_id__in=transaction_ids).values_list(
+        'transaction_id', Coalesce('product__product_type', 'course__product_included__product_type'),
+    ).annotate(amount=Sum('line_total')).order_by()
+    for transaction_id, product_type, amount in rows:
+        amounts.setdefault(transaction_id, {})[product_type] = amount
+    return amounts
+
+
+def load_engine(version=None):
+    """Engine for a specific rules version, or the latest active one."""
+    rule_sets = CommissionRuleSet.objects.all()
+    if version is not None:
+        return CommissionEngine(rule_sets.get(version=version))
+    return CommissionEngine(rule_sets.filter(is_active=True).latest('version'))
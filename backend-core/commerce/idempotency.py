@@ -0,0 +1,57 @@
+"""
+Idempotency-Key support for unsafe endpoints (POST /commerce/checkout/).
+
+The first request with a given key claims it by inserting an IdempotencyKey
+row in the same DB transaction as its work, then stores its response
+there. A retry with the same key (per user and endpoint) gets the stored
+response back without running again; on Postgres, a retry that arrives
+while the first request is still running waits on the unique index and
+then replays. If the work fails, the claim rolls back with it and a retry
+runs normally.
+"""
+import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction as db_transaction
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def request_digest(data):
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotent(request, scope, execute):
+    """
+    Run `execute()` -> (data, status) in a DB transaction and return it as a
+    Response, at most once per Idempotency-Key header when one is sent.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        with db_transaction.atomic():
+            data, status = execute()
+        return Response(data, status=status)
+    if len(key) > MAX_KEY_LENGTH:
+        return Response({"error": f"{HEADER} is longer than {MAX_KEY_LENGTH} characters"}, status=400)
+
+    digest = request_digest(request.data)
+    with db_transaction.atomic():
+        try:
+            with db_transaction.atomic():
+                record = IdempotencyKey.objects.create(user=request.user, scope=scope, key=key, request_digest=digest)
+        except IntegrityError:
+            record = None
+        if record is not None:
+            data, status = execute()
+            record.status_code, record.response = status, data
+            record.save(update_fields=['status_code', 'response'])
+            return Response(data, status=status)
+
+    record = IdempotencyKey.objects.get(user=request.user, scope=scope, key=key)
+    if record.request_digest != digest:
+        return Response({"error": f"{HEADER} was already used with a different request"}, status=422)
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
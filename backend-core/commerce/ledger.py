@@ -0,0 +1,101 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+from .models import CommissionLog, StaffCommissionLedger, Transaction
+
+
+def payroll_period(value):
+    """First day of the payroll month containing the timestamp `value`."""
+    return timezone.localtime(value).date().replace(day=1)
+
+
+def _post(entries, sign):
+    """
+    Add (staff_id, period, amount) entries to the ledger, times `sign`:
+    totalled per (staff, period) first, then one INSERT ... ON CONFLICT DO
+    UPDATE for all of them (Postgres and SQLite both support it).
+    """
+    totals = defaultdict(lambda: [Decimal('0'), 0])
+    for staff_id, period, amount in entries:
+        total = totals[(staff_id, period)]
+        total[0] += amount
+        total[1] += 1
+    if not totals:
+        return
+
+    table = connection.ops.quote_name(StaffCommissionLedger._meta.db_table)
+    params = []
+    # Sorted so concurrent writers lock ledger rows in the same order
+    for (staff_id, period), (amount, count) in sorted(totals.items()):
+        params += [staff_id, period, sign * amount, sign * count]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (staff_id, period, amount, log_count) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(totals))} "
+            f"ON CONFLICT (staff_id, period) DO UPDATE SET "
+            f"amount = {table}.amount + EXCLUDED.amount, log_count = {table}.log_count + EXCLUDED.log_count",
+            params,
+        )
+
+
+def write_commission_logs(logs):
+    """
+    bulk_create `logs` and add them to the ledger in the same DB transaction.
+    Each log must have `period` set. Returns the logs actually written.
+
+    Safe to call for a transaction that is being (or has been) calculated
+    elsewhere: the sales are locked first, (transaction, staff) pairs that
+    already have an active log are skipped, and only the logs written here
+    reach the ledger. Voided logs of a sale completed again are replaced.
+    """
+    if not logs:
+        return []
+    transaction_ids = sorted({str(log.transaction_id) for log in logs})
+    with db_transaction.atomic():
+        # Concurrent writers of the same sale serialise here
+        list(Transaction.objects.select_for_update().filter(id__in=transaction_ids).order_by('id').values_list('id'))
+        active, voided = set(), set()
+        for transaction_id, staff_id, voided_at in CommissionLog.objects.filter(
+            transaction_id__in=transaction_ids
+        ).values_list('transaction_id', 'staff_id', 'voided_at'):
+            (active if voided_at is None else voided).add((str(transaction_id), staff_id))
+        if voided:
+            # Already out of the ledger; they would block the new logs' unique (transaction, staff)
+            CommissionLog.objects.filter(
+                transaction_id__in={transaction_id for transaction_id, _ in voided}, voided_at__isnull=False
+            ).delete()
+        new = [log for log in logs if (str(log.transaction_id), log.staff_id) not in active]
+        # The unique (transaction, staff) constraint still backs this up
+        CommissionLog.objects.bulk_create(new, batch_size=1000, ignore_conflicts=True)
+        _post(((log.staff_id, log.period, log.amount) for log in new), sign=1)
+        return new
+
+
+def void_commission_logs(queryset):
+    """
+    Mark the active logs in `queryset` voided and take them out of the ledger.
+    Returns the number of logs voided.
+    """
+    with db_transaction.atomic():
+        active = list(
+            queryset.filter(voided_at__isnull=True).select_for_update()
+            .values_list('id', 'staff_id', 'period', 'amount')
+        )
+        if not active:
+            return 0
+        CommissionLog.objects.filter(id__in=[row[0] for row in active]).update(voided_at=timezone.now())
+        _post((row[1:] for row in active), sign=-1)
+        return len(active)
+
+
+def delete_commission_logs(queryset):
+    """Delete the logs in `queryset`, removing active ones from the ledger."""
+    with db_transaction.atomic():
+        active = list(
+            queryset.filter(voided_at__isnull=True).select_for_update()
+            .values_list('staff_id', 'period', 'amount')
+        )
+        deleted, _ = queryset.delete()
+        _post(active, sign=-1)
+        return deleted
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from tasks.commission_tasks import dispatch_commission_outbox, OUTBOX_BATCH_SIZE, COMMISSION_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Drain the commission outbox once (normally run by Celery beat)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--chunk-size', type=int, default=COMMISSION_CHUNK_SIZE)
+
+    def handle(self, *args, batch_size, chunk_size, **options):
+        dispatched = dispatch_commission_outbox(batch_size=batch_size, chunk_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(f"Dispatched {dispatched} transaction(s)."))
@@ -0,0 +1,129 @@
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Count, Sum
+from django.test.utils import setup_databases, teardown_databases
+from clinic.models import Patient
+from commerce import balances
+from commerce.models import Course, CourseBalanceEntry, Product, UserCourseBalance
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency stress test of course balance redemption in a throwaway test database: "
+        "worker threads redeem the same few balances at once, asking for more sessions than exist, "
+        "then every balance is checked against its successful redemptions and history. "
+        "Meaningful on Postgres (POSTGRES_DB); SQLite serializes all writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help="Concurrent threads, one DB connection each")
+        parser.add_argument('--balances', dest='balance_count', type=int, default=4, help="Balances contended for")
+        parser.add_argument('--sessions', type=int, default=500, help="Sessions on each balance")
+        parser.add_argument('--group', type=int, default=1, help="Balances per redemption (batch redeem when > 1)")
+        parser.add_argument('--overdraw', type=float, default=1.25, help="Attempted / available sessions")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, workers, balance_count, sessions, group, overdraw, seed, **options):
+        if not 1 <= group <= balance_count:
+            raise CommandError("--group must be between 1 and --balances")
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite':
+            # Threads need a database file (with a busy timeout) rather than the in-memory test database
+            test_settings['NAME'] = os.path.join(tempfile.mkdtemp(), 'stress.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self._run(workers, balance_count, sessions, group, overdraw, seed)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def _run(self, workers, balance_count, sessions, group, overdraw, seed):
+        product = Product.objects.create(sku='STRESS', name='Stress', product_type='SERVICE', price=Decimal('1000'))
+        course = Course.objects.create(name='Stress course', product_included=product, total_sessions=sessions, price=Decimal('1000'))
+        patients = Patient.objects.bulk_create([
+            Patient(hn=f'STRESS-{n}', first_name='Stress', last_name=str(n), phone_number='0800000000')
+            for n in range(balance_count)
+        ])
+        balance_ids = [str(balances.purchase(patient.pk, course).balance_id) for patient in patients]
+
+        attempts = int(balance_count * sessions * overdraw / group / workers) + 1
+        redeemed, refused, errors, latencies = Counter(), [0], [], []
+        lock = threading.Lock()
+        start = threading.Barrier(workers + 1)
+
+        def worker(number):
+            rng = random.Random(seed * 1000 + number)
+            mine, my_refused, my_latencies = Counter(), 0, []
+            try:
+                start.wait()
+                for _ in range(attempts):
+                    chosen = rng.sample(balance_ids, group)
+                    started = time.perf_counter()
+                    try:
+                        balances.redeem_many([(balance_id, 1) for balance_id in chosen])
+                        mine.update(chosen)
+                    except balances.InsufficientSessions:
+                        my_refused += 1
+                    except OperationalError as e:
+                        errors.append(str(e))
+                    my_latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+                with lock:
+                    redeemed.update(mine)
+                    refused[0] += my_refused
+                    latencies.extend(my_latencies)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        problems = self._check(balance_ids, sessions, redeemed)
+        successes = sum(redeemed.values()) // group
+        latencies.sort()
+        self.stdout.write(
+            f"{connection.vendor}: {workers} workers, {balance_count} balances x {sessions} sessions, group {group}\n"
+            f"{successes:,} redemptions ({sum(redeemed.values()):,} sessions), {refused[0]:,} refused, "
+            f"{len(errors)} errors in {elapsed:.2f}s: {successes / elapsed:,.0f} redemptions/s, "
+            f"latency p50 {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms"
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f"First error: {errors[0]}"))
+        if problems:
+            raise CommandError("Balance invariants violated:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No lost updates or negative balances."))
+
+    def _check(self, balance_ids, sessions, redeemed):
+        problems = []
+        remaining = {str(pk): count for pk, count in UserCourseBalance.objects.values_list('id', 'remaining_sessions')}
+        history = {
+            str(row['balance_id']): row
+            for row in CourseBalanceEntry.objects.filter(kind='REDEEM').values('balance_id')
+            .annotate(count=Count('id'), sessions=Sum('sessions'), distinct_after=Count('remaining_after', distinct=True))
+        }
+        for balance_id in balance_ids:
+            expected = sessions - redeemed[balance_id]
+            entries = history.get(balance_id, {'count': 0, 'sessions': 0, 'distinct_after': 0})
+            if remaining[balance_id] != expected:
+                problems.append(f"{balance_id}: {remaining[balance_id]} remaining, expected {expected}")
+            if remaining[balance_id] < 0:
+                problems.append(f"{balance_id}: negative balance")
+            if entries['count'] != redeemed[balance_id] or -(entries['sessions'] or 0) != redeemed[balance_id]:
+                problems.append(f"{balance_id}: {entries['count']} history entries for {redeemed[balance_id]} redemptions")
+            # Each redemption saw a different resulting balance: none was applied twice to the same value
+            if entries['distinct_after'] != entries['count']:
+                problems.append(f"{balance_id}: duplicate remaining_after in history")
+        return problems
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:57
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('clinic', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('sku', models.CharField(max_length=50, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('product_type', models.CharField(choices=[('SERVICE', 'Service (Laser, Facial)'), ('DRUG', 'Drug (Botox, Filler)'), ('RETAIL', 'Retail Product')], max_length=20)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Course',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('total_sessions', models.PositiveIntegerField(default=1)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('product_included', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='courses_defined', to='commerce.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('COMPLETED', 'Completed'), ('VOID', 'Voided')], default='PENDING', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='clinic.patient')),
+                ('staff_1', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='primary_sales', to=settings.AUTH_USER_MODEL)),
+                ('staff_2', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='secondary_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CommissionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('calculation_details', models.JSONField(help_text='Snapshots the formula used')),
+                ('calculated_at', models.DateTimeField(auto_now_add=True)),
+                ('staff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='commission_log', to='commerce.transaction')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserCourseBalance',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('remaining_sessions', models.PositiveIntegerField()),
+                ('purchased_date', models.DateTimeField(auto_now_add=True)),
+                ('last_used_date', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='commerce.course')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='course_balances', to='clinic.patient')),
+            ],
+            options={
+                'unique_together': {('patient', 'course')},
+            },
+        ),
+    ]
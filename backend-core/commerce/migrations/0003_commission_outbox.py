@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0002_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='commissionlog',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commission_logs', to='commerce.transaction'),
+        ),
+        migrations.AddConstraint(
+            model_name='commissionlog',
+            constraint=models.UniqueConstraint(fields=('transaction', 'staff'), name='unique_commission_per_staff'),
+        ),
+        migrations.AddField(
+            model_name='commissionoutbox',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='commerce.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='commissionoutbox',
+            index=models.Index(fields=['dispatched_at', 'id'], name='commerce_co_dispatc_b53208_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='commissionoutbox',
+            constraint=models.UniqueConstraint(condition=models.Q(('dispatched_at__isnull', True)), fields=('transaction',), name='unique_pending_commission_outbox'),
+        ),
+    ]
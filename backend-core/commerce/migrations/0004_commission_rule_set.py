@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:02
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def create_standard_rules(apps, schema_editor):
+    # Version 1 reproduces the original hard-coded rules.
+    CommissionRuleSet = apps.get_model('commerce', 'CommissionRuleSet')
+    CommissionRuleSet.objects.get_or_create(version=1, defaults={
+        'name': 'Standard tiers',
+        'tiers': [
+            {'above': '0', 'rate': '0.05', 'rule': 'Standard Value (<=100k)'},
+            {'above': '100000.00', 'rate': '0.10', 'rule': 'High Value (>100k)'},
+        ],
+        'primary_split': Decimal('0.5'),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0003_commission_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionRuleSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('tiers', models.JSONField()),
+                ('primary_split', models.DecimalField(decimal_places=4, default=Decimal('0.5'), max_digits=5)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(create_standard_rules, migrations.RunPython.noop),
+    ]
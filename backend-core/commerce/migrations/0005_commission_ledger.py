@@ -0,0 +1,78 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+
+def backfill_periods_and_ledger(apps, schema_editor):
+    CommissionLog = apps.get_model('commerce', 'CommissionLog')
+    StaffCommissionLedger = apps.get_model('commerce', 'StaffCommissionLedger')
+
+    logs = CommissionLog.objects.select_related('transaction').only('id', 'transaction__created_at')
+    for log in logs.iterator(chunk_size=2000):
+        log.period = timezone.localtime(log.transaction.created_at).date().replace(day=1)
+        log.save(update_fields=['period'])
+
+    totals = CommissionLog.objects.values('staff_id', 'period').annotate(
+        total=Sum('amount'), count=Count('id'),
+    ).order_by()
+    StaffCommissionLedger.objects.bulk_create([
+        StaffCommissionLedger(staff_id=row['staff_id'], period=row['period'], amount=row['total'], log_count=row['count'])
+        for row in totals
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0004_commission_rule_set'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffCommissionLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('log_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='commissionlog',
+            name='period',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='commissionlog',
+            name='voided_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='commissionlog',
+            index=models.Index(fields=['staff', 'period', 'id'], name='commerce_co_staff_i_7fe566_idx'),
+        ),
+        migrations.AddField(
+            model_name='staffcommissionledger',
+            name='staff',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commission_ledger', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='staffcommissionledger',
+            index=models.Index(fields=['period', 'staff'], name='commerce_st_period_3b2a75_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='staffcommissionledger',
+            constraint=models.UniqueConstraint(fields=('staff', 'period'), name='unique_ledger_staff_period'),
+        ),
+        migrations.RunPython(backfill_periods_and_ledger, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='commissionlog',
+            name='period',
+            field=models.DateField(),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0007_face_chart_codec'),
+        ('commerce', '0005_commission_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['patient', 'created_at', 'id'], name='commerce_tr_patient_3687ca_idx'),
+        ),
+    ]
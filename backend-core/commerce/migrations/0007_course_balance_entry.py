@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0007_face_chart_codec'),
+        ('commerce', '0006_transaction_patient_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseBalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('PURCHASE', 'Purchase'), ('TOP_UP', 'Top-up'), ('REDEEM', 'Redemption')], max_length=10)),
+                ('sessions', models.IntegerField()),
+                ('remaining_after', models.PositiveIntegerField()),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('balance', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='commerce.usercoursebalance')),
+                ('staff', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='course_entries', to='commerce.transaction')),
+                ('treatment_session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='course_entries', to='clinic.treatmentsession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['balance', 'created_at', 'id'], name='commerce_co_balance_c84c1b_idx')],
+            },
+        ),
+    ]
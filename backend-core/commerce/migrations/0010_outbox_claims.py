@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:26
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def complete_dispatched_rows(apps, schema_editor):
+    # Rows dispatched before claims existed were fire-and-forget: treat them as done
+    CommissionOutbox = apps.get_model('commerce', 'CommissionOutbox')
+    CommissionOutbox.objects.filter(dispatched_at__isnull=False).update(completed_at=F('dispatched_at'), attempts=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commissionoutbox',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='commissionoutbox',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='commissionoutbox',
+            index=models.Index(fields=['completed_at'], name='commerce_co_complet_466f04_idx'),
+        ),
+        migrations.RunPython(complete_dispatched_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commerce', '0010_outbox_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commissionruleset',
+            name='product_type_rates',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,4 +1,6 @@
 import uuid
+from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
 from clinic.models import Patient
@@ -21,6 +23,7 @@ class Product(models.Model):
     
     # Inventory check
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.sku} - {self.name}"
@@ -35,6 +38,12 @@ class Course(models.Model):
     product_included = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='courses_defined')
     total_sessions = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.total_sessions} sessions)"
@@ -72,13 +81,180 @@ class Transaction(models.Model):
     total_amount = models.DecimalField(max_digits=12, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination ordering for the transaction list
+            models.Index(fields=['created_at', 'id']),
+            # Recent transactions per patient (patient chart)
+            models.Index(fields=['patient', 'created_at', 'id']),
+        ]
+
+class TransactionLine(models.Model):
+    """
+    One cart line of a sale: a product or a course, priced at checkout.
+    The name and unit price are copied so later catalogue changes do not
+    rewrite past sales.
+    """
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    course = models.ForeignKey(Course, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    name = models.CharField(max_length=200)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(product__isnull=False, course__isnull=True)
+                | models.Q(product__isnull=True, course__isnull=False),
+                name='transaction_line_product_xor_course',
+            ),
+        ]
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response of a request sent with an Idempotency-Key header
+    (commerce.idempotency), replayed when the client retries it.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    # sha256 of the request body: a reused key with a different body is refused
+    request_digest = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
+
+class CourseBalanceEntry(models.Model):
+    """
+    Append-only history of a course balance: one row per purchase, top-up
+    or redemption, written in the same DB transaction as the balance update
+    (commerce.balances) and never changed afterwards.
+    """
+    KIND_CHOICES = [
+        ('PURCHASE', 'Purchase'),
+        ('TOP_UP', 'Top-up'),
+        ('REDEEM', 'Redemption'),
+    ]
+
+    balance = models.ForeignKey(UserCourseBalance, on_delete=models.PROTECT, related_name='entries')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Signed change: negative for redemptions
+    sessions = models.IntegerField()
+    remaining_after = models.PositiveIntegerField()
+    staff = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='course_entries')
+    treatment_session = models.ForeignKey(
+        'clinic.TreatmentSession', on_delete=models.SET_NULL, null=True, blank=True, related_name='course_entries'
+    )
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['balance', 'created_at', 'id']),
+        ]
+
+class CommissionRuleSet(models.Model):
+    """
+    A versioned set of commission rules. Logs snapshot the version used,
+    so a month can be replayed under any version (recompute_commissions).
+    Tiers: [{"above": "100000.00", "rate": "0.10", "rule": "High Value (>100k)"}, ...]
+    The tier with the highest "above" strictly below the sale amount applies.
+    Product type rates: {"RETAIL": "0.03"} replace the tier rate for the
+    TransactionLines of that product type (a course line counts as the
+    type of its product); the rest of the sale earns the tier rate.
+    """
+    version = models.PositiveIntegerField(unique=True)
+    name = models.CharField(max_length=200)
+    tiers = models.JSONField()
+    product_type_rates = models.JSONField(default=dict, blank=True)
+    # Share of the pool credited to staff_1 when staff_2 is also present
+    primary_split = models.DecimalField(max_digits=5, decimal_places=4, default=Decimal('0.5'))
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"v{self.version} - {self.name}"
 
 class CommissionLog(models.Model):
     """
     Output of the Async Calculation Task.
+    One row per staff member credited on the transaction.
     """
-    transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name='commission_log')
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='commission_logs')
     staff = models.ForeignKey(User, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     calculation_details = models.JSONField(help_text="Snapshots the formula used")
     calculated_at = models.DateTimeField(auto_now_add=True)
+    # Payroll month of the sale (first day of the month of transaction.created_at)
+    period = models.DateField()
+    # Set when the sale is voided; voided logs no longer count in the ledger
+    voided_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'staff'], name='unique_commission_per_staff'),
+        ]
+        indexes = [
+            # Per-staff drilldown for a payroll period
+            models.Index(fields=['staff', 'period', 'id']),
+        ]
+
+class StaffCommissionLedger(models.Model):
+    """
+    Running commission total per staff member per payroll month.
+    Maintained incrementally by commerce.ledger whenever logs are written
+    or voided, so payroll reads one row per staff.
+    """
+    staff = models.ForeignKey(User, on_delete=models.CASCADE, related_name='commission_ledger')
+    period = models.DateField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    log_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['staff', 'period'], name='unique_ledger_staff_period'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'staff']),
+        ]
+
+class CommissionOutbox(models.Model):
+    """
+    Transactional outbox for commission calculation.
+    Written in the same DB transaction as the Transaction save; drained in
+    batches by tasks.commission_tasks.dispatch_commission_outbox.
+
+    A row is pending until dispatched, then claimed (dispatched_at) until the
+    batch task has written its logs and set completed_at. Claims that are not
+    completed in time (broker down, task failed for good) are dispatched again.
+    """
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # At most one pending entry per transaction: repeated saves collapse.
+            models.UniqueConstraint(
+                fields=['transaction'],
+                condition=models.Q(dispatched_at__isnull=True),
+                name='unique_pending_commission_outbox',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['dispatched_at', 'id']),
+            # Retention cleanup of completed rows
+            models.Index(fields=['completed_at']),
+        ]
@@ -1,5 +1,11 @@
+from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import Product, Course, Transaction, CommissionLog
+from clinic.models import Patient, TreatmentSession
+from core.serializers import SparseFieldsMixin
+from .models import (
+    Product, Course, UserCourseBalance, CourseBalanceEntry, Transaction, TransactionLine, CommissionLog,
+    StaffCommissionLedger,
+)
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,13 +17,108 @@ class CourseSerializer(serializers.ModelSerializer):
         model = Course
         fields = '__all__'
 
-class TransactionSerializer(serializers.ModelSerializer):
+class UserCourseBalanceSerializer(serializers.ModelSerializer):
+    course_name = serializers.CharField(source='course.name', read_only=True)
+    total_sessions = serializers.IntegerField(source='course.total_sessions', read_only=True)
+
+    class Meta:
+        model = UserCourseBalance
+        fields = [
+            'id', 'patient', 'course', 'course_name', 'total_sessions', 'remaining_sessions',
+            'purchased_date', 'last_used_date',
+        ]
+
+class CourseBalanceEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CourseBalanceEntry
+        fields = [
+            'id', 'balance', 'kind', 'sessions', 'remaining_after', 'staff', 'transaction',
+            'treatment_session', 'note', 'created_at',
+        ]
+
+# Request bodies of the course balance actions (commerce.balances)
+
+class RedeemSerializer(serializers.Serializer):
+    sessions = serializers.IntegerField(min_value=1, max_value=100, default=1)
+    treatment_session = serializers.PrimaryKeyRelatedField(queryset=TreatmentSession.objects.all(), required=False)
+    note = serializers.CharField(max_length=200, required=False, default='', allow_blank=True)
+
+class RedemptionSerializer(serializers.Serializer):
+    balance = serializers.UUIDField()
+    sessions = serializers.IntegerField(min_value=1, max_value=100, default=1)
+
+class BatchRedeemSerializer(serializers.Serializer):
+    redemptions = serializers.ListField(child=RedemptionSerializer(), min_length=1, max_length=200)
+    note = serializers.CharField(max_length=200, required=False, default='', allow_blank=True)
+
+class TopUpSerializer(serializers.Serializer):
+    sessions = serializers.IntegerField(min_value=1, max_value=1000)
+    note = serializers.CharField(max_length=200, required=False, default='', allow_blank=True)
+
+class PurchaseSerializer(serializers.Serializer):
+    patient = serializers.PrimaryKeyRelatedField(queryset=Patient.objects.all())
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all())
+    quantity = serializers.IntegerField(min_value=1, max_value=100, default=1)
+    transaction = serializers.PrimaryKeyRelatedField(queryset=Transaction.objects.all(), required=False)
+    note = serializers.CharField(max_length=200, required=False, default='', allow_blank=True)
+
+class TransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
 
+class TransactionLineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TransactionLine
+        fields = ['id', 'product', 'course', 'name', 'quantity', 'unit_price', 'line_total']
+
+# Request body of POST /commerce/checkout/ (commerce.checkout)
+
+class WalkInPatientSerializer(serializers.Serializer):
+    hn = serializers.CharField(max_length=20)
+    first_name = serializers.CharField(max_length=100, required=False)
+    last_name = serializers.CharField(max_length=100, required=False)
+    phone_number = serializers.CharField(max_length=15, required=False)
+
+class PatientReferenceField(serializers.Field):
+    """A patient id, or {"hn", "first_name", "last_name", "phone_number"} for a walk-in."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            serializer = WalkInPatientSerializer(data=data)
+            serializer.is_valid(raise_exception=True)
+            return serializer.validated_data
+        return serializers.UUIDField().to_internal_value(data)
+
+class CheckoutLineSerializer(serializers.Serializer):
+    product = serializers.UUIDField(required=False)
+    course = serializers.UUIDField(required=False)
+    quantity = serializers.IntegerField(min_value=1, max_value=100, default=1)
+
+    def validate(self, attrs):
+        if bool(attrs.get('product')) == bool(attrs.get('course')):
+            raise serializers.ValidationError("Each line needs either a product or a course")
+        return attrs
+
+class CheckoutSerializer(serializers.Serializer):
+    patient = PatientReferenceField()
+    # Defaults to the authenticated user
+    staff_1 = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+    staff_2 = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False, allow_null=True)
+    items = serializers.ListField(child=CheckoutLineSerializer(), min_length=1, max_length=100)
+
 class CommissionLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = CommissionLog
         fields = '__all__'
 
+
+class StaffCommissionLedgerSerializer(serializers.ModelSerializer):
+    staff_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StaffCommissionLedger
+        fields = ['staff', 'staff_name', 'period', 'amount', 'log_count']
+
+    def get_staff_name(self, obj):
+        return obj.staff.get_full_name() or obj.staff.username
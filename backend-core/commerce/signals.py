@@ -1,15 +1,42 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
-from .models import Transaction
-from tasks.commission_tasks import calculate_commission
+from .ledger import void_commission_logs
+from core.response_cache import bump
+from .models import Course, Product, Transaction, CommissionLog, CommissionOutbox
+
+@receiver(post_init, sender=Transaction)
+def remember_commission_status(sender, instance, **kwargs):
+    # Status as loaded, so post_save acts on transitions only (None if deferred)
+    instance._commission_status = instance.__dict__.get('status')
 
 @receiver(post_save, sender=Transaction)
 def trigger_commission_calculation(sender, instance, created, **kwargs):
     """
-    Trigger async commission calculation when a transaction is marked COMPLETED.
+    Queue commission calculation when a transaction becomes COMPLETED.
+    Writes to the outbox inside the caller's DB transaction, so nothing is
+    published for a sale that rolls back. Later saves of a completed sale
+    (edits, If-Match updates) queue nothing; repeated transitions before
+    dispatch collapse onto one pending outbox row.
+    """
+    if instance.status == 'COMPLETED' and (created or instance._commission_status != 'COMPLETED'):
+        CommissionOutbox.objects.bulk_create(
+            [CommissionOutbox(transaction=instance)], ignore_conflicts=True
+        )
+
+@receiver(post_save, sender=Transaction)
+def void_commission_on_void(sender, instance, created, **kwargs):
+    """
+    Void the commission of a sale that is voided, keeping the staff ledger
+    in step within the same DB transaction.
     """
-    if instance.status == 'COMPLETED':
-        # Use .delay() to offload to Celery
-        # We pass the ID, not the object, to avoid serialization issues
-        calculate_commission.delay(instance.id)
+    if instance.status == 'VOID' and not created and instance._commission_status != 'VOID':
+        void_commission_logs(CommissionLog.objects.filter(transaction=instance))
+    instance._commission_status = instance.status
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    bump('product')
 
+@receiver([post_save, post_delete], sender=Course)
+def invalidate_course_responses(sender, instance, **kwargs):
+    bump('course')
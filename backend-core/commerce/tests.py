@@ -1,3 +1,468 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from clinic.models import Patient
+from tasks.commission_tasks import OUTBOX_CLAIM_TIMEOUT, calculate_commissions_batch, dispatch_commission_outbox
+from .commission_rules import CommissionEngine, line_amounts
+from .ledger import payroll_period, write_commission_logs
+from .models import (
+    CommissionLog, CommissionOutbox, CommissionRuleSet, Course, StaffCommissionLedger, CourseBalanceEntry, Product, Transaction, TransactionLine, UserCourseBalance,
+)
 
-# Create your tests here.
+
+class CommissionEngineTest(TestCase):
+    TIERS = [
+        {'above': '0', 'rate': '0.05', 'rule': 'Standard'},
+        {'above': '100000.00', 'rate': '0.10', 'rule': 'High'},
+    ]
+
+    def _evaluate(self, *rows, lines=None, **rule_set):
+        engine = CommissionEngine(CommissionRuleSet(version=9, name='Test', tiers=self.TIERS, **rule_set))
+        return [(log['staff_id'], log['amount']) for log in engine.evaluate(rows, lines)]
+
+    def test_pool_and_split_round_half_up_to_the_satang(self):
+        # 10.10 * 5% = 0.505 -> 0.51, split 50/50 -> 0.255 -> 0.26 + 0.25
+        self.assertEqual(self._evaluate(('t1', Decimal('10.10'), 1, 2)), [(1, Decimal('0.26')), (2, Decimal('0.25'))])
+        # 0.01 * 5% = 0.0005 -> 0.00
+        self.assertEqual(self._evaluate(('t1', Decimal('0.01'), 1, None)), [(1, Decimal('0.00'))])
+
+    def test_split_shares_always_sum_to_the_pool(self):
+        amounts = [Decimal(cents).scaleb(-2) for cents in range(1, 200_000, 7919)]
+        for primary_split in (Decimal('0.5'), Decimal('0.3333'), Decimal('0.7')):
+            engine = CommissionEngine(CommissionRuleSet(version=9, name='Test', tiers=self.TIERS, primary_split=primary_split))
+            logs = engine.evaluate((str(amount), amount, 1, 2) for amount in amounts)
+            for first, second in zip(logs[::2], logs[1::2]):
+                self.assertEqual(first['amount'] + second['amount'], Decimal(first['calculation_details']['total_commission_pool']))
+
+    def test_tier_applies_strictly_above_its_threshold(self):
+        logs = self._evaluate(('a', Decimal('100000.00'), 1, None), ('b', Decimal('100000.01'), 1, None))
+        self.assertEqual(logs, [(1, Decimal('5000.00')), (1, Decimal('10000.00'))])
+
+    def test_staff_slots(self):
+        self.assertEqual(self._evaluate(('t1', Decimal('1000'), 1, 1)), [(1, Decimal('50.00'))])
+        self.assertEqual(self._evaluate(('t1', Decimal('1000'), None, 2)), [(2, Decimal('50.00'))])
+        self.assertEqual(self._evaluate(('t1', Decimal('1000'), None, None)), [])
+
+    def test_product_type_rates_apply_to_their_lines(self):
+        lines = {'t1': {'RETAIL': Decimal('900.50'), 'SERVICE': Decimal('6000.00')}}
+        rates = {'RETAIL': '0.03'}
+
+        # 900.50 * 3% + 6000.00 * 5% = 27.015 + 300 = 327.015 -> 327.02, rounded once
+        self.assertEqual(
+            self._evaluate(('t1', Decimal('6900.50'), 1, None), lines=lines, product_type_rates=rates),
+            [(1, Decimal('327.02'))],
+        )
+        # No lines (or no rates): the tier rate throughout
+        self.assertEqual(self._evaluate(('t2', Decimal('6900.50'), 1, None), lines=lines, product_type_rates=rates), [(1, Decimal('345.03'))])
+        self.assertEqual(self._evaluate(('t1', Decimal('6900.50'), 1, None), lines=lines), [(1, Decimal('345.03'))])
+
+    @override_settings(TASK_METRICS_URL='')
+    def test_checkout_lines_are_rated_by_product_type(self):
+        CommissionRuleSet.objects.create(version=2, name='Retail 3%', tiers=self.TIERS, product_type_rates={'RETAIL': '0.03'})
+        client = APIClient()
+        cashier = User.objects.create_user('cashier')
+        client.force_authenticate(cashier)
+        patient = Patient.objects.create(hn='HN-1', first_name='Malee', last_name='Dee', phone_number='0812345678')
+        cream = Product.objects.create(sku='CREAM', name='Sunscreen', product_type='RETAIL', price=Decimal('450.00'))
+        laser = Product.objects.create(sku='LASER', name='Laser', product_type='SERVICE', price=Decimal('1500.00'))
+        course = Course.objects.create(name='Laser x5', product_included=laser, total_sessions=5, price=Decimal('6000.00'))
+        response = client.post('/api/v1/commerce/checkout/', {
+            'patient': str(patient.pk), 'items': [{'product': str(cream.pk), 'quantity': 2}, {'course': str(course.pk)}],
+        }, format='json')
+        transaction_id = response.json()['transaction']['id']
+
+        self.assertEqual(line_amounts([transaction_id]), {
+            Transaction.objects.get().pk: {'RETAIL': Decimal('900.00'), 'SERVICE': Decimal('6000.00')},
+        })
+        calculate_commissions_batch([transaction_id])
+        log = CommissionLog.objects.get()
+        # 900 * 3% + 6000 * 5%
+        self.assertEqual(log.amount, Decimal('327.00'))
+        self.assertEqual(log.calculation_details['rules_version'], 2)
+        self.assertEqual(log.calculation_details['product_type_rates'], {'RETAIL': {'amount': '900.00', 'rate': '0.03'}})
+
+
+@override_settings(TASK_METRICS_URL='')
+class CommissionLedgerTest(TestCase):
+    def setUp(self):
+        self.staff = [User.objects.create_user(f'staff{n}') for n in range(4)]
+        self.patient = Patient.objects.create(hn='HN-1', first_name='Malee', last_name='Dee', phone_number='0812345678')
+
+    def _sale(self, staff_1, staff_2=None, amount='1000'):
+        return Transaction.objects.create(
+            patient=self.patient, staff_1=staff_1, staff_2=staff_2, total_amount=Decimal(amount), status='COMPLETED',
+        )
+
+    def _ledger(self):
+        return {
+            (row.staff.username, row.period): (row.amount, row.log_count)
+            for row in StaffCommissionLedger.objects.select_related('staff')
+        }
+
+    def test_logs_written_elsewhere_are_skipped_not_fatal(self):
+        first, second = self._sale(self.staff[0]), self._sale(self.staff[1])
+        calculate_commissions_batch([first.pk])
+        period = payroll_period(first.created_at)
+
+        # A second worker that read before the first one wrote: it still holds logs for both sales
+        late = [
+            CommissionLog(transaction=sale, staff=sale.staff_1, amount=Decimal('50.00'), period=period, calculation_details={})
+            for sale in (first, second)
+        ]
+        written = write_commission_logs(late)
+
+        self.assertEqual([log.transaction_id for log in written], [second.pk])
+        self.assertEqual(self._ledger(), {('staff0', period): (Decimal('50.00'), 1), ('staff1', period): (Decimal('50.00'), 1)})
+        self.assertEqual(calculate_commissions_batch([first.pk, second.pk]), 0)
+
+    def test_sale_completed_again_after_a_void_is_recalculated(self):
+        sale = self._sale(self.staff[0], self.staff[1])
+        calculate_commissions_batch([sale.pk])
+        sale.status = 'VOID'
+        sale.save()
+        period = payroll_period(sale.created_at)
+        self.assertEqual(self._ledger()[('staff0', period)], (Decimal('0.00'), 0))
+
+        sale.status = 'COMPLETED'
+        sale.save()
+        self.assertEqual(calculate_commissions_batch([sale.pk]), 2)
+
+        self.assertEqual(CommissionLog.objects.filter(voided_at__isnull=True).count(), 2)
+        self.assertEqual(self._ledger(), {('staff0', period): (Decimal('25.00'), 1), ('staff1', period): (Decimal('25.00'), 1)})
+
+    def test_ledger_queries_do_not_grow_with_staff(self):
+        def queries(sales):
+            with CaptureQueriesContext(connection) as captured:
+                calculate_commissions_batch([sale.pk for sale in sales])
+            return len(captured)
+
+        one_staff = queries([self._sale(self.staff[0]) for _ in range(3)])
+        many_staff = [self._sale(self.staff[n], self.staff[n + 1]) for n in range(3)]
+        Transaction.objects.filter(pk=many_staff[0].pk).update(created_at=timezone.now() - timedelta(days=40))
+        self.assertEqual(queries(many_staff), one_staff)
+        self.assertEqual(len(self._ledger()), 6)
+
+    def test_drilldown_and_summary_parameters(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/v1/commerce/commissions/?staff=abc').status_code, 400)
+        self.assertEqual(client.get('/api/v1/commerce/commissions/summary/?period=2025-13').status_code, 400)
+
+        response = client.get('/api/v1/commerce/commissions/summary/?period=2025-03')
+        self.assertEqual(response.json(), {'period': '2025-03', 'total': '0.00', 'results': []})
+
+        sale = self._sale(self.staff[0], amount='1000.10')
+        calculate_commissions_batch([sale.pk])
+        period = payroll_period(sale.created_at).strftime('%Y-%m')
+        self.assertEqual(client.get(f'/api/v1/commerce/commissions/summary/?period={period}').json()['total'], '50.01')
+        logs = client.get(f'/api/v1/commerce/commissions/?staff={self.staff[0].pk}').json()['results']
+        self.assertEqual([log['amount'] for log in logs], ['50.01'])
+
+
+@override_settings(TASK_METRICS_URL='')
+class CommissionOutboxTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('nurse')
+        self.patient = Patient.objects.create(hn='HN-1', first_name='Malee', last_name='Dee', phone_number='0812345678')
+
+    def _sale(self, status='COMPLETED', amount='1000'):
+        return Transaction.objects.create(patient=self.patient, staff_1=self.staff, total_amount=Decimal(amount), status=status)
+
+    def _dispatch(self, **kwargs):
+        with mock.patch.object(calculate_commissions_batch, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            dispatch_commission_outbox(**kwargs)
+        return [call.args for call in delay.call_args_list]
+
+    def test_only_the_transition_into_completed_is_queued(self):
+        sale = self._sale(status='PENDING')
+        self.assertFalse(CommissionOutbox.objects.exists())
+
+        sale.status = 'COMPLETED'
+        sale.save()
+        sale.total_amount = Decimal('1200')
+        sale.save()
+        Transaction.objects.get(pk=sale.pk).save()
+        self.assertEqual(CommissionOutbox.objects.count(), 1)
+
+        self._dispatch()
+        sale.status = 'VOID'
+        sale.save()
+        sale.status = 'COMPLETED'
+        sale.save()
+        self.assertEqual(CommissionOutbox.objects.filter(dispatched_at__isnull=True).count(), 1)
+
+    def test_claims_are_completed_by_the_batch_task(self):
+        sales = [self._sale() for _ in range(3)]
+
+        messages = self._dispatch(chunk_size=2)
+
+        self.assertEqual([len(ids) for ids, _ in messages], [2, 1])
+        self.assertEqual(CommissionOutbox.objects.filter(completed_at__isnull=True, attempts=1).count(), 3)
+        self.assertEqual(self._dispatch(), [])
+
+        for transaction_ids, outbox_ids in messages:
+            calculate_commissions_batch(transaction_ids, outbox_ids)
+        self.assertFalse(CommissionOutbox.objects.filter(completed_at__isnull=True).exists())
+        self.assertEqual(CommissionLog.objects.filter(transaction__in=sales).count(), 3)
+
+    def test_uncompleted_claims_are_dispatched_again_one_per_message(self):
+        lost, failed, done = self._sale(), self._sale(), self._sale()
+        messages = self._dispatch()
+        # Only the last one's chunk ever ran
+        calculate_commissions_batch([done.pk], [CommissionOutbox.objects.get(transaction=done).pk])
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + OUTBOX_CLAIM_TIMEOUT - timedelta(seconds=1)):
+            self.assertEqual(self._dispatch(), [])
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + OUTBOX_CLAIM_TIMEOUT + timedelta(seconds=1)), \
+                self.assertLogs('tasks.commission_tasks', level='WARNING'):
+            retried = self._dispatch()
+
+        self.assertEqual(len(messages[0][0]), 3)
+        self.assertEqual(sorted(ids for ids, _ in retried), sorted([[str(lost.pk)], [str(failed.pk)]]))
+        self.assertEqual(
+            set(CommissionOutbox.objects.filter(attempts=2).values_list('transaction_id', flat=True)), {lost.pk, failed.pk}
+        )
+        for transaction_ids, outbox_ids in retried:
+            calculate_commissions_batch(transaction_ids, outbox_ids)
+        self.assertEqual(CommissionLog.objects.count(), 3)
+        self.assertFalse(CommissionOutbox.objects.filter(completed_at__isnull=True).exists())
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('accountant'))
+        self.staff = User.objects.create_user('nurse', first_name='Malee', last_name='Dee')
+        patient = Patient.objects.create(hn='HN-1', first_name='=Somchai', last_name='Jaidee', phone_number='0812345678')
+
+        self.transactions = []
+        for day, amount, status in [(1, '1000.00', 'COMPLETED'), (2, '2500.50', 'COMPLETED'), (3, '300.00', 'VOID')]:
+            txn = Transaction.objects.create(patient=patient, staff_1=self.staff, total_amount=Decimal(amount), status=status)
+            created_at = timezone.make_aware(datetime(2025, 3, day, 23, 30))
+            Transaction.objects.filter(pk=txn.pk).update(created_at=created_at)
+            self.transactions.append(txn)
+        CommissionLog.objects.create(
+            transaction=self.transactions[1], staff=self.staff, amount=Decimal('125.03'), period=date(2025, 3, 1),
+            calculation_details={'rule': 'Standard Value (<=100k)', 'rate': '0.05', 'rules_version': 1},
+        )
+
+    def _content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_filters_by_day_and_status(self):
+        response = self.client.get('/api/v1/commerce/transactions/export/?from=2025-03-01&to=2025-03-02&status=COMPLETED')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions_2025-03-01_2025-03-02.csv"')
+        content = self._content(response).decode('utf-8-sig')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['id'] for row in rows], [str(txn.pk) for txn in self.transactions[:2]])
+        self.assertEqual(rows[1]['total_amount'], '2500.50')
+        # 23:30 local time stays on its own day
+        self.assertTrue(rows[1]['created_at'].startswith('2025-03-02T23:30'))
+        self.assertEqual(rows[1]['staff_1_name'], 'Malee Dee')
+        self.assertEqual(rows[1]['staff_2_name'], '')
+        # Cells that would be read as formulas are quoted
+        self.assertEqual(rows[1]['patient_name'], "'=Somchai Jaidee")
+
+    def test_ndjson_gzip_export(self):
+        response = self.client.get('/api/v1/commerce/transactions/export/?output=ndjson&gzip=1')
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions_start_latest.ndjson.gz"')
+        rows = [json.loads(line) for line in gzip.decompress(self._content(response)).splitlines()]
+        self.assertEqual([row['status'] for row in rows], ['COMPLETED', 'COMPLETED', 'VOID'])
+        self.assertEqual(rows[0]['patient_name'], '=Somchai Jaidee')
+        self.assertEqual(rows[0]['staff_1'], 'nurse')
+
+    def test_commission_log_export(self):
+        response = self.client.get('/api/v1/commerce/commissions/export/?output=ndjson&status=COMPLETED&period=2025-03')
+
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['transaction_id'], str(self.transactions[1].pk))
+        self.assertEqual(rows[0]['amount'], '125.03')
+        self.assertEqual(rows[0]['rule'], 'Standard Value (<=100k)')
+        self.assertEqual(rows[0]['staff_name'], 'Malee Dee')
+        self.assertEqual(rows[0]['period'], '2025-03-01')
+
+    @override_settings(EXPORT_CHUNK_SIZE=1)
+    def test_rows_are_sent_as_they_are_read(self):
+        response = self.client.get('/api/v1/commerce/transactions/export/')
+        # A sync iterator: WSGI (the default server mode) sends each chunk as it is produced
+        self.assertFalse(response.is_async)
+        chunks = list(response.streaming_content)
+        # Header, first row, then one flush per chunk of rows
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(b''.join(chunks).decode('utf-8-sig').count('\n'), 4)
+
+    def test_invalid_parameters_and_authentication(self):
+        for query in ['from=2025-13-01', 'status=REFUNDED', 'output=xlsx', 'from=2025-03-02&to=2025-03-01']:
+            response = self.client.get(f'/api/v1/commerce/transactions/export/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/v1/commerce/transactions/export/').status_code, 403)
+
+
+class CourseBalanceTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = User.objects.create_user('frontdesk')
+        self.client.force_authenticate(self.staff)
+        product = Product.objects.create(sku='LASER', name='Laser', product_type='SERVICE', price=Decimal('1500'))
+        self.course = Course.objects.create(name='Laser x5', product_included=product, total_sessions=5, price=Decimal('6000'))
+        self.patients = [
+            Patient.objects.create(hn=f'HN-{n}', first_name='Malee', last_name=str(n), phone_number='0812345678')
+            for n in range(2)
+        ]
+
+    def _purchase(self, patient, quantity=1):
+        response = self.client.post('/api/v1/commerce/course-balances/purchase/', {
+            'patient': str(patient.pk), 'course': str(self.course.pk), 'quantity': quantity,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_purchase_creates_then_adds_to_the_balance(self):
+        first = self._purchase(self.patients[0])
+        second = self._purchase(self.patients[0], quantity=2)
+
+        self.assertEqual(first['balance'], second['balance'])
+        self.assertEqual((first['remaining_after'], second['remaining_after']), (5, 15))
+        self.assertEqual(UserCourseBalance.objects.get().remaining_sessions, 15)
+        self.assertEqual(second['staff'], self.staff.pk)
+
+    def test_redeem_cannot_overdraw(self):
+        balance_id = self._purchase(self.patients[0])['balance']
+        url = f'/api/v1/commerce/course-balances/{balance_id}/redeem/'
+
+        response = self.client.post(url, {'sessions': 4}, format='json')
+        self.assertEqual((response.status_code, response.data['remaining_after']), (201, 1))
+        response = self.client.post(url, {'sessions': 2}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['balances'], [{'balance': balance_id, 'remaining_sessions': 1}])
+
+        self.assertEqual(self.client.post(url, {'sessions': 0}, format='json').status_code, 400)
+        missing = '/api/v1/commerce/course-balances/00000000-0000-0000-0000-000000000000/redeem/'
+        self.assertEqual(self.client.post(missing, {}, format='json').status_code, 404)
+        self.assertEqual(UserCourseBalance.objects.get().remaining_sessions, 1)
+
+    def test_batch_redeem_is_all_or_nothing(self):
+        full = self._purchase(self.patients[0])['balance']
+        short = self._purchase(self.patients[1])['balance']
+        self.client.post(f'/api/v1/commerce/course-balances/{short}/redeem/', {'sessions': 5}, format='json')
+        url = '/api/v1/commerce/course-balances/redeem/'
+
+        response = self.client.post(url, {'redemptions': [{'balance': full}, {'balance': short}]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['balances'], [{'balance': short, 'remaining_sessions': 0}])
+        self.assertEqual(UserCourseBalance.objects.get(pk=full).remaining_sessions, 5)
+
+        self.client.post(f'/api/v1/commerce/course-balances/{short}/top-up/', {'sessions': 1, 'note': 'Complimentary'}, format='json')
+        response = self.client.post(url, {'redemptions': [{'balance': full}, {'balance': short}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(entry['remaining_after'] for entry in response.data['entries']), [0, 4])
+
+        missing = '00000000-0000-0000-0000-000000000000'
+        response = self.client.post(url, {'redemptions': [{'balance': full}, {'balance': missing}]}, format='json')
+        self.assertEqual((response.status_code, response.json()['balance']), (404, missing))
+        self.assertEqual(UserCourseBalance.objects.get(pk=full).remaining_sessions, 4)
+
+    def test_history_is_newest_first(self):
+        balance_id = self._purchase(self.patients[0])['balance']
+        self.client.post(f'/api/v1/commerce/course-balances/{balance_id}/redeem/', {}, format='json')
+        self.client.post(f'/api/v1/commerce/course-balances/{balance_id}/top-up/', {'sessions': 2}, format='json')
+
+        response = self.client.get(f'/api/v1/commerce/course-balance-entries/?balance={balance_id}')
+        self.assertEqual(
+            [(entry['kind'], entry['sessions'], entry['remaining_after']) for entry in response.data['results']],
+            [('TOP_UP', 2, 6), ('REDEEM', -1, 4), ('PURCHASE', 5, 5)],
+        )
+        self.assertEqual(CourseBalanceEntry.objects.count(), 3)
+
+
+class CheckoutTest(TestCase):
+    URL = '/api/v1/commerce/checkout/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cashier = User.objects.create_user('cashier')
+        self.client.force_authenticate(self.cashier)
+        self.patient = Patient.objects.create(hn='HN-1', first_name='Malee', last_name='Dee', phone_number='0812345678')
+        self.cream = Product.objects.create(sku='CREAM', name='Sunscreen', product_type='RETAIL', price=Decimal('450.00'))
+        laser = Product.objects.create(sku='LASER', name='Laser', product_type='SERVICE', price=Decimal('1500.00'))
+        self.course = Course.objects.create(name='Laser x5', product_included=laser, total_sessions=5, price=Decimal('6000.00'))
+
+    def _cart(self, **overrides):
+        return {
+            'patient': str(self.patient.pk),
+            'items': [{'product': str(self.cream.pk), 'quantity': 2}, {'course': str(self.course.pk)}],
+            **overrides,
+        }
+
+    def test_checkout_records_lines_balances_and_commission(self):
+        with self.assertNumQueries(20):
+            response = self.client.post(self.URL, self._cart(), format='json')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        transaction = Transaction.objects.get()
+        self.assertEqual(body['transaction']['id'], str(transaction.pk))
+        self.assertEqual((transaction.total_amount, transaction.status), (Decimal('6900.00'), 'COMPLETED'))
+        self.assertEqual(transaction.staff_1, self.cashier)
+        self.assertEqual(
+            [(line['name'], line['quantity'], line['line_total']) for line in body['lines']],
+            [('Sunscreen', 2, '900.00'), ('Laser x5', 1, '6000.00')],
+        )
+        self.assertEqual(body['course_balances'][0]['remaining_after'], 5)
+        self.assertEqual(UserCourseBalance.objects.get(patient=self.patient).remaining_sessions, 5)
+        self.assertTrue(CommissionOutbox.objects.filter(transaction=transaction).exists())
+
+    def test_walk_in_patient_is_registered(self):
+        walk_in = {'hn': 'WALK-IN', 'first_name': 'Walk-in', 'last_name': 'Customer', 'phone_number': '0810000000'}
+        for _ in range(2):
+            response = self.client.post(self.URL, self._cart(patient=walk_in), format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+
+        self.assertEqual(Patient.objects.filter(hn='WALK-IN').count(), 1)
+        unknown = self.client.post(self.URL, self._cart(patient={'hn': 'HN-404'}), format='json')
+        self.assertEqual(unknown.status_code, 400)
+
+    def test_unknown_or_inactive_items_roll_back(self):
+        Product.objects.filter(pk=self.cream.pk).update(is_active=False)
+
+        response = self.client.post(self.URL, self._cart(), format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'items': ['items[0]: product not found or inactive']})
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(UserCourseBalance.objects.exists())
+
+    def test_idempotency_key_replays_the_stored_response(self):
+        first = self.client.post(self.URL, self._cart(), format='json', HTTP_IDEMPOTENCY_KEY='sale-1')
+        retry = self.client.post(self.URL, self._cart(), format='json', HTTP_IDEMPOTENCY_KEY='sale-1')
+
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(TransactionLine.objects.count(), 2)
+        self.assertEqual(UserCourseBalance.objects.get().remaining_sessions, 5)
+
+        reused = self.client.post(self.URL, self._cart(items=[{'product': str(self.cream.pk)}]), format='json', HTTP_IDEMPOTENCY_KEY='sale-1')
+        self.assertEqual(reused.status_code, 422)
+        self.client.post(self.URL, self._cart(), format='json', HTTP_IDEMPOTENCY_KEY='sale-2')
+        self.assertEqual(Transaction.objects.count(), 2)
@@ -1,13 +1,20 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, CourseViewSet, TransactionViewSet
+from .views import (
+    ProductViewSet, CourseViewSet, CourseBalanceViewSet, CourseBalanceEntryViewSet,
+    TransactionViewSet, CommissionLogViewSet, CheckoutView,
+)
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
 router.register(r'courses', CourseViewSet)
+router.register(r'course-balances', CourseBalanceViewSet)
+router.register(r'course-balance-entries', CourseBalanceEntryViewSet)
 router.register(r'transactions', TransactionViewSet)
+router.register(r'commissions', CommissionLogViewSet)
 
 urlpatterns = [
+    path('checkout/', CheckoutView.as_view(), name='checkout'),
     path('', include(router.urls)),
 ]
 
@@ -1,15 +1,331 @@
-from rest_framework import viewsets
-from .models import Product, Course, Transaction
-from .serializers import ProductSerializer, CourseSerializer, TransactionSerializer
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from django.http import StreamingHttpResponse
+from rest_framework import permissions, views, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from core.conditional import ConditionalMixin
+from core.fast_list import FastListMixin
+from core.response_cache import cached_response
+from . import balances
+from .checkout import CheckoutError, checkout, resolve_patient
+from .exports import COMMISSION_LOG_COLUMNS, FORMATS, TRANSACTION_COLUMNS, date_range_filter, export_rows
+from .idempotency import idempotent
+from .models import Product, Course, UserCourseBalance, CourseBalanceEntry, Transaction, CommissionLog, StaffCommissionLedger
+from .serializers import (
+    ProductSerializer, CourseSerializer, UserCourseBalanceSerializer, CourseBalanceEntrySerializer,
+    TransactionSerializer, TransactionLineSerializer, CommissionLogSerializer, StaffCommissionLedgerSerializer,
+    RedeemSerializer, BatchRedeemSerializer, TopUpSerializer, PurchaseSerializer, CheckoutSerializer,
+)
 
-class ProductViewSet(viewsets.ModelViewSet):
+
+def _parse_period(value):
+    """'2026-10' -> date(2026, 10, 1)"""
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except (TypeError, ValueError):
+        raise ValidationError({"period": "Expected YYYY-MM"})
+
+
+def _parse_day(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: "Expected YYYY-MM-DD"})
+
+
+def _export_response(request, queryset, date_field, status_field, columns, basename):
+    """
+    Stream `queryset` filtered by the shared export parameters:
+    ?from=&to= (days, inclusive, on `date_field`), ?status= (on `status_field`),
+    ?output=csv|ndjson and ?gzip=1.
+    """
+    params = request.query_params
+    output = params.get('output', 'csv')
+    if output not in FORMATS:
+        raise ValidationError({"output": f"Expected one of: {', '.join(FORMATS)}"})
+    status = params.get('status')
+    statuses = dict(Transaction.STATUS_CHOICES)
+    if status and status not in statuses:
+        raise ValidationError({"status": f"Expected one of: {', '.join(statuses)}"})
+    date_from, date_to = _parse_day(params, 'from'), _parse_day(params, 'to')
+    if date_from and date_to and date_from > date_to:
+        raise ValidationError({"to": "Must not be before 'from'"})
+    compress = params.get('gzip', '').lower() in ('1', 'true')
+
+    queryset = queryset.filter(**date_range_filter(date_field, date_from, date_to))
+    if status:
+        queryset = queryset.filter(**{status_field: status})
+    queryset = queryset.order_by(date_field, 'id')
+
+    filename = f"{basename}_{date_from or 'start'}_{date_to or 'latest'}.{output}"
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    else:
+        content_type = 'text/csv; charset=utf-8' if output == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(export_rows(queryset, columns, output, compress=compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+class ProductViewSet(ConditionalMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    ordering = ('sku',)
+
+    # Loaded by every POS terminal on every screen: served from core.response_cache
+    @cached_response('products', ['product'])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('products', ['product'])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ConditionalMixin, viewsets.ModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
+    ordering = ('name', 'id')
+
+    @cached_response('courses', ['course'])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response('courses', ['course'])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+def _staff(request):
+    return request.user if request.user.is_authenticated else None
+
+
+def _shortfall_response(error):
+    return Response({
+        "error": "Not enough sessions remaining",
+        "balances": [
+            {"balance": balance_id, "remaining_sessions": remaining}
+            for balance_id, remaining in error.shortfalls.items()
+        ],
+    }, status=409)
+
+
+class CourseBalanceViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Patients' course balances: GET /commerce/course-balances/?patient=<id>
+    Changed only through the purchase, top-up and redeem actions, which go
+    through commerce.balances (conditional single-row UPDATEs, no locks).
+    """
+    queryset = UserCourseBalance.objects.select_related('course')
+    serializer_class = UserCourseBalanceSerializer
+    ordering = ('-purchased_date', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        patient_id = self.request.query_params.get('patient')
+        if patient_id:
+            queryset = queryset.filter(patient_id=patient_id)
+        return queryset
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def redeem(self, request, pk=None):
+        """
+        POST /commerce/course-balances/<id>/redeem/
+        Body: { "sessions": 1, "treatment_session": "<id>", "note": "" }
+        201 with the history entry; 409 if fewer sessions remain; 404 if the balance does not exist.
+        """
+        serializer = RedeemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            entry = balances.redeem(
+                self._balance_id(pk), data['sessions'], staff=_staff(request),
+                treatment_session=data.get('treatment_session'), note=data['note'],
+            )
+        except UserCourseBalance.DoesNotExist:
+            return Response({"error": "Course balance not found"}, status=404)
+        except balances.InsufficientSessions as e:
+            return _shortfall_response(e)
+        return Response(CourseBalanceEntrySerializer(entry).data, status=201)
 
-class TransactionViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], url_path='redeem', permission_classes=[permissions.IsAuthenticated])
+    def redeem_batch(self, request):
+        """
+        POST /commerce/course-balances/redeem/ (group bookings)
+        Body: { "redemptions": [{ "balance": "<id>", "sessions": 1 }, ...], "note": "" }
+        All or nothing: 409 listing the short balances if any cannot be redeemed,
+        404 naming a balance that does not exist.
+        """
+        serializer = BatchRedeemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            entries = balances.redeem_many(
+                [(item['balance'], item['sessions']) for item in data['redemptions']],
+                staff=_staff(request), note=data['note'],
+            )
+        except UserCourseBalance.DoesNotExist as e:
+            return Response({"error": "Course balance not found", "balance": e.args[0]}, status=404)
+        except balances.InsufficientSessions as e:
+            return _shortfall_response(e)
+        return Response({"entries": CourseBalanceEntrySerializer(entries, many=True).data}, status=201)
+
+    @action(detail=True, methods=['post'], url_path='top-up', permission_classes=[permissions.IsAuthenticated])
+    def top_up(self, request, pk=None):
+        """
+        POST /commerce/course-balances/<id>/top-up/
+        Body: { "sessions": 2, "note": "Complimentary" }
+        """
+        serializer = TopUpSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            entry = balances.top_up(
+                self._balance_id(pk), serializer.validated_data['sessions'],
+                staff=_staff(request), note=serializer.validated_data['note'],
+            )
+        except UserCourseBalance.DoesNotExist:
+            return Response({"error": "Course balance not found"}, status=404)
+        return Response(CourseBalanceEntrySerializer(entry).data, status=201)
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def purchase(self, request):
+        """
+        POST /commerce/course-balances/purchase/
+        Body: { "patient": "<id>", "course": "<id>", "quantity": 1, "transaction": "<id>" }
+        Adds course.total_sessions x quantity, creating the balance on first purchase.
+        """
+        serializer = PurchaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        entry = balances.purchase(
+            data['patient'].pk, data['course'], data['quantity'], staff=_staff(request),
+            transaction=data.get('transaction'), note=data['note'],
+        )
+        return Response(CourseBalanceEntrySerializer(entry).data, status=201)
+
+    def _balance_id(self, pk):
+        try:
+            return uuid.UUID(pk)
+        except ValueError:
+            raise NotFound("Course balance not found")
+
+
+class CourseBalanceEntryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Append-only course balance history, newest first:
+    GET /commerce/course-balance-entries/?balance=<id> (or ?patient=<id>)
+    """
+    queryset = CourseBalanceEntry.objects.all()
+    serializer_class = CourseBalanceEntrySerializer
+    ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        queryset = CourseBalanceEntry.objects.all()
+        balance_id = self.request.query_params.get('balance')
+        if balance_id:
+            queryset = queryset.filter(balance_id=balance_id)
+        patient_id = self.request.query_params.get('patient')
+        if patient_id:
+            queryset = queryset.filter(balance__patient_id=patient_id)
+        return queryset
+
+
+class TransactionViewSet(ConditionalMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    ordering = ('-created_at', '-id')
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def export(self, request):
+        """
+        GET /commerce/transactions/export/?from=2025-01-01&to=2025-12-31&status=COMPLETED&output=csv&gzip=1
+        Every matching transaction, oldest first, streamed as CSV or NDJSON.
+        """
+        return _export_response(
+            request, Transaction.objects.all(), 'created_at', 'status', TRANSACTION_COLUMNS, 'transactions'
+        )
+
+class CheckoutView(views.APIView):
+    """
+    POST /commerce/checkout/
+    A whole sale in one call: resolves (or registers) the patient, prices the
+    cart, records the transaction and its lines and credits course sessions,
+    all in one DB transaction (commerce.checkout). Send an Idempotency-Key
+    header to make retries safe: a repeated key returns the stored response.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        def execute():
+            try:
+                patient = resolve_patient(data['patient'])
+                transaction, lines, entries = checkout(
+                    patient, data['items'], data.get('staff_1') or request.user, data.get('staff_2'),
+                )
+            except CheckoutError as e:
+                raise ValidationError(e.errors)
+            return {
+                'transaction': TransactionSerializer(transaction).data,
+                'lines': TransactionLineSerializer(lines, many=True).data,
+                'course_balances': CourseBalanceEntrySerializer(entries, many=True).data,
+            }, 201
+
+        return idempotent(request, 'commerce.checkout', execute)
+
+
+class CommissionLogViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Commission logs, drilled down per staff member and payroll period:
+    GET /commerce/commissions/?staff=<id>&period=2026-10
+    """
+    queryset = CommissionLog.objects.all()
+    serializer_class = CommissionLogSerializer
+    ordering = ('-id',)
+
+    def get_queryset(self):
+        queryset = CommissionLog.objects.all()
+        staff_id = self.request.query_params.get('staff')
+        if staff_id:
+            try:
+                queryset = queryset.filter(staff_id=int(staff_id))
+            except ValueError:
+                raise ValidationError({"staff": "Expected a user id"})
+        period = self.request.query_params.get('period')
+        if period:
+            queryset = queryset.filter(period=_parse_period(period))
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """
+        GET /commerce/commissions/summary/?period=2026-10
+        Per-staff totals for the month, read from StaffCommissionLedger.
+        """
+        period = _parse_period(request.query_params.get('period'))
+        rows = StaffCommissionLedger.objects.filter(period=period).select_related('staff').order_by('staff_id')
+        data = StaffCommissionLedgerSerializer(rows, many=True).data
+        return Response({
+            'period': period.strftime('%Y-%m'),
+            'total': str(sum((row.amount for row in rows), start=Decimal('0.00'))),
+            'results': data,
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def export(self, request):
+        """
+        GET /commerce/commissions/export/?from=2025-01-01&to=2025-12-31&status=COMPLETED&output=ndjson
+        Commission logs of the transactions sold in the range, streamed; also
+        takes the drilldown's ?staff= and ?period= filters.
+        """
+        return _export_response(
+            request, self.get_queryset(), 'transaction__created_at', 'transaction__status',
+            COMMISSION_LOG_COLUMNS, 'commissions',
+        )
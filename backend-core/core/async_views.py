@@ -0,0 +1,46 @@
+"""
+Native async DRF views for I/O-bound endpoints.
+
+DRF's APIView is synchronous, so under ASGI (core.asgi) Django runs it in
+a thread for the whole request, and that thread sits idle while the view
+waits on storage or the database. AsyncAPIView keeps DRF's request
+parsing, content negotiation, exception handling and Response rendering,
+but its handlers are coroutines (`async def get(...)`) awaited on the event
+loop. Authentication, permission and throttle checks may query the
+database, so they run in one thread hop before the handler. Handlers use
+the async ORM (`aget`, `acreate`, `async for`) and `sync_to_async` for
+anything blocking.
+
+Under WSGI (and the sync test Client) Django runs these views through
+async_to_sync, with the same results.
+"""
+import inspect
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """APIView whose method handlers are `async def`."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # As APIView.dispatch, awaiting initial() and the handler
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
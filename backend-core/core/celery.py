@@ -15,6 +15,9 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+# Queue lag / run time / outcome telemetry for every task (signal handlers)
+from . import task_metrics  # noqa: E402,F401
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -0,0 +1,177 @@
+"""
+Conditional requests for model viewsets: ETag with If-None-Match (304) on
+reads, If-Match (412) on updates.
+
+ETags come from modification timestamps rather than from the rendered
+body, and cost no query beyond what the response needs anyway:
+
+* a list page's ETag covers the (pk, updated_at) of the rows on the page
+  and its next/previous links, read from the rows the paginator already
+  fetched, so a 304 costs the page query and skips serialization;
+* a detail ETag is the row's updated_at, taken from the object retrieve
+  loaded. Only a request with If-None-Match pays one aggregate (COUNT and
+  MAX) before the object is loaded, to answer 304 without it.
+
+Whatever else the body depends on (URL, renderer, PDPA masking role) is
+hashed in too.
+"""
+import hashlib
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+from .serializers import can_view_unmasked
+
+
+def etag_matches(etag, header):
+    """Weak comparison of `etag` with an If-None-Match / If-Match header."""
+    if etag is None or not header:
+        return False
+    etags = [tag.removeprefix('W/') for tag in parse_etags(header)]
+    return '*' in etags or etag.removeprefix('W/') in etags
+
+
+class NotModified(Exception):
+    """Raised from paginate_queryset when the page matches If-None-Match."""
+
+
+class ConditionalMixin:
+    """
+    ViewSet mixin. list and retrieve send an ETag and answer a matching
+    If-None-Match with 304 before any row is serialized; update and
+    partial_update with If-Match lock the row, and answer 412 if it changed
+    since the client read it.
+
+    `conditional_get = False` keeps the ETag (for If-Match) but always sends
+    the body, for representations the ETag does not cover (e.g. presigned
+    URLs that expire).
+    """
+    etag_field = 'updated_at'
+    conditional_get = True
+    # Bodies differ by PDPA role (masked fields)
+    etag_pdpa = False
+
+    @property
+    def row_value_keys(self):
+        """Keys the page ETag reads from .values() rows (see FastListMixin)."""
+        return ('pk', self.etag_field)
+
+    def get_etag_queryset(self):
+        """Rows the ETag covers; override to drop annotations that do not affect it."""
+        return self.get_queryset()
+
+    def make_etag(self, *parts):
+        """ETag over `parts` (what the rows are and how they are shown) and the request's representation."""
+        parts = [self.basename, *parts, getattr(self.request, 'accepted_media_type', '')]
+        if self.etag_pdpa:
+            parts.append('unmasked' if can_view_unmasked(self.request) else 'masked')
+        return '"%s"' % hashlib.sha1('\0'.join(map(str, parts)).encode()).hexdigest()
+
+    def compute_etag(self, queryset, *extra):
+        """ETag of all of `queryset`'s rows (unpaginated lists): COUNT and MAX(etag_field)."""
+        stats = queryset.order_by().aggregate(count=Count('pk'), latest=Max(self.etag_field))
+        return self.make_etag(*extra, stats['count'], stats['latest'].isoformat() if stats['latest'] else '')
+
+    def page_etag(self, page):
+        """ETag of a page of model instances or .values() rows, and of its links."""
+        parts = [self.request.build_absolute_uri(), self.paginator.get_next_link(), self.paginator.get_previous_link()]
+        for row in page:
+            if isinstance(row, dict):
+                pk, modified = row['pk'], row[self.etag_field]
+            else:
+                pk, modified = row.pk, getattr(row, self.etag_field)
+            parts.append(f"{pk}@{modified.isoformat() if modified else ''}")
+        return self.make_etag('page', *parts)
+
+    def instance_etag(self, instance):
+        modified = getattr(instance, self.etag_field)
+        return self.make_etag('detail', 1, modified.isoformat() if modified else '')
+
+    def _object_queryset(self, queryset):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+    def object_etag(self):
+        """ETag of the requested row in one query; None if there is no such row (or the id is malformed)."""
+        try:
+            stats = self._object_queryset(self.get_etag_queryset()).order_by().aggregate(
+                count=Count('pk'), latest=Max(self.etag_field)
+            )
+        except (ValueError, ValidationError):
+            return None
+        if not stats['count']:
+            return None
+        return self.make_etag('detail', stats['count'], stats['latest'].isoformat() if stats['latest'] else '')
+
+    def get_object(self):
+        obj = super().get_object()
+        # retrieve's ETag, without querying the row again
+        self._etag_object = obj
+        return obj
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and self.action == 'list' and self.conditional_get:
+            self._page_etag = self.page_etag(page)
+            if etag_matches(self._page_etag, self.request.headers.get('If-None-Match')):
+                raise NotModified
+        return page
+
+    def list(self, request, *args, **kwargs):
+        if not self.conditional_get:
+            return super().list(request, *args, **kwargs)
+        if self.paginator is None:
+            etag = self.compute_etag(self.filter_queryset(self.get_etag_queryset()), request.build_absolute_uri())
+            if etag_matches(etag, request.headers.get('If-None-Match')):
+                response = HttpResponseNotModified()
+            else:
+                response = super().list(request, *args, **kwargs)
+        else:
+            self._page_etag = None
+            try:
+                response = super().list(request, *args, **kwargs)
+            except NotModified:
+                response = HttpResponseNotModified()
+            etag = self._page_etag
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if_none_match = request.headers.get('If-None-Match')
+        if self.conditional_get and if_none_match:
+            etag = self.object_etag()
+            if etag_matches(etag, if_none_match):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+        self._etag_object = None
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == 200 and self._etag_object is not None:
+            response['ETag'] = self.instance_etag(self._etag_object)
+        return response
+
+    def update(self, request, *args, **kwargs):
+        if_match = request.headers.get('If-Match')
+        if if_match is None:
+            response = super().update(request, *args, **kwargs)
+        else:
+            with db_transaction.atomic():
+                # Lock the row so no other write lands between the comparison and this one
+                locked = self._object_queryset(self.get_queryset().model._default_manager.select_for_update())
+                try:
+                    list(locked.values_list('pk', flat=True))
+                except (ValueError, ValidationError):
+                    pass  # Malformed id: the update below answers 404
+                current = self.object_etag()
+                if current is not None and not etag_matches(current, if_match):
+                    return Response(
+                        {"error": "The resource changed since it was read; fetch it again"},
+                        status=412, headers={'ETag': current},
+                    )
+                response = super().update(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = self.object_etag()
+        return response
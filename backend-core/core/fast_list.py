@@ -0,0 +1,189 @@
+"""
+Fast list rendering: rows straight from `.values()` instead of model
+instances through ModelSerializer.
+
+For each serializer class a row plan is compiled once: (output key, values()
+key, converter) per field, where every converter reproduces exactly what the
+DRF field's to_representation would return. Per request the plan is bound
+(current timezone, PDPA role resolved once) and applied to plain dicts, and
+the page is rendered with ORJSONRenderer. Output is byte-identical to the
+serializer path, including `?fields=` sparse fieldsets; any serializer
+field without a known converter disables the fast path for that view.
+"""
+import decimal
+from django.conf import settings
+from django.db import models
+from rest_framework import relations, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+from .renderers import ORJSONRenderer
+from .serializers import PDPAMaskingField, can_view_unmasked, mask_string, requested_fields
+
+# Placeholders resolved per request by bind_plan()
+MASKED = 'masked'
+DATETIME = 'datetime'
+
+_plans = {}
+
+
+def _iso_format(field, setting):
+    output_format = getattr(field, 'format', setting)
+    return output_format is not None and output_format.lower() == ISO_8601
+
+
+def _decimal_converter(field):
+    # Same as DecimalField.quantize, with the exponent and context built once
+    if field.decimal_places is None:
+        return '{:f}'.format
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def _choice_converter(field):
+    mapping = field.choice_strings_to_values
+
+    def convert(value):
+        if value == '':
+            return value
+        return mapping.get(str(value), value)
+    return convert
+
+
+def _date_converter(value):
+    return value.isoformat()
+
+
+def _converter(field):
+    """Converter equivalent to field.to_representation, or None if unsupported."""
+    if isinstance(field, PDPAMaskingField):
+        return MASKED
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        return None if field.pk_field is not None else (lambda value: value)
+    if isinstance(field, serializers.UUIDField):
+        return str if field.uuid_format == 'hex_verbose' else None
+    if isinstance(field, serializers.DateTimeField):
+        return DATETIME if _iso_format(field, api_settings.DATETIME_FORMAT) else None
+    if isinstance(field, serializers.DateField):
+        return _date_converter if _iso_format(field, api_settings.DATE_FORMAT) else None
+    if isinstance(field, serializers.DecimalField):
+        coerce = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        return _decimal_converter(field) if coerce and not field.localize else None
+    if isinstance(field, serializers.ChoiceField):
+        return _choice_converter(field)
+    if isinstance(field, serializers.BooleanField):
+        return bool
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if type(field) in (serializers.CharField, serializers.EmailField, serializers.SlugField):
+        return str
+    return None
+
+
+def compile_plan(serializer_class):
+    """
+    [(output key, values() key, converter), ...] for `serializer_class`, or
+    None if any field cannot be rendered without the serializer. Cached.
+    """
+    if serializer_class in _plans:
+        return _plans[serializer_class]
+
+    serializer = serializer_class()
+    model = serializer.Meta.model
+    plan = []
+    for field in serializer._readable_fields:
+        converter = _converter(field)
+        if converter is None or '.' in field.source or field.source == '*':
+            plan = None
+            break
+        try:
+            model_field = model._meta.get_field(field.source)
+        except Exception:
+            plan = None
+            break
+        if not model_field.concrete or model_field.many_to_many:
+            plan = None
+            break
+        # values() returns the raw id for a foreign key under its attname
+        key = model_field.attname if isinstance(model_field, models.ForeignKey) else field.source
+        plan.append((field.field_name, key, converter))
+
+    _plans[serializer_class] = plan
+    return plan
+
+
+def bind_plan(plan, request, fields=None):
+    """Resolve per-request converters: PDPA role and current timezone; keep only `fields` if given."""
+    unmasked = can_view_unmasked(request)
+    tz = serializers.DateTimeField().default_timezone()
+
+    def convert_datetime(value):
+        if tz is not None:
+            value = value.astimezone(tz)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    bound = []
+    for name, key, converter in plan:
+        if fields is not None and name not in fields:
+            continue
+        if converter == MASKED:
+            converter = str if unmasked else mask_string
+        elif converter == DATETIME:
+            converter = convert_datetime
+        bound.append((name, key, converter))
+    return bound
+
+
+def render_rows(rows, bound_plan):
+    names = [name for name, _, _ in bound_plan]
+    getters = [(key, converter) for _, key, converter in bound_plan]
+    return [
+        dict(zip(names, [None if (value := row[key]) is None else converter(value) for key, converter in getters]))
+        for row in rows
+    ]
+
+
+class FastListMixin:
+    """
+    ViewSet mixin: list() renders from .values() with the compiled row plan
+    when FAST_LIST_RENDERING is on and the serializer is fully supported;
+    otherwise (and for every other action) the serializer is used as usual.
+    Lists accept `?fields=a,b,c` on both paths; the serializer must use
+    SparseFieldsMixin.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'list':
+            fields = requested_fields(self.request)
+            if fields is not None:
+                kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        plan = compile_plan(self.get_serializer_class()) if settings.FAST_LIST_RENDERING else None
+        if plan is None or type(request.accepted_renderer) is not JSONRenderer:
+            return super().list(request, *args, **kwargs)
+
+        bound = bind_plan(plan, request, requested_fields(request))
+        keys = {key for _, key, _ in bound}
+        # The keyset paginator reads its position from the row dicts, ConditionalMixin its page ETag
+        keys.update(field.lstrip('-') for field in getattr(self, 'ordering', None) or ())
+        keys.update(getattr(self, 'row_value_keys', ()))
+        queryset = self.filter_queryset(self.get_queryset()).values(*keys)
+
+        page = self.paginate_queryset(queryset)
+        data = render_rows(page if page is not None else queryset, bound)
+        request.accepted_renderer = ORJSONRenderer()
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,229 @@
+"""
+Request metrics: per-route latency, DB and response-size histograms kept in
+process memory, exposed in the Prometheus text format at /metrics together
+with the Celery task metrics (core.task_metrics).
+
+core.middleware.PerformanceMiddleware feeds the registry; code inside a
+request can add its own Server-Timing entry with `timed()`:
+
+    with timed('storage'):
+        url = client.generate_presigned_url(...)
+
+The registry is per process. Under several workers each scrape sees the
+worker that answered it, so scrape every worker (or run one per pod).
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# RequestStats of the request being handled (set by the middleware), for timed()
+current_request_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """
+    Timings for one request. Called as an execute wrapper for each of the
+    request's queries (core.middleware.record_queries), so every query is
+    counted and timed; with `capture_sql` the statements are kept too (up
+    to `max_queries`) for the slow-request log.
+    """
+
+    __slots__ = ('queries', 'db_time', 'spans', 'sql', 'max_queries')
+
+    def __init__(self, capture_sql=False, max_queries=100):
+        self.queries = 0
+        self.db_time = 0.0
+        self.spans = {}
+        self.sql = [] if capture_sql else None
+        self.max_queries = max_queries
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.sql is not None and len(self.sql) < self.max_queries:
+                self.sql.append((elapsed, sql))
+
+    def add_span(self, name, elapsed):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + elapsed, count + 1)
+
+    def server_timing(self, total):
+        """Server-Timing header value; `app` is whatever is not DB or a named span."""
+        app = total - self.db_time
+        spans = ''
+        for name, (elapsed, count) in self.spans.items():
+            app -= elapsed
+            spans += f'{name};dur={elapsed * 1000:.1f};desc="{count}x", '
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", {spans}'
+            f'app;dur={max(app, 0) * 1000:.1f}, total;dur={total * 1000:.1f}'
+        )
+
+
+@contextmanager
+def timed(name):
+    """Time a block as a Server-Timing entry of the current request (no-op outside one)."""
+    stats = current_request_stats.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_span(name, time.perf_counter() - started)
+
+
+class _Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class _RouteMetrics:
+    __slots__ = ('duration', 'queries', 'size', 'db_time', 'statuses')
+
+    def __init__(self):
+        self.duration = _Histogram(DURATION_BUCKETS)
+        self.queries = _Histogram(QUERY_BUCKETS)
+        self.size = _Histogram(SIZE_BUCKETS)
+        self.db_time = 0.0
+        self.statuses = {}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, status, elapsed, stats, size):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = _RouteMetrics()
+            metrics.duration.observe(elapsed)
+            metrics.queries.observe(stats.queries)
+            metrics.db_time += stats.db_time
+            if size is not None:
+                metrics.size.observe(size)
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+
+            lines += ['# HELP http_requests_total Requests handled, by route and status.', '# TYPE http_requests_total counter']
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append(f'http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+
+            for name, attribute, help_text in (
+                ('http_request_duration_seconds', 'duration', 'Time to produce the response.'),
+                ('http_request_db_queries', 'queries', 'Database queries per request.'),
+                ('http_response_size_bytes', 'size', 'Response body size (non-streaming responses).'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (method, route), metrics in routes:
+                    lines += _histogram_lines(name, _labels(method, route), getattr(metrics, attribute))
+
+            lines += ['# HELP http_request_db_seconds_total Time spent in database queries.', '# TYPE http_request_db_seconds_total counter']
+            for (method, route), metrics in routes:
+                lines.append(f'http_request_db_seconds_total{{{_labels(method, route)}}} {metrics.db_time:.6f}')
+
+        from core.services.storage import presigned_url_cache
+        lines += [
+            '# HELP presigned_url_cache_requests_total Presigned GET URL cache lookups.',
+            '# TYPE presigned_url_cache_requests_total counter',
+            f'presigned_url_cache_requests_total{{result="hit"}} {presigned_url_cache.hits}',
+            f'presigned_url_cache_requests_total{{result="miss"}} {presigned_url_cache.misses}',
+        ]
+        from core.response_cache import response_cache
+        lines += [
+            '# HELP response_cache_requests_total Cached GET responses served from the process LRU, the shared cache, or rebuilt.',
+            '# TYPE response_cache_requests_total counter',
+        ]
+        for cache_name, counts in sorted(response_cache.counts.items()):
+            lines += [f'response_cache_requests_total{{cache="{cache_name}",result="{result}"}} {count}' for result, count in counts.items()]
+        text = '\n'.join(lines) + '\n'
+        if settings.TASK_METRICS_ENABLED:
+            from core.task_metrics import render_prometheus
+            text += render_prometheus()
+        return text
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(method, route):
+    return f'method="{method}",route="{_escape(route)}"'
+
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.total}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+registry = MetricsRegistry()
+
+_route_labels = {}
+_NAMED_GROUP = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+
+
+def route_label(request):
+    """
+    The URL pattern that matched, with named groups shown as {name}
+    (e.g. api/v1/clinic/patients/{pk}/chart/), so label cardinality is
+    bounded by the URLconf rather than by ids.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    route = match.route
+    label = _route_labels.get(route)
+    if label is None:
+        label = _route_labels[route] = _NAMED_GROUP.sub(r'{\1}', route).replace('^', '').replace('$', '')
+    return label
+
+
+def metrics_view(request):
+    """GET /metrics. When METRICS_TOKEN is set, requires `Authorization: Bearer <token>`."""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return JsonResponse({"error": "Invalid or missing metrics token"}, status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
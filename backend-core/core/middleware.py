@@ -0,0 +1,112 @@
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from .metrics import RequestStats, current_request_stats, registry, route_label
+
+slow_request_logger = logging.getLogger('core.slow_requests')
+
+
+def record_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection: passes each query to the
+    RequestStats of the request being handled, if any. Found through the
+    context variable rather than installed per request, because under ASGI
+    the ORM runs in a different thread (with its own connection) from the
+    middleware; asgiref carries the context across.
+    """
+    stats = current_request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+class PerformanceMiddleware:
+    """
+    Times every request and records per-route latency, DB query count/time
+    and response size in core.metrics.registry.
+
+    * SERVER_TIMING adds a `Server-Timing` header (db, named spans, app, total),
+      shown per request in the browser's network panel.
+    * SLOW_REQUEST_MS logs requests at or above the threshold to the
+      `core.slow_requests` logger together with their SQL, slowest first.
+
+    Place it first in MIDDLEWARE so the timings cover the whole stack. It is
+    sync and async capable, so under ASGI it does not force the rest of the
+    stack (and async views) onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.server_timing = settings.SERVER_TIMING
+        self.slow_ms = settings.SLOW_REQUEST_MS
+        self.max_queries = settings.SLOW_REQUEST_MAX_QUERIES
+
+        connection_created.connect(install_query_recorder, dispatch_uid='core.middleware.install_query_recorder')
+        # Connections opened before this middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats(capture_sql=self.slow_ms is not None, max_queries=self.max_queries)
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+        return self._record(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = RequestStats(capture_sql=self.slow_ms is not None, max_queries=self.max_queries)
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+        return self._record(request, response, stats, time.perf_counter() - started)
+
+    def _record(self, request, response, stats, elapsed):
+        route = route_label(request)
+        # CommonMiddleware has already set Content-Length on non-streaming responses
+        size = response.get('Content-Length')
+        if size is not None:
+            size = int(size)
+        elif not response.streaming:
+            size = len(response.content)
+        registry.observe(request.method, route, response.status_code, elapsed, stats, size)
+
+        if self.server_timing:
+            response['Server-Timing'] = stats.server_timing(elapsed)
+        if self.slow_ms is not None and elapsed * 1000 >= self.slow_ms:
+            self._log_slow(request, route, response, elapsed, stats)
+        return response
+
+    def _log_slow(self, request, route, response, elapsed, stats):
+        statements = '\n'.join(
+            f"  {duration * 1000:8.1f} ms  {sql}" for duration, sql in sorted(stats.sql, key=lambda item: -item[0])
+        )
+        omitted = stats.queries - len(stats.sql)
+        if omitted > 0:
+            statements += f"\n  ... {omitted} more"
+        slow_request_logger.warning(
+            f"Slow request {request.method} {request.get_full_path()} ({route}) -> {response.status_code}: "
+            f"{elapsed * 1000:.1f} ms, {stats.queries} queries in {stats.db_time * 1000:.1f} ms\n{statements}"
+        )
@@ -0,0 +1,145 @@
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a compound, unique ordering (e.g. created_at, id).
+
+    DRF's CursorPagination only seeks on the first ordering field and falls
+    back to OFFSET for ties. Here the cursor stores the full ordering tuple,
+    so every page is a single indexed range scan:
+        WHERE (created_at, id) < (:created_at, :id) ORDER BY ... LIMIT n
+    and page 10,000 costs the same as page one.
+
+    Views choose their ordering with an `ordering` attribute. The last field
+    should be unique (usually the primary key) to make positions unique.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Same flow as CursorPagination.paginate_queryset, minus the offset
+        # handling: positions are unique, so a cursor is just a position.
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(
+                field[1:] if field.startswith('-') else '-' + field for field in ordering
+            )
+        queryset = queryset.order_by(*ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self._keyset_filter(queryset.model, ordering, current_position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _keyset_filter(self, model, ordering, position):
+        """
+        Build the row-value comparison "rows strictly after `position`" as a
+        chain of ORs, which every backend can serve from the composite index.
+        Cursors come from the client: values that do not parse as their
+        ordering field are an invalid cursor (404), not a database error.
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except FieldDoesNotExist:
+                pass  # A lookup across a relation: left to the database
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            condition |= equal & Q(**{name + lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            attr = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(attr if attr is None else str(attr))
+        # json.dumps escapes non-ASCII, which the base64 cursor encoding needs.
+        return json.dumps(values, separators=(',', ':'))
+
+    def get_paginated_response(self, data):
+        next_link = self.get_next_link()
+        previous_link = self.get_previous_link()
+        links = []
+        if next_link:
+            links.append(f'<{next_link}>; rel="next"')
+        if previous_link:
+            links.append(f'<{previous_link}>; rel="prev"')
+
+        headers = {'Link': ', '.join(links)} if links else None
+        return Response({
+            'next': next_link,
+            'previous': previous_link,
+            'results': data,
+        }, headers=headers)
@@ -0,0 +1,199 @@
+"""
+Server-side cache of rendered GET responses for hot, rarely changing reads
+(product catalogue, course list, patient detail).
+
+Entries live in the shared cache (Redis, CACHES['default']) with a small
+per-process LRU in front, so a hit costs one tiny Redis GET for the
+generations and no database query or serializer work. Each key carries
+the current generation of everything the response depends on (e.g.
+"product", "patient:<id>"); post_save/post_delete signals bump those
+generations after commit, which orphans every stale entry at once instead
+of deleting keys one by one.
+
+Responses that depend on the PDPA role are cached per role. A shared cache
+that cannot be reached is treated as a miss. The ETag the view sent is kept
+with the body, so a hit also answers If-None-Match (304) without touching
+the database.
+"""
+import functools
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction as db_transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from .conditional import etag_matches
+from .serializers import can_view_unmasked
+
+logger = logging.getLogger(__name__)
+
+GENERATION_PREFIX = 'gen:'
+RESULTS = ('local_hit', 'shared_hit', 'miss')
+
+
+def _shared():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _new_generation():
+    # Time-based, so a generation lost from Redis never comes back with an old value
+    return time.time_ns() // 1000
+
+
+def generations(names):
+    """Current generation of each name, creating missing ones."""
+    keys = [GENERATION_PREFIX + name for name in names]
+    shared = _shared()
+    found = shared.get_many(keys)
+    for key in keys:
+        if key not in found:
+            shared.add(key, _new_generation(), timeout=None)
+            found[key] = shared.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*names):
+    """Invalidate every cached response depending on `names`, once the current DB transaction commits."""
+    def run():
+        shared = _shared()
+        for name in names:
+            try:
+                try:
+                    shared.incr(GENERATION_PREFIX + name)
+                except ValueError:
+                    shared.set(GENERATION_PREFIX + name, _new_generation(), timeout=None)
+            except Exception:
+                logger.exception("Could not bump response cache generation %s", name)
+        response_cache.discard_local()
+    db_transaction.on_commit(run)
+
+
+class ResponseCache:
+    """
+    Two-tier cache of (content type, body, ETag): a thread-safe, size-bounded LRU
+    per process in front of the shared cache. Counts hits and misses per
+    cache name.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def _count(self, name, result):
+        with self._lock:
+            counts = self.counts.setdefault(name, dict.fromkeys(RESULTS, 0))
+            counts[result] += 1
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, name, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            self._count(name, 'local_hit')
+            return entry
+
+        try:
+            entry = _shared().get(key)
+        except Exception:
+            logger.exception("Response cache unavailable")
+            entry = None
+        if entry is None:
+            self._count(name, 'miss')
+            return None
+        self._remember(key, entry)
+        self._count(name, 'shared_hit')
+        return entry
+
+    def set(self, key, entry, timeout):
+        self._remember(key, entry)
+        try:
+            _shared().set(key, entry, timeout)
+        except Exception:
+            logger.exception("Response cache unavailable")
+
+    def discard_local(self):
+        # Entries under old generations are unreachable anyway; free them early
+        with self._lock:
+            self._entries.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.counts = {}
+
+
+response_cache = ResponseCache(maxsize=getattr(settings, 'RESPONSE_CACHE_LOCAL_SIZE', 1000))
+
+
+def cached_response(name, depends_on, pdpa=False):
+    """
+    Cache the rendered JSON of a DRF view method's 200 responses.
+
+    `depends_on` lists generation names, formatted with the URL kwargs
+    (e.g. 'course:{pk}'), or callables taking the URL kwargs; a ValueError
+    from one skips the cache for that request. The key also covers the
+    full URL (query string, and host for pagination links) and, with
+    `pdpa`, the caller's masking role. Other renderers (browsable API)
+    bypass the cache.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not settings.RESPONSE_CACHE_ENABLED or request.accepted_renderer.format != 'json':
+                return method(self, request, *args, **kwargs)
+            try:
+                names = [
+                    dependency(**kwargs) if callable(dependency) else dependency.format(**kwargs)
+                    for dependency in depends_on
+                ]
+            except ValueError:
+                return method(self, request, *args, **kwargs)
+            try:
+                versions = generations(names)
+            except Exception:
+                logger.exception("Response cache unavailable")
+                return method(self, request, *args, **kwargs)
+
+            parts = [request.build_absolute_uri(), *map(str, versions)]
+            if pdpa:
+                parts.append('unmasked' if can_view_unmasked(request) else 'masked')
+            # v2: entries carry the ETag
+            key = f"response:v2:{name}:{hashlib.sha256(chr(0).join(parts).encode()).hexdigest()}"
+
+            entry = response_cache.get(name, key)
+            if entry is not None:
+                content_type, content, etag = entry
+                if etag_matches(etag, request.headers.get('If-None-Match')):
+                    response = HttpResponseNotModified()
+                else:
+                    response = HttpResponse(content, content_type=content_type)
+                if etag:
+                    response['ETag'] = etag
+                response['X-Cache'] = 'hit'
+                return response
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response['X-Cache'] = 'miss'
+                response.add_post_render_callback(
+                    lambda rendered: response_cache.set(
+                        key, (rendered['Content-Type'], rendered.content, rendered.get('ETag')),
+                        settings.RESPONSE_CACHE_TTL,
+                    )
+                )
+            return response
+        return wrapper
+    return decorator
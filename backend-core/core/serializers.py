@@ -1,5 +1,32 @@
 from rest_framework import serializers
 
+def can_view_unmasked(request):
+    """True if the requesting user's role (DOCTOR or ADMIN) may see PDPA data unmasked."""
+    # If no request context or user not authenticated, mask it
+    if not request or not request.user.is_authenticated:
+        return False
+
+    try:
+        # Check if profile exists safely
+        if hasattr(request.user, 'profile'):
+            return request.user.profile.role in ['DOCTOR', 'ADMIN']
+    except Exception:
+        # Fallback if profile access fails
+        pass
+    return False
+
+
+def mask_string(value):
+    if not value or len(value) < 6:
+        return "*****" # Fallback for short strings
+
+    # Mask logic: Keep first 3 and last 4. Mask the middle.
+    # e.g. 081-234-5678 -> 081-XXX-5678
+    prefix = value[:3]
+    suffix = value[-4:]
+    return f"{prefix}-XXX-{suffix}"
+
+
 class PDPAMaskingField(serializers.CharField):
     """
     Custom DRF Field that masks data based on User Role.
@@ -7,33 +34,35 @@ class PDPAMaskingField(serializers.CharField):
     - If User is DOCTOR or ADMIN: Show full data.
     - Else: Mask middle characters.
     """
-    
+
     def to_representation(self, value):
         # value is the actual string from the DB (e.g., "0812345678")
-        request = self.context.get('request')
-        
-        # If no request context or user not authenticated, mask it
-        if not request or not request.user.is_authenticated:
-            return self.mask_string(value)
-            
-        try:
-            # Check if profile exists safely
-            if hasattr(request.user, 'profile'):
-                user_role = request.user.profile.role
-                if user_role in ['DOCTOR', 'ADMIN']:
-                    return value
-        except Exception:
-            # Fallback if profile access fails
-            pass
-        
+        if can_view_unmasked(self.context.get('request')):
+            return value
         return self.mask_string(value)
 
     def mask_string(self, value):
-        if not value or len(value) < 6:
-            return "*****" # Fallback for short strings
-            
-        # Mask logic: Keep first 3 and last 4. Mask the middle.
-        # e.g. 081-234-5678 -> 081-XXX-5678
-        prefix = value[:3]
-        suffix = value[-4:]
-        return f"{prefix}-XXX-{suffix}"
+        return mask_string(value)
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets: pass `fields=[...]` to keep only
+    those fields (unknown names are ignored). Views build the list from
+    `?fields=a,b,c` with `requested_fields()`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    """Field names from `?fields=a,b,c`, or None when the parameter is absent."""
+    value = request.query_params.get('fields') if request else None
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
@@ -1,38 +1,159 @@
+import math
 import boto3
+from asgiref.sync import sync_to_async
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from django.conf import settings
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import time
 import uuid
 import logging
+from core.metrics import timed
 
 logger = logging.getLogger(__name__)
 
+# Process-wide client pool. boto3 clients are thread-safe once built, but
+# building one costs milliseconds (endpoint/model loading), so each distinct
+# endpoint gets exactly one client for the life of the process.
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Threads for storage calls made from async views: as many as the clients have connections
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 50), thread_name_prefix='storage',
+)
+
+# (endpoint_url, bucket) -> (monotonic expiry, bucket usable)
+_verified_buckets = {}
+# Failed checks are cached briefly so an outage does not add a timeout to every request
+BUCKET_FAILURE_TTL = 10
+# S3 (and MinIO) reject multipart uploads with more parts than this
+MAX_UPLOAD_PARTS = 10000
+
+
+def _client_config():
+    return Config(
+        signature_version=settings.AWS_S3_SIGNATURE_VERSION,
+        max_pool_connections=getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 50),
+        connect_timeout=getattr(settings, 'AWS_S3_CONNECT_TIMEOUT', 2),
+        read_timeout=getattr(settings, 'AWS_S3_READ_TIMEOUT', 10),
+        retries={'max_attempts': 3, 'mode': 'standard'},
+    )
+
+
+def get_s3_client(endpoint_url):
+    """Return the shared S3 client for `endpoint_url`, creating it on first use."""
+    client = _clients.get(endpoint_url)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(endpoint_url)
+        if client is None:
+            # A private Session per client: boto3's default session is not thread-safe
+            client = boto3.session.Session().client(
+                's3',
+                endpoint_url=endpoint_url,
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                config=_client_config(),
+                region_name=settings.AWS_S3_REGION_NAME
+            )
+            _clients[endpoint_url] = client
+    return client
+
+
+class PresignedUrlCache:
+    """
+    Thread-safe, size-bounded LRU of presigned GET URLs.
+
+    An entry is served until `refresh_margin` seconds before the URL
+    expires, so every URL handed out is still valid for at least that long;
+    after that it is re-signed. The least recently used entry is evicted
+    once `maxsize` is reached. Hit/miss counters are kept for diagnostics.
+    """
+
+    def __init__(self, maxsize=10000, refresh_margin=300):
+        self.maxsize = maxsize
+        self.refresh_margin = refresh_margin
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_sign(self, cache_key, sign, expires_in):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] - self.refresh_margin > now:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Sign outside the lock; a concurrent duplicate signing is harmless
+        with timed('storage'):
+            url = sign()
+        with self._lock:
+            self._entries[cache_key] = (url, now + expires_in)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return url
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+presigned_url_cache = PresignedUrlCache(
+    maxsize=getattr(settings, 'PRESIGNED_URL_CACHE_SIZE', 10000),
+    refresh_margin=getattr(settings, 'PRESIGNED_URL_REFRESH_MARGIN', 300),
+)
+
+
+def reset_storage_clients():
+    """Drop pooled clients, bucket checks and cached URLs (settings changes, tests)."""
+    with _clients_lock:
+        _clients.clear()
+        _verified_buckets.clear()
+    presigned_url_cache.clear()
+
+
 class MinIOService:
-    def __init__(self, bucket_name=None):
-        # Internal client for backend operations (create bucket, etc.)
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            config=boto3.session.Config(signature_version=settings.AWS_S3_SIGNATURE_VERSION),
-            region_name=settings.AWS_S3_REGION_NAME
-        )
-        
-        # Public client specifically for generating presigned URLs accessible by the frontend
-        self.s3_public_client = boto3.client(
-            's3',
-            endpoint_url=settings.AWS_S3_PUBLIC_ENDPOINT_URL, # Use localhost:9000 here
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            config=boto3.session.Config(signature_version=settings.AWS_S3_SIGNATURE_VERSION),
-            region_name=settings.AWS_S3_REGION_NAME
-        )
+    def __init__(self, bucket_name=None, endpoint_url=None, public_endpoint_url=None):
+        # Endpoints default to settings; pass a local stand-in (e.g. a moto or
+        # MinIO server on localhost) to exercise the service offline.
+        self.endpoint_url = endpoint_url or settings.AWS_S3_ENDPOINT_URL
+        self.public_endpoint_url = public_endpoint_url or settings.AWS_S3_PUBLIC_ENDPOINT_URL
 
         # Default to clinic-images if not specified, but allow override for other modules
         self.bucket_name = bucket_name or 'aesthetix-uploads'
-        self._ensure_bucket_exists()
 
-    def _ensure_bucket_exists(self):
+    @property
+    def s3_client(self):
+        # Internal client for backend operations (create bucket, etc.)
+        return get_s3_client(self.endpoint_url)
+
+    @property
+    def s3_public_client(self):
+        # Public client specifically for generating presigned URLs accessible by the frontend
+        return get_s3_client(self.public_endpoint_url)
+
+    def ensure_bucket_exists(self):
+        """
+        Verify (or create) the bucket, at most once per
+        AWS_S3_BUCKET_CHECK_TTL seconds per process. Presigning does not
+        need this; call it from code paths that talk to storage.
+        """
+        key = (self.endpoint_url, self.bucket_name)
+        expires, ok = _verified_buckets.get(key, (0, False))
+        if expires > time.monotonic():
+            return ok
+
+        ok = True
         try:
             self.s3_client.head_bucket(Bucket=self.bucket_name)
         except ClientError:
@@ -41,35 +162,180 @@ class MinIOService:
                 logger.info(f"Created bucket: {self.bucket_name}")
             except Exception as e:
                 logger.error(f"Error creating bucket {self.bucket_name}: {e}")
+                ok = False
+        except Exception as e:
+            logger.error(f"Storage endpoint unavailable for bucket {self.bucket_name}: {e}")
+            ok = False
+
+        ttl = getattr(settings, 'AWS_S3_BUCKET_CHECK_TTL', 300) if ok else BUCKET_FAILURE_TTL
+        _verified_buckets[key] = (time.monotonic() + ttl, ok)
+        return ok
+
+    async def aensure_bucket_exists(self):
+        """
+        ensure_bucket_exists() for async views: answered from the per-process
+        check when it is fresh, otherwise the storage round trip runs on the
+        storage thread pool rather than on the event loop.
+        """
+        expires, ok = _verified_buckets.get((self.endpoint_url, self.bucket_name), (0, False))
+        if expires > time.monotonic():
+            return ok
+        return await sync_to_async(self.ensure_bucket_exists, thread_sensitive=False, executor=_executor)()
 
     def generate_presigned_url(self, file_extension='jpg', content_type=None, folder='uploads'):
         """
         Generates a Presigned URL for the client to upload directly.
+        Signing is local (HMAC only); no network call is made.
         Returns:
             - upload_url: The full URL to PUT the file to.
             - object_key: The key (path) to save in the database.
         """
         object_name = f"{folder}/{uuid.uuid4()}.{file_extension}"
-        
+
         # Default content type if not provided
         if not content_type:
             content_type = f'image/{file_extension}'
-        
+
         try:
             # Use the public client to generate the URL
             # This ensures the Host header signature matches what the browser sends (localhost:9000)
-            url = self.s3_public_client.generate_presigned_url(
-                'put_object',
-                Params={
-                    'Bucket': self.bucket_name,
-                    'Key': object_name,
-                    'ContentType': content_type
-                },
-                ExpiresIn=3600  # 1 hour
-            )
-            
+            with timed('storage'):
+                url = self.s3_public_client.generate_presigned_url(
+                    'put_object',
+                    Params={
+                        'Bucket': self.bucket_name,
+                        'Key': object_name,
+                        'ContentType': content_type
+                    },
+                    ExpiresIn=3600  # 1 hour
+                )
+
             return url, object_name
         except ClientError as e:
             logger.error(f"Error generating presigned URL: {e}")
             return None, None
 
+    def presigned_get_url(self, object_key, expires_in=None):
+        """
+        Presigned GET URL for viewing an object, served from the process-wide
+        LRU until shortly before it expires.
+        """
+        expires_in = expires_in or getattr(settings, 'PRESIGNED_GET_EXPIRES', 3600)
+        return presigned_url_cache.get_or_sign(
+            (self.public_endpoint_url, self.bucket_name, object_key),
+            lambda: self.s3_public_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket_name, 'Key': object_key},
+                ExpiresIn=expires_in
+            ),
+            expires_in,
+        )
+
+    def create_multipart_upload(self, size, file_extension='jpg', content_type=None, folder='uploads', part_size=None):
+        """
+        Start a multipart upload for a file of `size` bytes and presign a PUT
+        URL per part, so the client can upload parts in parallel and retry
+        any single part. Returns None if storage is unavailable.
+        Raises ValueError if the file needs more than MAX_UPLOAD_PARTS parts.
+        """
+        part_size = part_size or settings.UPLOAD_MULTIPART_PART_SIZE
+        part_count = max(math.ceil(size / part_size), 1)
+        if part_count > MAX_UPLOAD_PARTS:
+            raise ValueError(f"{size} bytes needs {part_count} parts; at most {MAX_UPLOAD_PARTS} are allowed")
+        object_name = f"{folder}/{uuid.uuid4()}.{file_extension}"
+        if not content_type:
+            content_type = f'image/{file_extension}'
+
+        try:
+            with timed('storage'):
+                upload = self.s3_client.create_multipart_upload(
+                    Bucket=self.bucket_name, Key=object_name, ContentType=content_type
+                )
+        except Exception as e:
+            logger.error(f"Error creating multipart upload: {e}")
+            return None
+
+        return {
+            'key': object_name,
+            'upload_id': upload['UploadId'],
+            'part_size': part_size,
+            'parts': self.presign_upload_parts(object_name, upload['UploadId'], range(1, part_count + 1)),
+        }
+
+    def presign_upload_parts(self, object_key, upload_id, part_numbers):
+        """Presign PUT URLs for the given part numbers (also used to resume)."""
+        with timed('storage'):
+            return [
+                {
+                    'part_number': part_number,
+                    'url': self.s3_public_client.generate_presigned_url(
+                        'upload_part',
+                        Params={
+                            'Bucket': self.bucket_name,
+                            'Key': object_key,
+                            'UploadId': upload_id,
+                            'PartNumber': part_number,
+                        },
+                        ExpiresIn=3600
+                    ),
+                }
+                for part_number in part_numbers
+            ]
+
+    def list_uploaded_parts(self, object_key, upload_id):
+        """Parts already stored for an in-progress upload: [{part_number, etag, size}]."""
+        parts = []
+        paginator = self.s3_client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket_name, Key=object_key, UploadId=upload_id):
+            parts.extend(
+                {'part_number': part['PartNumber'], 'etag': part['ETag'], 'size': part['Size']}
+                for part in page.get('Parts', [])
+            )
+        return parts
+
+    def complete_multipart_upload(self, object_key, upload_id, parts):
+        """parts: [{'part_number': 1, 'etag': '"..."'}, ...]"""
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=object_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': int(part['part_number']), 'ETag': part['etag']}
+                for part in sorted(parts, key=lambda part: int(part['part_number']))
+            ]},
+        )
+
+    def abort_multipart_upload(self, object_key, upload_id):
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=object_key, UploadId=upload_id)
+
+    def download_fileobj(self, object_key, fileobj):
+        """Stream an object into `fileobj` in chunks (no full read into memory)."""
+        self.s3_client.download_fileobj(self.bucket_name, object_key, fileobj)
+        fileobj.seek(0)
+
+    def put_object(self, object_key, body, content_type):
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=object_key, Body=body, ContentType=content_type)
+
+    def object_exists(self, object_key):
+        try:
+            with timed('storage'):
+                self.s3_client.head_object(Bucket=self.bucket_name, Key=object_key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def missing_objects(self, object_keys):
+        """
+        Return the subset of `object_keys` not present in the bucket.
+        HEAD requests run concurrently on the pooled client.
+        """
+        object_keys = list(object_keys)
+        if not object_keys:
+            return []
+        workers = min(len(object_keys), getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 50), 16)
+        # Timed here: the worker threads do not see the request's timings
+        with timed('storage'), ThreadPoolExecutor(max_workers=workers) as executor:
+            exists = list(executor.map(self.object_exists, object_keys))
+        return [key for key, found in zip(object_keys, exists) if not found]
@@ -40,9 +40,12 @@ INSTALLED_APPS = [
     # Local Apps
     'clinic',
     'commerce',
+    'dashboard',
+    'core.telemetry',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',  # First, so timings cover the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Added CORS
@@ -87,6 +90,8 @@ if os.environ.get('POSTGRES_DB'):
             'PORT': os.environ.get('POSTGRES_PORT', '5432'),
         }
     }
+    # Trigram lookups/similarity used by patient search
+    INSTALLED_APPS.append('django.contrib.postgres')
 else:
     DATABASES = {
         'default': {
@@ -137,10 +142,73 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# --- REST FRAMEWORK CONFIGURATION ---
+REST_FRAMEWORK = {
+    # Keyset (cursor) pagination on every list endpoint; views set `ordering`.
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', '50')),
+}
+
+# List endpoints with FastListMixin render rows from .values() + orjson (same bytes as the serializers)
+FAST_LIST_RENDERING = os.environ.get('FAST_LIST_RENDERING', 'true').lower() == 'true'
+
+# --- REQUEST METRICS (core.middleware.PerformanceMiddleware, GET /metrics) ---
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # if set, /metrics requires "Authorization: Bearer <token>"
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'true').lower() == 'true'
+# Requests at or above this many ms are logged to `core.slow_requests` with their SQL; unset = off
+SLOW_REQUEST_MS = float(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None
+SLOW_REQUEST_MAX_QUERIES = 100  # statements kept per slow request
+
+# --- PATIENT IMPORT (clinic.importer) ---
+PATIENT_IMPORT_CHUNK_SIZE = 2000  # rows validated/deduped/committed together
+PATIENT_IMPORT_BATCH_SIZE = 500  # rows per INSERT
+
+# --- RESPONSE CACHE (core.response_cache) ---
+# Shared cache for rendered responses; without CACHE_URL each process keeps its own
+CACHE_URL = os.environ.get('CACHE_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+# Off by default without CACHE_URL: a save only bumps the generation in its own process,
+# so other workers would serve stale responses until RESPONSE_CACHE_TTL
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true' if CACHE_URL else 'false').lower() == 'true'
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '3600'))  # seconds; entries are invalidated by generation anyway
+RESPONSE_CACHE_LOCAL_SIZE = 1000  # responses kept per process in front of the shared cache
+
+# --- EXPORTS (commerce.exports) ---
+EXPORT_CHUNK_SIZE = 2000  # rows fetched per cursor round-trip and flushed to the client together
+
+# --- FACE CHART STORAGE (clinic.face_chart) ---
+FACE_CHART_SCALE = 10  # coordinates stored to 1/10 px
+FACE_CHART_TOLERANCE = float(os.environ.get('FACE_CHART_TOLERANCE', '0.5'))  # px, stroke simplification
+# Store charts as deltas against the patient's previous chart (unchanged strokes are referenced)
+FACE_CHART_DELTAS = os.environ.get('FACE_CHART_DELTAS', 'false').lower() == 'true'
+FACE_CHART_MAX_DELTA_DEPTH = 8
+
 # --- CELERY CONFIGURATION ---
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+# `tasks` is not a Django app, so autodiscovery does not find it
+CELERY_IMPORTS = ('tasks.commission_tasks', 'tasks.image_tasks')
+# Task lag/run-time/outcome telemetry (core.task_metrics), shared by workers through Redis;
+# empty TASK_METRICS_URL keeps it in process
+TASK_METRICS_ENABLED = os.environ.get('TASK_METRICS_ENABLED', 'true').lower() == 'true'
+TASK_METRICS_URL = os.environ.get(
+    'TASK_METRICS_URL', CELERY_BROKER_URL if CELERY_BROKER_URL.startswith(('redis://', 'rediss://')) else ''
+)
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-commission-outbox': {
+        'task': 'tasks.commission_tasks.dispatch_commission_outbox',
+        'schedule': float(os.environ.get('COMMISSION_DISPATCH_INTERVAL', '5')),
+    },
+}
 
 # --- MINIO / S3 CONFIGURATION ---
 AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID', 'minioadmin')
@@ -149,6 +217,28 @@ AWS_S3_ENDPOINT_URL = os.environ.get('AWS_S3_ENDPOINT_URL', 'http://localhost:90
 AWS_S3_PUBLIC_ENDPOINT_URL = os.environ.get('AWS_S3_PUBLIC_ENDPOINT_URL', 'http://localhost:9000')
 AWS_S3_SIGNATURE_VERSION = 's3v4'
 AWS_S3_REGION_NAME = 'us-east-1'  # MinIO dummy region
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_S3_MAX_POOL_CONNECTIONS', '50'))
+AWS_S3_CONNECT_TIMEOUT = float(os.environ.get('AWS_S3_CONNECT_TIMEOUT', '2'))
+AWS_S3_READ_TIMEOUT = float(os.environ.get('AWS_S3_READ_TIMEOUT', '10'))
+AWS_S3_BUCKET_CHECK_TTL = int(os.environ.get('AWS_S3_BUCKET_CHECK_TTL', '300'))  # seconds
+
+# --- CLINICAL IMAGE UPLOADS ---
+# Files above the threshold are uploaded as parallel, resumable multipart parts
+UPLOAD_MULTIPART_THRESHOLD = int(os.environ.get('UPLOAD_MULTIPART_THRESHOLD', str(16 * 1024 * 1024)))
+UPLOAD_MULTIPART_PART_SIZE = int(os.environ.get('UPLOAD_MULTIPART_PART_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_BATCH_MAX_FILES = 50
+# Larger files are rejected with 400 (the part size also caps it at 10,000 parts)
+UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', str(1024 * 1024 * 1024)))
+# Presigned GET URLs for viewing images, cached per process
+PRESIGNED_GET_EXPIRES = int(os.environ.get('PRESIGNED_GET_EXPIRES', '3600'))  # seconds
+PRESIGNED_URL_REFRESH_MARGIN = 300  # re-sign when less than this remains
+PRESIGNED_URL_CACHE_SIZE = int(os.environ.get('PRESIGNED_URL_CACHE_SIZE', '10000'))
+# Derivatives generated after confirm-upload: longest edge in px x format
+IMAGE_DERIVATIVE_WIDTHS = (256, 1024)
+IMAGE_DERIVATIVE_FORMATS = ('jpeg', 'webp')
+IMAGE_DERIVATIVE_QUALITY = 80
+# Originals up to this size are buffered in memory, larger ones spill to disk
+IMAGE_DERIVATIVE_SPOOL_SIZE = 8 * 1024 * 1024
 
 # --- CORS CONFIGURATION ---
 CORS_ALLOW_ALL_ORIGINS = True  # Development only
@@ -0,0 +1,235 @@
+"""
+Celery task telemetry, recorded from signals for every task:
+
+* queue lag: publish (or ETA) to start of execution,
+* run time,
+* outcome per run (SUCCESS, FAILURE, RETRY, ...).
+
+Producers stamp an `enqueued_at` header on publish; workers record one
+entry per run. Runs happen in worker child processes, so the numbers go to
+a shared store: Redis hashes (TASK_METRICS_URL, the broker by default),
+one per task name, updated in a single pipeline per run. With
+TASK_METRICS_URL empty they stay in process (eager mode, tests).
+
+The web /metrics endpoint renders them next to the request metrics, and
+`manage.py celery_backlog` (core.telemetry) reports them with the queue depths. Lag uses
+wall clocks on two hosts, so it is only as good as their NTP sync.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from celery import signals
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+RUNTIME_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+KEY_PREFIX = 'task_metrics:'
+TASKS_KEY = KEY_PREFIX + 'tasks'
+ENQUEUED_AT_HEADER = 'enqueued_at'
+
+
+def _run_fields(lag, runtime, state):
+    """Hash field increments for one run."""
+    fields = {
+        f'runtime:{bisect_left(RUNTIME_BUCKETS, runtime)}': 1,
+        'runtime_sum': runtime,
+        f'outcome:{state}': 1,
+    }
+    if lag is not None:
+        fields[f'lag:{bisect_left(LAG_BUCKETS, lag)}'] = 1
+        fields['lag_sum'] = lag
+        fields['lag_count'] = 1
+    return fields
+
+
+class RedisStore:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def record(self, task_name, fields):
+        key = KEY_PREFIX + task_name
+        pipe = self.client.pipeline(transaction=False)
+        pipe.sadd(TASKS_KEY, task_name)
+        pipe.hsetnx(key, 'first_seen', time.time())
+        for field, amount in fields.items():
+            if isinstance(amount, float):
+                pipe.hincrbyfloat(key, field, amount)
+            else:
+                pipe.hincrby(key, field, amount)
+        pipe.execute()
+
+    def snapshot(self):
+        names = sorted(name.decode() for name in self.client.smembers(TASKS_KEY))
+        pipe = self.client.pipeline(transaction=False)
+        for name in names:
+            pipe.hgetall(KEY_PREFIX + name)
+        return {
+            name: {field.decode(): float(value) for field, value in raw.items()}
+            for name, raw in zip(names, pipe.execute())
+        }
+
+    def reset(self):
+        names = [name.decode() for name in self.client.smembers(TASKS_KEY)]
+        self.client.delete(TASKS_KEY, *(KEY_PREFIX + name for name in names))
+
+
+class MemoryStore:
+    def __init__(self):
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def record(self, task_name, fields):
+        with self._lock:
+            values = self._tasks.setdefault(task_name, {'first_seen': time.time()})
+            for field, amount in fields.items():
+                values[field] = values.get(field, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {field: float(value) for field, value in values.items()} for name, values in sorted(self._tasks.items())}
+
+    def reset(self):
+        with self._lock:
+            self._tasks.clear()
+
+
+_stores = {}
+
+
+def get_store():
+    url = settings.TASK_METRICS_URL
+    store = _stores.get(url)
+    if store is None:
+        store = _stores[url] = RedisStore(url) if url else MemoryStore()
+    return store
+
+
+def histogram(values, prefix, bounds):
+    """Per-bucket counts (last is +Inf) from a snapshot entry."""
+    return [int(values.get(f'{prefix}:{index}', 0)) for index in range(len(bounds) + 1)]
+
+
+def quantile(q, counts, bounds):
+    """Estimate a quantile from bucket counts, interpolating inside the bucket (as PromQL does)."""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            if index == len(bounds):
+                return bounds[-1]
+            lower = bounds[index - 1] if index else 0
+            return lower + (bounds[index] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return bounds[-1]
+
+
+def outcomes(values):
+    return {field.split(':', 1)[1]: int(count) for field, count in values.items() if field.startswith('outcome:')}
+
+
+# --- Signal handlers --------------------------------------------------------
+
+# task_id -> (perf_counter at start, queue lag) for runs in progress in this process
+_started = {}
+# Runs without a task_postrun (revoked with terminate, child killed) would stay in
+# _started forever; entries older than this are dropped on the next start.
+STARTED_MAX_AGE = 6 * 3600
+
+
+def _enabled():
+    return settings.TASK_METRICS_ENABLED
+
+
+@signals.before_task_publish.connect
+def _stamp_enqueued_at(headers=None, **kwargs):
+    if headers is not None and _enabled():
+        headers[ENQUEUED_AT_HEADER] = time.time()
+
+
+def _queue_lag(request):
+    enqueued_at = getattr(request, ENQUEUED_AT_HEADER, None)
+    if enqueued_at is None:
+        enqueued_at = (getattr(request, 'headers', None) or {}).get(ENQUEUED_AT_HEADER)
+    if enqueued_at is None:
+        return None
+    ready_at = float(enqueued_at)
+    if request.eta:
+        # Time spent waiting for a countdown/ETA is not queue lag
+        eta = request.eta if isinstance(request.eta, datetime) else datetime.fromisoformat(request.eta)
+        ready_at = max(ready_at, eta.timestamp())
+    return max(time.time() - ready_at, 0.0)
+
+
+@signals.task_prerun.connect
+def _task_started(task_id=None, task=None, **kwargs):
+    if not _enabled():
+        return
+    now = time.perf_counter()
+    for stale in [tid for tid, (started_at, _) in _started.items() if now - started_at > STARTED_MAX_AGE]:
+        del _started[stale]
+    _started[task_id] = (now, _queue_lag(task.request))
+
+
+@signals.task_postrun.connect
+def _task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is None:
+        return
+    runtime = time.perf_counter() - started[0]
+    try:
+        get_store().record(task.name, _run_fields(started[1], runtime, state or 'UNKNOWN'))
+    except Exception as e:
+        # Telemetry must never fail a task
+        logger.warning(f"Could not record metrics for task {task.name}: {e}")
+
+
+@signals.task_revoked.connect
+def _task_revoked(request=None, **kwargs):
+    # A revoked run gets no task_postrun. task_failure is left alone: task_postrun
+    # follows it and records the FAILURE outcome.
+    if request is not None:
+        _started.pop(request.id, None)
+
+
+# --- Prometheus exposition ------------------------------------------------------
+
+def _histogram_lines(name, task_name, counts, bounds, total):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(bounds + ('+Inf',), counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{task="{task_name}",le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{task="{task_name}"}} {total}')
+    lines.append(f'{name}_count{{task="{task_name}"}} {cumulative}')
+    return lines
+
+
+def render_prometheus():
+    """Task metrics in the Prometheus text format, or '' if the store is unavailable."""
+    try:
+        snapshot = get_store().snapshot()
+    except Exception as e:
+        logger.warning(f"Task metrics unavailable: {e}")
+        return ''
+
+    lines = ['# HELP celery_task_runs_total Task runs by outcome.', '# TYPE celery_task_runs_total counter']
+    for name, values in snapshot.items():
+        for state, count in sorted(outcomes(values).items()):
+            lines.append(f'celery_task_runs_total{{task="{name}",state="{state}"}} {count}')
+
+    lines += ['# HELP celery_task_queue_lag_seconds Publish (or ETA) to start of execution.', '# TYPE celery_task_queue_lag_seconds histogram']
+    for name, values in snapshot.items():
+        lines += _histogram_lines('celery_task_queue_lag_seconds', name, histogram(values, 'lag', LAG_BUCKETS), LAG_BUCKETS, values.get('lag_sum', 0.0))
+
+    lines += ['# HELP celery_task_runtime_seconds Task execution time.', '# TYPE celery_task_runtime_seconds histogram']
+    for name, values in snapshot.items():
+        lines += _histogram_lines('celery_task_runtime_seconds', name, histogram(values, 'runtime', RUNTIME_BUCKETS), RUNTIME_BUCKETS, values.get('runtime_sum', 0.0))
+    return '\n'.join(lines) + '\n'
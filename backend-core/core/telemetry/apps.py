@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class TelemetryConfig(AppConfig):
+    # Holds management commands for core's Celery telemetry. `core` itself is not
+    # an installed app: that would register the migration-less UserProfile model.
+    name = 'core.telemetry'
+    label = 'core_telemetry'
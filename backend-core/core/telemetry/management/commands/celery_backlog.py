@@ -0,0 +1,101 @@
+import time
+from django.core.management.base import BaseCommand
+from core.celery import app
+from core.task_metrics import LAG_BUCKETS, RUNTIME_BUCKETS, get_store, histogram, outcomes, quantile
+
+
+def _seconds(value):
+    if value is None:
+        return '-'
+    if value < 1:
+        return f"{value * 1000:.0f}ms"
+    return f"{value:.1f}s"
+
+
+class Command(BaseCommand):
+    help = (
+        "Report Celery backlog per queue and, per task, queue lag, run time and outcomes "
+        "(from core.task_metrics). 'busy' is run time per wall-clock second since the task "
+        "was first seen: the average number of worker processes it has kept occupied."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues', help="Queue to report (repeatable); default: configured queues")
+        parser.add_argument('--workers', action='store_true', help="Also ask running workers for active/reserved tasks and pool size")
+        parser.add_argument('--reset', action='store_true', help="Clear the task metrics (start a new measurement window) and exit")
+
+    def handle(self, *args, queues, workers, reset, **options):
+        if reset:
+            get_store().reset()
+            self.stdout.write(self.style.SUCCESS("Task metrics cleared."))
+            return
+
+        self._queues(queues or self._configured_queues())
+        if workers:
+            self._workers()
+        self._tasks()
+
+    def _configured_queues(self):
+        names = {app.conf.task_default_queue}
+        names.update(queue.name for queue in app.conf.task_queues or ())
+        routes = app.conf.task_routes
+        if isinstance(routes, dict):
+            names.update(route['queue'] for route in routes.values() if isinstance(route, dict) and route.get('queue'))
+        return sorted(names)
+
+    def _queues(self, names):
+        self.stdout.write(f"{'queue':<24} {'pending':>8}")
+        with app.connection_for_read() as connection:
+            for name in names:
+                # A failed passive declare closes the channel on AMQP, so use one per queue
+                channel = connection.channel()
+                try:
+                    _, pending, _ = channel.queue_declare(queue=name, passive=True)
+                except Exception:
+                    # Brokers report a queue with no messages (or never declared) as missing
+                    pending = 0
+                finally:
+                    channel.close()
+                self.stdout.write(f"{name:<24} {pending:>8}")
+        self.stdout.write("")
+
+    def _workers(self):
+        inspect = app.control.inspect(timeout=2)
+        stats = inspect.stats() or {}
+        active = inspect.active() or {}
+        reserved = inspect.reserved() or {}
+        if not stats:
+            self.stdout.write("No workers replied.\n")
+            return
+        self.stdout.write(f"{'worker':<40} {'pool':>5} {'active':>7} {'reserved':>9}")
+        for worker, info in sorted(stats.items()):
+            pool = info.get('pool', {}).get('max-concurrency', '-')
+            self.stdout.write(
+                f"{worker:<40} {pool:>5} {len(active.get(worker, [])):>7} {len(reserved.get(worker, [])):>9}"
+            )
+        self.stdout.write("")
+
+    def _tasks(self):
+        snapshot = get_store().snapshot()
+        if not snapshot:
+            self.stdout.write("No task runs recorded yet.")
+            return
+
+        now = time.time()
+        self.stdout.write(
+            f"{'task':<50} {'runs':>6} {'failed':>6} {'retry':>6} {'lag p50':>8} {'lag p95':>8} "
+            f"{'run avg':>8} {'run p95':>8} {'busy':>6}"
+        )
+        for name, values in snapshot.items():
+            states = outcomes(values)
+            runtime_counts = histogram(values, 'runtime', RUNTIME_BUCKETS)
+            lag_counts = histogram(values, 'lag', LAG_BUCKETS)
+            runs = sum(runtime_counts)
+            runtime_sum = values.get('runtime_sum', 0.0)
+            elapsed = max(now - values.get('first_seen', now), 1.0)
+            self.stdout.write(
+                f"{name:<50} {runs:>6} {states.get('FAILURE', 0):>6} {states.get('RETRY', 0):>6} "
+                f"{_seconds(quantile(0.5, lag_counts, LAG_BUCKETS)):>8} {_seconds(quantile(0.95, lag_counts, LAG_BUCKETS)):>8} "
+                f"{_seconds(runtime_sum / runs if runs else None):>8} {_seconds(quantile(0.95, runtime_counts, RUNTIME_BUCKETS)):>8} "
+                f"{runtime_sum / elapsed:>6.2f}"
+            )
@@ -0,0 +1,364 @@
+import time
+from base64 import b64encode
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+import orjson
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from clinic.models import Patient, TreatmentSession
+from clinic.serializers import PatientSerializer
+from commerce.models import Course, Product, Transaction
+from commerce.serializers import TransactionSerializer
+from tasks.commission_tasks import calculate_commissions_batch
+from .fast_list import compile_plan
+from .metrics import registry
+from .response_cache import response_cache
+from . import task_metrics
+from .task_metrics import RUNTIME_BUCKETS, get_store, histogram, outcomes, quantile
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        response_cache.clear()
+
+    def _walk(self, url):
+        """Follow `next` links to the end, then `previous` links back to the start."""
+        pages = []
+        while url:
+            body = self.client.get(url).json()
+            pages.append([row['id'] for row in body['results']])
+            url = body['next']
+        backwards = []
+        url = body['previous']
+        while url:
+            body = self.client.get(url).json()
+            backwards.append([row['id'] for row in body['results']])
+            url = body['previous']
+        return pages, backwards
+
+    def test_ties_on_created_at_are_broken_by_id_descending(self):
+        patients = [
+            Patient.objects.create(hn=f'HN-{n}', first_name='Malee', last_name=str(n), phone_number='0812345678')
+            for n in range(5)
+        ]
+        # All but one created in the same microsecond
+        Patient.objects.filter(pk__in=[p.pk for p in patients[:4]]).update(
+            created_at=datetime(2025, 3, 1, 9, 0, tzinfo=dt_timezone.utc)
+        )
+
+        pages, backwards = self._walk('/api/v1/clinic/patients/?page_size=2')
+
+        tied = sorted((str(p.pk) for p in patients[:4]), reverse=True)
+        self.assertEqual(pages, [[str(patients[4].pk), tied[0]], tied[1:3], tied[3:]])
+        self.assertEqual(backwards, pages[-2::-1])
+
+    def test_ascending_ordering(self):
+        product = Product.objects.create(sku='LASER', name='Laser', product_type='SERVICE', price=Decimal('1500'))
+        courses = [
+            Course.objects.create(name=name, product_included=product, total_sessions=5, price=Decimal('6000'))
+            for name in ('Laser x5', 'Botox', 'Laser x5', 'Laser x5')
+        ]
+
+        pages, _ = self._walk('/api/v1/commerce/courses/?page_size=2')
+
+        lasers = sorted(str(course.pk) for course in courses if course.name == 'Laser x5')
+        self.assertEqual(pages, [[str(courses[1].pk), lasers[0]], lasers[1:]])
+
+    def test_malformed_cursor_is_not_found(self):
+        Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+
+        def cursor(position):
+            return b64encode(f'p={position}'.encode()).decode()
+
+        for value in [cursor('not-json'), cursor('[1]'), cursor('[null,null]'),
+                      cursor('["yesterday","x"]'), cursor('["2025-03-01 09:00:00+00:00","not-a-uuid"]')]:
+            response = self.client.get('/api/v1/clinic/patients/', {'cursor': value})
+            self.assertEqual(response.status_code, 404, value)
+
+
+@override_settings(TASK_METRICS_URL='')
+class PerformanceMiddlewareTest(TestCase):
+    def setUp(self):
+        registry.clear()
+        Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/v1/clinic/patients/')
+
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/v1/clinic/patients/')
+        self.client.get('/api/v1/clinic/patients/00000000-0000-0000-0000-000000000000/')
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('http_requests_total{method="GET",route="api/v1/clinic/patients/",status="200"} 1', body)
+        self.assertIn('http_requests_total{method="GET",route="api/v1/clinic/patients/{pk}/",status="404"} 1', body)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="api/v1/clinic/patients/",le="+Inf"} 1', body)
+        self.assertIn('http_request_db_queries_count{method="GET",route="api/v1/clinic/patients/"} 1', body)
+
+    async def test_async_views_are_measured_under_asgi(self):
+        # The query runs in a thread with its own connection; it is still attributed to the request
+        response = await self.async_client.get('/api/v1/dashboard/metrics/?days=7')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries", ')
+        body = (await self.async_client.get('/metrics')).content.decode()
+        self.assertIn('http_request_db_queries_count{method="GET",route="api/v1/dashboard/metrics/"} 1', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_log_includes_sql(self):
+        with self.assertLogs('core.slow_requests', level='WARNING') as logs:
+            self.client.get('/api/v1/clinic/patients/')
+
+        self.assertIn('GET /api/v1/clinic/patients/', logs.output[0])
+        self.assertIn('clinic_patient', logs.output[0])
+
+
+@override_settings(TASK_METRICS_URL='')
+class TaskMetricsTest(TestCase):
+    def setUp(self):
+        get_store().reset()
+
+    def test_outcomes_and_run_time_per_task(self):
+        calculate_commissions_batch.apply(args=[[]])
+        calculate_commissions_batch.apply(args=[['not-a-uuid']])
+
+        values = get_store().snapshot()[calculate_commissions_batch.name]
+        self.assertEqual(outcomes(values), {'SUCCESS': 1, 'FAILURE': 1})
+        self.assertEqual(sum(histogram(values, 'runtime', RUNTIME_BUCKETS)), 2)
+        # Run eagerly, never published: no queue lag
+        self.assertNotIn('lag_count', values)
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn(f'celery_task_runs_total{{task="{calculate_commissions_batch.name}",state="FAILURE"}} 1', body)
+        self.assertIn(f'celery_task_runtime_seconds_count{{task="{calculate_commissions_batch.name}"}} 2', body)
+
+    def test_runs_without_postrun_do_not_accumulate(self):
+        task = mock.Mock(request=mock.Mock(eta=None, enqueued_at=None, headers={}))
+        task_metrics._task_started(task_id='revoked', task=task)
+        task_metrics._task_revoked(request=mock.Mock(id='revoked'))
+        self.assertNotIn('revoked', task_metrics._started)
+
+        task_metrics._task_started(task_id='killed', task=task)
+        with mock.patch('core.task_metrics.time.perf_counter', return_value=time.perf_counter() + task_metrics.STARTED_MAX_AGE + 1):
+            task_metrics._task_started(task_id='next', task=task)
+        self.assertNotIn('killed', task_metrics._started)
+        task_metrics._started.pop('next')
+
+    def test_quantile_interpolates_within_bucket(self):
+        bounds = (1, 2, 4)
+        self.assertEqual(quantile(0.5, [0, 10, 0, 0], bounds), 1.5)
+        self.assertEqual(quantile(0.95, [0, 0, 0, 3], bounds), 4)
+        self.assertIsNone(quantile(0.5, [0, 0, 0, 0], bounds))
+
+
+# Without CACHE_URL it is off by default; LocMem is enough for a single test process
+@override_settings(TASK_METRICS_URL='', RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        response_cache.clear()
+        Product.objects.create(sku='CREAM', name='Sunscreen', product_type='RETAIL', price=Decimal('450.00'))
+        self.patient = Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+
+    def test_catalog_hits_skip_the_database_until_a_product_changes(self):
+        first = self.client.get('/api/v1/commerce/products/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/v1/commerce/products/')
+
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('miss', 'hit'))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(sku='SERUM', name='Serum', product_type='RETAIL', price=Decimal('990.00'))
+        third = self.client.get('/api/v1/commerce/products/')
+        self.assertEqual(third['X-Cache'], 'miss')
+        self.assertEqual([product['sku'] for product in third.json()['results']], ['CREAM', 'SERUM'])
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_disabled_cache_always_renders(self):
+        self.client.get('/api/v1/commerce/products/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/commerce/products/')
+        self.assertNotIn('X-Cache', response)
+
+    def test_shared_entries_survive_a_new_process(self):
+        self.client.get('/api/v1/commerce/products/?page_size=1')
+        response_cache.discard_local()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/v1/commerce/products/?page_size=1')['X-Cache'], 'hit')
+        self.assertEqual(response_cache.counts['products'], {'local_hit': 0, 'shared_hit': 1, 'miss': 1})
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('response_cache_requests_total{cache="products",result="shared_hit"} 1', body)
+
+    def test_patient_detail_is_cached_per_pdpa_role(self):
+        url = f'/api/v1/clinic/patients/{self.patient.pk}/'
+        self.assertEqual(self.client.get(url).json()['phone_number'], '081-XXX-5678')
+
+        with mock.patch('core.serializers.can_view_unmasked', return_value=True), \
+                mock.patch('core.response_cache.can_view_unmasked', return_value=True):
+            unmasked = self.client.get(url)
+        self.assertEqual((unmasked['X-Cache'], unmasked.json()['phone_number']), ('miss', '0812345678'))
+        self.assertEqual(self.client.get(url)['X-Cache'], 'hit')
+
+        # Any spelling of the id depends on the generation the signal bumps
+        upper = f'/api/v1/clinic/patients/{str(self.patient.pk).upper()}/'
+        self.client.get(upper)
+        self.assertEqual(self.client.get(upper)['X-Cache'], 'hit')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.first_name = 'Somsak'
+            self.patient.save()
+        for changed in (url, upper):
+            response = self.client.get(changed)
+            self.assertEqual((response['X-Cache'], response.json()['first_name']), ('miss', 'Somsak'))
+
+
+@override_settings(TASK_METRICS_URL='', RESPONSE_CACHE_ENABLED=True)
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        response_cache.clear()
+        self.staff = User.objects.create_user('cashier')
+        self.patient = Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+        self.sale = Transaction.objects.create(patient=self.patient, staff_1=self.staff, total_amount=Decimal('1000'))
+
+    def test_unchanged_list_answers_304_until_a_row_changes(self):
+        url = '/api/v1/commerce/transactions/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+        self.assertNotEqual(self.client.get(url + '?page_size=1')['ETag'], etag)
+
+        self.sale.status = 'COMPLETED'
+        self.sale.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(f'{url}{self.sale.pk}/', HTTP_IF_NONE_MATCH='*').status_code, 304)
+
+    def test_etags_cost_no_extra_queries(self):
+        url = '/api/v1/commerce/transactions/'
+        with self.assertNumQueries(1):
+            etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            detail = self.client.get(f'{url}{self.sale.pk}/')
+        # Answering If-None-Match without loading the row: one aggregate
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(f'{url}{self.sale.pk}/', HTTP_IF_NONE_MATCH=detail['ETag']).status_code, 304)
+
+        session = TreatmentSession.objects.create(patient=self.patient, doctor=self.staff)
+        # The session and its images; the ETag comes from the loaded row
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/v1/clinic/sessions/{session.pk}/')
+        self.assertIn('ETag', response)
+
+        # The ETag covers which rows are on the page: a deleted one is replaced by the next
+        newer = Transaction.objects.create(patient=self.patient, staff_1=self.staff, total_amount=Decimal('5'))
+        page = self.client.get(url + '?page_size=1')
+        self.assertEqual(page.json()['results'][0]['id'], str(newer.pk))
+        Transaction.objects.filter(pk=newer.pk).delete()
+        self.assertEqual(self.client.get(url + '?page_size=1', HTTP_IF_NONE_MATCH=page['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_patient_list_etag_depends_on_pdpa_role(self):
+        url = '/api/v1/clinic/patients/'
+        masked = self.client.get(url)['ETag']
+        with mock.patch('core.fast_list.can_view_unmasked', return_value=True), \
+                mock.patch('core.conditional.can_view_unmasked', return_value=True):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=masked)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['phone_number'], '0812345678')
+
+    def test_cached_catalogue_revalidates_without_the_database(self):
+        Product.objects.create(sku='CREAM', name='Sunscreen', product_type='RETAIL', price=Decimal('450.00'))
+        url = '/api/v1/commerce/products/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual((response.status_code, response['X-Cache'], response['ETag']), (304, 'hit', etag))
+
+    def test_session_update_with_stale_if_match_is_refused(self):
+        session = TreatmentSession.objects.create(patient=self.patient, doctor=self.staff, diagnosis_notes='Botox')
+        url = f'/api/v1/clinic/sessions/{session.pk}/'
+        read = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=read['ETag']).status_code, 200)
+
+        first = self.client.patch(url, {'diagnosis_notes': 'Botox 20u'}, content_type='application/json', HTTP_IF_MATCH=read['ETag'])
+        self.assertEqual(first.status_code, 200)
+        self.assertNotEqual(first['ETag'], read['ETag'])
+
+        stale = self.client.patch(url, {'diagnosis_notes': 'Filler'}, content_type='application/json', HTTP_IF_MATCH=read['ETag'])
+        self.assertEqual((stale.status_code, stale['ETag']), (412, first['ETag']))
+        session.refresh_from_db()
+        self.assertEqual(session.diagnosis_notes, 'Botox 20u')
+
+
+@override_settings(TASK_METRICS_URL='', TIME_ZONE='Asia/Bangkok')
+class FastListRenderingTest(TestCase):
+    """The .values() + orjson list path must return the serializers' exact bytes."""
+
+    def setUp(self):
+        caches['default'].clear()
+        response_cache.clear()
+        self.staff = User.objects.create_user('cashier')
+        self.doctor = User.objects.create_user('doctor')
+        for i, (phone, birth) in enumerate([('0812345678', '1990-01-31'), ('123', None), ('', None)]):
+            patient = Patient.objects.create(
+                hn=f'HN-{i}', first_name=f'ชื่อ{i}', last_name='Jaidee "J"', phone_number=phone, date_of_birth=birth,
+            )
+            for amount, status in [('1000', 'PENDING'), ('1234.5', 'COMPLETED'), ('0.05', 'VOID')]:
+                Transaction.objects.create(
+                    patient=patient, staff_1=self.staff, staff_2=self.doctor if status == 'VOID' else None,
+                    total_amount=Decimal(amount), status=status,
+                )
+
+    def _both(self, url):
+        bodies = []
+        for fast in (False, True):
+            with override_settings(FAST_LIST_RENDERING=fast):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            bodies.append(response.content)
+        self.assertEqual(bodies[0], bodies[1], url)
+        return bodies[1]
+
+    def test_same_bytes_as_the_serializers(self):
+        # Otherwise both requests would go through the serializer
+        self.assertIsNotNone(compile_plan(PatientSerializer))
+        self.assertIsNotNone(compile_plan(TransactionSerializer))
+        for url in [
+            '/api/v1/clinic/patients/',
+            '/api/v1/clinic/patients/?page_size=2',
+            '/api/v1/clinic/patients/?fields=hn,phone_number,date_of_birth',
+            '/api/v1/commerce/transactions/',
+            '/api/v1/commerce/transactions/?page_size=4',
+            '/api/v1/commerce/transactions/?fields=created_at,total_amount,status,staff_2,unknown',
+        ]:
+            self._both(url)
+
+        body = orjson.loads(self._both('/api/v1/clinic/patients/?fields=hn,phone_number'))
+        self.assertEqual(body['results'][-1], {'hn': 'HN-0', 'phone_number': '081-XXX-5678'})
+        self.assertEqual(body['results'][-2]['phone_number'], '*****')
+
+    def test_same_bytes_unmasked(self):
+        # Both paths resolve the PDPA role through can_view_unmasked
+        with mock.patch('core.fast_list.can_view_unmasked', return_value=True), \
+                mock.patch('core.serializers.can_view_unmasked', return_value=True):
+            body = orjson.loads(self._both('/api/v1/clinic/patients/?fields=phone_number'))
+            self._both('/api/v1/clinic/patients/')
+        self.assertEqual([row['phone_number'] for row in body['results']], ['', '123', '0812345678'])
@@ -16,9 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/clinic/', include('clinic.urls')),
     path('api/v1/commerce/', include('commerce.urls')),
+    path('api/v1/dashboard/', include('dashboard.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,153 @@
+import heapq
+import uuid
+from datetime import datetime
+from django.db.models import Q
+from clinic.models import Patient, TreatmentSession, ClinicalImage
+from commerce.models import Transaction
+
+FEED_TRANSACTION_STATUSES = ('COMPLETED', 'VOID')
+
+
+def _person_name(user):
+    if user is None:
+        return None
+    return user.get_full_name() or user.username
+
+
+def _patient_name(patient):
+    return f"{patient.first_name} {patient.last_name}"
+
+
+def _transactions(limit, where):
+    queryset = Transaction.objects.filter(
+        where('created_at'), status__in=FEED_TRANSACTION_STATUSES,
+    ).select_related('patient', 'staff_1').order_by('-created_at', '-id')[:limit]
+    for txn in queryset:
+        yield {
+            'id': f"trx-{txn.id}",
+            'type': 'transaction',
+            'timestamp': txn.created_at,
+            'patient_id': str(txn.patient_id),
+            'patient_name': _patient_name(txn.patient),
+            'staff_name': _person_name(txn.staff_1),
+            'action': f"{'Voided' if txn.status == 'VOID' else 'Paid'} {txn.total_amount:,.2f}",
+            'status': txn.status,
+        }, txn.pk
+
+
+def _patients(limit, where):
+    queryset = Patient.objects.filter(where('created_at')).order_by('-created_at', '-id')[:limit]
+    for patient in queryset:
+        yield {
+            'id': f"pt-{patient.id}",
+            'type': 'patient',
+            'timestamp': patient.created_at,
+            'patient_id': str(patient.id),
+            'patient_name': _patient_name(patient),
+            'staff_name': None,
+            'action': "Registered new patient",
+            'status': None,
+        }, patient.pk
+
+
+def _sessions(limit, where):
+    queryset = TreatmentSession.objects.filter(where('date')).select_related(
+        'patient', 'doctor',
+    ).defer('face_chart_blob', 'diagnosis_notes').order_by('-date', '-id')[:limit]
+    for session in queryset:
+        yield {
+            'id': f"ses-{session.id}",
+            'type': 'session',
+            'timestamp': session.date,
+            'patient_id': str(session.patient_id),
+            'patient_name': _patient_name(session.patient),
+            'staff_name': _person_name(session.doctor),
+            'action': "Treatment session",
+            'status': None,
+        }, session.pk
+
+
+def _images(limit, where):
+    queryset = ClinicalImage.objects.filter(where('uploaded_at')).select_related(
+        'session__patient',
+    ).defer(
+        'session__face_chart_blob', 'session__diagnosis_notes',
+    ).order_by('-uploaded_at', '-id')[:limit]
+    for image in queryset:
+        yield {
+            'id': f"img-{image.id}",
+            'type': 'image',
+            'timestamp': image.uploaded_at,
+            'patient_id': str(image.session.patient_id),
+            'patient_name': _patient_name(image.session.patient),
+            'staff_name': None,
+            'action': f"Uploaded {image.get_image_type_display().lower()} photo",
+            'status': None,
+        }, image.pk
+
+
+# (type, loader); `type` doubles as the tie-breaker in the feed ordering.
+SOURCES = [
+    ('image', _images),
+    ('patient', _patients),
+    ('session', _sessions),
+    ('transaction', _transactions),
+]
+
+
+def build_feed(limit, after=None):
+    """
+    Merge the newest rows of every source into one stream ordered by
+    (timestamp, type, pk) descending.
+
+    Each source runs one bounded query (`limit + 1` rows past the cursor on
+    its indexed timestamp column, related names joined in), and the results
+    are k-way merged in memory. `after` is the (timestamp, type, pk) position
+    of the last item already seen.
+
+    Returns (items, next_position); next_position is None on the last page.
+    """
+    streams = []
+    for kind, loader in SOURCES:
+        where = _after_position(kind, after)
+        rows = [
+            ((item['timestamp'], kind, str(pk)), item)
+            for item, pk in loader(limit + 1, where)
+        ]
+        streams.append(rows)
+
+    merged = heapq.merge(*streams, key=lambda row: row[0], reverse=True)
+    page = [row for _, row in zip(range(limit + 1), merged)]
+
+    next_position = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_position = page[-1][0]
+    return [item for _, item in page], next_position
+
+
+def _after_position(kind, after):
+    """Filter factory for rows strictly after `after` in feed order."""
+    def where(field):
+        if after is None:
+            return Q()
+        timestamp, after_kind, after_pk = after
+        if kind < after_kind:
+            return Q(**{f'{field}__lte': timestamp})
+        if kind > after_kind:
+            return Q(**{f'{field}__lt': timestamp})
+        return Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': after_pk})
+    return where
+
+
+def encode_position(position):
+    timestamp, kind, pk = position
+    return f"{timestamp.isoformat()}|{kind}|{pk}"
+
+
+def decode_position(value):
+    timestamp, kind, pk = value.split('|')
+    if kind not in dict(SOURCES):
+        raise ValueError(f"Unknown feed type: {kind}")
+    # Every source is keyed by a UUID; normalised so it compares like the stored ids
+    return datetime.fromisoformat(timestamp), kind, str(uuid.UUID(pk))
@@ -0,0 +1,67 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from clinic.models import Patient, TreatmentSession
+from commerce.models import Transaction
+from dashboard.models import DailyMetric
+
+
+class Command(BaseCommand):
+    help = "Rebuild DailyMetric rollups from source rows (all history, or --from/--to)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='date_to', help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, date_from=None, date_to=None, **options):
+        try:
+            date_from = date.fromisoformat(date_from) if date_from else None
+            date_to = date.fromisoformat(date_to) if date_to else None
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        tz = timezone.get_current_timezone()
+        days = defaultdict(lambda: {
+            'revenue': Decimal('0'),
+            'completed_transactions': 0,
+            'new_patients': 0,
+            'treatment_sessions': 0,
+        })
+
+        def grouped(queryset, field, **aggregates):
+            queryset = queryset.annotate(day=TruncDate(field, tzinfo=tz))
+            if date_from:
+                queryset = queryset.filter(day__gte=date_from)
+            if date_to:
+                queryset = queryset.filter(day__lte=date_to)
+            return queryset.values('day').annotate(**aggregates).order_by()
+
+        for row in grouped(Transaction.objects.filter(status='COMPLETED'), 'created_at',
+                           revenue=Sum('total_amount'), count=Count('id')):
+            days[row['day']]['revenue'] = row['revenue'] or Decimal('0')
+            days[row['day']]['completed_transactions'] = row['count']
+
+        for row in grouped(Patient.objects.all(), 'created_at', count=Count('id')):
+            days[row['day']]['new_patients'] = row['count']
+
+        for row in grouped(TreatmentSession.objects.all(), 'date', count=Count('id')):
+            days[row['day']]['treatment_sessions'] = row['count']
+
+        with db_transaction.atomic():
+            stale = DailyMetric.objects.all()
+            if date_from:
+                stale = stale.filter(date__gte=date_from)
+            if date_to:
+                stale = stale.filter(date__lte=date_to)
+            stale.delete()
+            DailyMetric.objects.bulk_create(
+                [DailyMetric(date=day, **values) for day, values in sorted(days.items())],
+                batch_size=1000,
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(days)} day(s) of dashboard metrics."))
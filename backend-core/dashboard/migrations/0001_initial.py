@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('completed_transactions', models.IntegerField(default=0)),
+                ('new_patients', models.IntegerField(default=0)),
+                ('treatment_sessions', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
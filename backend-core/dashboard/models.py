@@ -0,0 +1,16 @@
+from django.db import models
+
+class DailyMetric(models.Model):
+    """
+    Pre-aggregated dashboard counters for one day.
+    Maintained incrementally by dashboard.signals; rebuilt from source rows
+    with `manage.py rebuild_dashboard_metrics`.
+    """
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    completed_transactions = models.IntegerField(default=0)
+    new_patients = models.IntegerField(default=0)
+    treatment_sessions = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Metrics {self.date}"
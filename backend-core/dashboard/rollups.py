@@ -0,0 +1,40 @@
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import DailyMetric
+
+METRIC_FIELDS = ('revenue', 'completed_transactions', 'new_patients', 'treatment_sessions')
+
+
+def metric_day(value):
+    """Bucket a timestamp into the dashboard day (project TIME_ZONE)."""
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+def apply_deltas(day, **deltas):
+    """
+    Add `deltas` to the counters of `day` with a single UPDATE ... SET x = x + n.
+    Creates the day's row on first use. Callers doing bulk writes that skip
+    model signals (bulk_create, queryset.update) should call this directly.
+    """
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    with db_transaction.atomic():
+        updated = DailyMetric.objects.filter(date=day).update(
+            **{field: F(field) + value for field, value in deltas.items()}
+        )
+        if not updated:
+            DailyMetric.objects.get_or_create(date=day)
+            DailyMetric.objects.filter(date=day).update(
+                **{field: F(field) + value for field, value in deltas.items()}
+            )
+
+
+def transaction_deltas(status, amount):
+    """Counter contribution of a single Transaction in the given state."""
+    if status != 'COMPLETED':
+        return {}
+    return {'revenue': Decimal(amount), 'completed_transactions': 1}
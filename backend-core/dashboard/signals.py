@@ -0,0 +1,67 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from clinic.models import Patient, TreatmentSession
+from commerce.models import Transaction
+from .rollups import apply_deltas, metric_day, transaction_deltas
+
+
+@receiver(post_init, sender=Transaction)
+def remember_transaction_state(sender, instance, **kwargs):
+    """
+    Snapshot the fields the rollup depends on, so post_save can apply the
+    difference without re-reading the row. Reads __dict__ directly to avoid
+    loading deferred fields.
+    """
+    instance._rollup_state = (
+        instance.__dict__.get('status'),
+        instance.__dict__.get('total_amount'),
+        instance.__dict__.get('created_at'),
+    )
+
+
+@receiver(post_save, sender=Transaction)
+def rollup_transaction(sender, instance, created, **kwargs):
+    old_status, old_amount, old_created_at = (None, None, None) if created else instance._rollup_state
+    old = transaction_deltas(old_status, old_amount)
+    new = transaction_deltas(instance.status, instance.total_amount)
+
+    if old and new and metric_day(old_created_at) == metric_day(instance.created_at):
+        apply_deltas(metric_day(instance.created_at), **{
+            field: new[field] - old[field] for field in new
+        })
+    else:
+        if old:
+            apply_deltas(metric_day(old_created_at), **{field: -value for field, value in old.items()})
+        if new:
+            apply_deltas(metric_day(instance.created_at), **new)
+
+    instance._rollup_state = (instance.status, instance.total_amount, instance.created_at)
+
+
+@receiver(post_delete, sender=Transaction)
+def rollup_transaction_delete(sender, instance, **kwargs):
+    old = transaction_deltas(instance.status, instance.total_amount)
+    if old:
+        apply_deltas(metric_day(instance.created_at), **{field: -value for field, value in old.items()})
+
+
+@receiver(post_save, sender=Patient)
+def rollup_new_patient(sender, instance, created, **kwargs):
+    if created:
+        apply_deltas(metric_day(instance.created_at), new_patients=1)
+
+
+@receiver(post_delete, sender=Patient)
+def rollup_patient_delete(sender, instance, **kwargs):
+    apply_deltas(metric_day(instance.created_at), new_patients=-1)
+
+
+@receiver(post_save, sender=TreatmentSession)
+def rollup_new_session(sender, instance, created, **kwargs):
+    if created:
+        apply_deltas(metric_day(instance.date), treatment_sessions=1)
+
+
+@receiver(post_delete, sender=TreatmentSession)
+def rollup_session_delete(sender, instance, **kwargs):
+    apply_deltas(metric_day(instance.date), treatment_sessions=-1)
@@ -0,0 +1,126 @@
+import base64
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from clinic.models import ClinicalImage, Patient, TreatmentSession
+from commerce.models import Transaction
+from .models import DailyMetric
+from .rollups import METRIC_FIELDS, apply_deltas
+
+
+class DailyMetricRollupTest(TestCase):
+    """The signal-maintained rollup must always equal `rebuild_dashboard_metrics`."""
+
+    def setUp(self):
+        self.staff = User.objects.create_user('cashier')
+        self.patient = Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+
+    def _metrics(self):
+        # Days whose counters went back to zero keep their row until a rebuild
+        return {
+            row['date']: row for row in DailyMetric.objects.values('date', *METRIC_FIELDS)
+            if any(row[field] for field in METRIC_FIELDS)
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self._metrics()
+        call_command('rebuild_dashboard_metrics', stdout=StringIO())
+        self.assertEqual(incremental, self._metrics())
+        return incremental
+
+    def test_create_status_change_and_void(self):
+        today = timezone.localdate()
+        TreatmentSession.objects.create(patient=self.patient, doctor=self.staff)
+        sale = Transaction.objects.create(patient=self.patient, staff_1=self.staff, total_amount=Decimal('1000'))
+        self.assertEqual(self.assertMatchesRebuild()[today]['completed_transactions'], 0)
+
+        sale.status = 'COMPLETED'
+        sale.save()
+        # Loaded fresh (snapshot from post_init), amount corrected after completion
+        sale = Transaction.objects.get(pk=sale.pk)
+        sale.total_amount = Decimal('1250.50')
+        sale.save()
+        Transaction.objects.create(patient=self.patient, staff_1=self.staff, total_amount=Decimal('99.50'), status='COMPLETED')
+        metrics = self.assertMatchesRebuild()[today]
+        self.assertEqual((metrics['revenue'], metrics['completed_transactions']), (Decimal('1350.00'), 2))
+        self.assertEqual((metrics['new_patients'], metrics['treatment_sessions']), (1, 1))
+
+        sale.status = 'VOID'
+        sale.save()
+        metrics = self.assertMatchesRebuild()[today]
+        self.assertEqual((metrics['revenue'], metrics['completed_transactions']), (Decimal('99.50'), 1))
+
+    def test_backdated_and_deleted_rows(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        sale = Transaction.objects.create(patient=self.patient, staff_1=self.staff, total_amount=Decimal('500'), status='COMPLETED')
+        sale.created_at = yesterday
+        sale.save()
+        self.assertEqual(self.assertMatchesRebuild()[timezone.localdate(yesterday)]['revenue'], Decimal('500.00'))
+
+        Transaction.objects.get(pk=sale.pk).delete()
+        TreatmentSession.objects.create(patient=self.patient, doctor=self.staff).delete()
+        self.patient.delete()
+        self.assertEqual(self.assertMatchesRebuild(), {})
+
+    def test_apply_deltas_creates_the_day(self):
+        day = timezone.localdate(timezone.make_aware(datetime(2025, 3, 1, 12)))
+        apply_deltas(day, revenue=Decimal('10'), new_patients=0)
+        apply_deltas(day, revenue=Decimal('-2.50'), completed_transactions=1)
+
+        row = DailyMetric.objects.get(date=day)
+        self.assertEqual((row.revenue, row.completed_transactions, row.new_patients), (Decimal('7.50'), 1, 0))
+
+
+class ActivityFeedTest(TestCase):
+    URL = '/api/v1/dashboard/activity/'
+
+    def setUp(self):
+        staff = User.objects.create_user('doctor', first_name='Malee', last_name='Dee')
+        noon = timezone.make_aware(datetime(2025, 3, 1, 12))
+        patient = Patient.objects.create(hn='HN-1', first_name='Somchai', last_name='Jaidee', phone_number='0812345678')
+        session = TreatmentSession.objects.create(patient=patient, doctor=staff)
+        image = ClinicalImage.objects.create(session=session, s3_key='uploads/a.jpg', image_type='BEFORE')
+        sales = [
+            Transaction.objects.create(patient=patient, staff_1=staff, total_amount=Decimal(amount), status=status)
+            for amount, status in [('1500', 'COMPLETED'), ('200', 'VOID'), ('300', 'COMPLETED'), ('50', 'PENDING')]
+        ]
+        # Ties across sources and within the transactions at noon
+        Patient.objects.filter(pk=patient.pk).update(created_at=noon)
+        TreatmentSession.objects.filter(pk=session.pk).update(date=noon)
+        Transaction.objects.filter(pk__in=[sales[0].pk, sales[1].pk, sales[3].pk]).update(created_at=noon)
+        Transaction.objects.filter(pk=sales[2].pk).update(created_at=noon + timedelta(hours=1))
+        ClinicalImage.objects.filter(pk=image.pk).update(uploaded_at=noon - timedelta(hours=1))
+
+        tied = sorted(sales[:2], key=lambda sale: str(sale.pk), reverse=True)
+        self.expected = (
+            [f'trx-{sales[2].pk}'] + [f'trx-{sale.pk}' for sale in tied]
+            + [f'ses-{session.pk}', f'pt-{patient.pk}', f'img-{image.pk}']
+        )
+        self.sales = sales
+
+    def test_pages_follow_the_merged_order(self):
+        body = self.client.get(self.URL, {'limit': 100}).json()
+        self.assertEqual([item['id'] for item in body['results']], self.expected)
+        self.assertIsNone(body['next'])
+
+        seen, url = [], f'{self.URL}?limit=2'
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(len(body['results']), 2)
+            seen += [item['id'] for item in body['results']]
+            url = body['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_voided_sales_are_labelled(self):
+        actions = {item['id']: item['action'] for item in self.client.get(self.URL).json()['results']}
+        self.assertEqual(actions[f'trx-{self.sales[0].pk}'], 'Paid 1,500.00')
+        self.assertEqual(actions[f'trx-{self.sales[1].pk}'], 'Voided 200.00')
+
+    def test_malformed_cursor(self):
+        for position in ['garbage', '2025-03-01T12:00:00+00:00|refund|x', '2025-03-01T12:00:00+00:00|patient|not-a-uuid']:
+            cursor = base64.urlsafe_b64encode(position.encode()).decode()
+            self.assertEqual(self.client.get(self.URL, {'cursor': cursor}).status_code, 400, position)
@@ -0,0 +1,102 @@
+import base64
+from datetime import timedelta
+from decimal import Decimal
+from django.utils import timezone
+from rest_framework import views
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from core.async_views import AsyncAPIView
+from .activity import build_feed, decode_position, encode_position
+from .models import DailyMetric
+from .rollups import METRIC_FIELDS
+
+MAX_PERIOD_DAYS = 366
+MAX_FEED_LIMIT = 100
+
+
+def _change_pct(current, previous):
+    if not previous:
+        return None
+    return round(float((current - previous) / previous * 100), 1)
+
+
+class DashboardMetricsView(AsyncAPIView):
+    """
+    GET /dashboard/metrics/?days=30
+    Totals for the last `days` days (ending today) and the preceding period,
+    read from the DailyMetric rollup: cost is O(days), not O(rows). Polled
+    by every open dashboard, so it is async: one query, awaited.
+    """
+    async def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({"error": "days must be an integer"}, status=400)
+        if not 1 <= days <= MAX_PERIOD_DAYS:
+            return Response({"error": f"days must be between 1 and {MAX_PERIOD_DAYS}"}, status=400)
+
+        end = timezone.localdate()
+        start = end - timedelta(days=days - 1)
+        previous_start = start - timedelta(days=days)
+
+        rows = DailyMetric.objects.filter(date__range=(previous_start, end)).order_by('date')
+
+        current = dict.fromkeys(METRIC_FIELDS, 0)
+        previous = dict.fromkeys(METRIC_FIELDS, 0)
+        current['revenue'] = previous['revenue'] = Decimal('0')
+        daily = []
+        async for row in rows:
+            bucket = current if row.date >= start else previous
+            for field in METRIC_FIELDS:
+                bucket[field] += getattr(row, field)
+            if row.date >= start:
+                daily.append({
+                    'date': row.date.isoformat(),
+                    **{field: str(getattr(row, field)) if field == 'revenue' else getattr(row, field)
+                       for field in METRIC_FIELDS},
+                })
+
+        metrics = {}
+        for field in METRIC_FIELDS:
+            value, prior = current[field], previous[field]
+            metrics[field] = {
+                'value': str(value) if field == 'revenue' else value,
+                'previous': str(prior) if field == 'revenue' else prior,
+                'change_pct': _change_pct(value, prior),
+            }
+
+        return Response({
+            'period': {'start': start.isoformat(), 'end': end.isoformat(), 'days': days},
+            'metrics': metrics,
+            'daily': daily,
+        })
+
+
+class ActivityFeedView(views.APIView):
+    """
+    GET /dashboard/activity/?limit=20&cursor=<opaque>
+    Completed/voided transactions, new patients, treatment sessions and image
+    uploads merged newest-first. One bounded query per source per page.
+    """
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), MAX_FEED_LIMIT)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+
+        after = None
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                after = decode_position(base64.urlsafe_b64decode(cursor.encode()).decode())
+            except ValueError:
+                return Response({"error": "Invalid cursor"}, status=400)
+
+        items, next_position = build_feed(limit, after=after)
+
+        next_link = None
+        if next_position is not None:
+            encoded = base64.urlsafe_b64encode(encode_position(next_position).encode()).decode()
+            next_link = replace_query_param(request.build_absolute_uri(), 'cursor', encoded)
+
+        return Response({'next': next_link, 'results': items})
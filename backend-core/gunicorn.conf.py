@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for serving the API outside of development:
+
+    gunicorn -c gunicorn.conf.py
+
+SERVER_MODE=wsgi (default): core.wsgi under threaded workers. The async
+views (core.async_views) run through async_to_sync.
+SERVER_MODE=asgi: core.asgi under Uvicorn workers. The async views (upload
+token/confirm, dashboard metrics, patient search) run on the event loop;
+the other DRF views run in a thread per request.
+
+WSGI is the default: it is faster on every sync endpoint, and under ASGI
+Django buffers a StreamingHttpResponse over a sync iterator, so the
+transaction/commission exports and the patient import progress stream
+send nothing until they are complete. Choose ASGI only where requests
+mostly wait on slow storage. Keep CONN_MAX_AGE at 0 under ASGI:
+connections belong to the thread that opened them, and request threads
+are not reused.
+"""
+import multiprocessing
+import os
+
+mode = os.environ.get('SERVER_MODE', 'wsgi').lower()
+if mode not in ('asgi', 'wsgi'):
+    raise RuntimeError(f"SERVER_MODE must be asgi or wsgi, not {mode!r}")
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+if mode == 'asgi':
+    wsgi_app = 'core.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'core.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so a slow leak cannot grow without bound
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = max_requests // 10
+accesslog = '-' if os.environ.get('GUNICORN_ACCESS_LOG', 'false').lower() == 'true' else None
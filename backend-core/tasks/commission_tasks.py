@@ -1,80 +1,146 @@
+from datetime import timedelta
 from celery import shared_task
-from django.db import transaction as db_transaction
-from commerce.models import Transaction, CommissionLog
+from django.db import OperationalError, transaction as db_transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from commerce.commission_rules import line_amounts, load_engine
+from commerce.ledger import payroll_period, write_commission_logs
+from commerce.models import Transaction, CommissionLog, CommissionOutbox
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Outbox rows claimed per dispatcher pass, and transaction ids per Celery message.
+OUTBOX_BATCH_SIZE = 1000
+COMMISSION_CHUNK_SIZE = 200
+OUTBOX_RETENTION = timedelta(days=7)
+# A claim not completed within this time is dispatched again; well above the
+# batch task's run time plus its retry backoff.
+OUTBOX_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+@shared_task(bind=True, autoretry_for=(OperationalError,), retry_backoff=True, max_retries=5)
+def calculate_commissions_batch(self, transaction_ids, outbox_ids=()):
+    """
+    Calculate commissions for a chunk of transactions under the active rules.
+    Query count is fixed per chunk: rules, transactions, the ids that already
+    have logs, their line amounts (only with product type rates), then in
+    write_commission_logs a lock on the sales, their existing logs, one bulk
+    insert and one ledger upsert.
+
+    `outbox_ids` are the CommissionOutbox rows this chunk was dispatched for;
+    they are marked completed in the same DB transaction as the logs, so a
+    chunk that never gets this far is dispatched again.
+
+    Errors propagate, so a failed chunk is recorded as a FAILURE (see
+    core.task_metrics); transient database errors are retried with backoff,
+    which is safe because logs that already exist are skipped, even when
+    another worker writes the same transaction concurrently.
+    """
+    transaction_ids = list(dict.fromkeys(str(txn_id) for txn_id in transaction_ids))
+    logger.info(f"Starting commission calculation for {len(transaction_ids)} transaction(s)")
+
+    engine = load_engine()
+
+    # Voided logs do not count: a sale voided and completed again is recalculated
+    already_calculated = set(
+        CommissionLog.objects.filter(transaction_id__in=transaction_ids, voided_at__isnull=True)
+        .values_list('transaction_id', flat=True).distinct()
+    )
+
+    rows = list(Transaction.objects.filter(
+        id__in=transaction_ids, status='COMPLETED'
+    ).exclude(id__in=already_calculated).values_list('id', 'total_amount', 'staff_1_id', 'staff_2_id', 'created_at'))
+
+    periods = {row[0]: payroll_period(row[4]) for row in rows}
+
+    lines = line_amounts(list(periods)) if engine.uses_lines and rows else None
+
+    logs = [
+        CommissionLog(period=periods[values['transaction_id']], **values)
+        for values in engine.evaluate((row[:4] for row in rows), lines)
+    ]
+
+    # Logs, the staff ledger and the outbox completion are written in one DB transaction
+    with db_transaction.atomic():
+        written = write_commission_logs(logs)
+        if outbox_ids:
+            CommissionOutbox.objects.filter(id__in=outbox_ids).update(completed_at=timezone.now())
+
+    logger.info(f"Created {len(written)} commission log(s)")
+    return len(written)
+
+
 @shared_task
 def calculate_commission(transaction_id):
     """
-    Async task to calculate commission for a completed transaction.
-    Logic:
-    - Total sales > 100,000: 10% commission
-    - Total sales <= 100,000: 5% commission
-    - Split equally if multiple staff involved.
+    Async task to calculate commission for a single completed transaction.
+    Kept for direct callers; the outbox dispatcher uses the batched variant.
+    """
+    return calculate_commissions_batch([transaction_id])
+
+
+@shared_task
+def dispatch_commission_outbox(batch_size=OUTBOX_BATCH_SIZE, chunk_size=COMMISSION_CHUNK_SIZE):
+    """
+    Claim pending CommissionOutbox rows, and claims older than
+    OUTBOX_CLAIM_TIMEOUT that were never completed, and publish one
+    calculate_commissions_batch message per `chunk_size` distinct
+    transactions. Rows being dispatched again go one transaction per
+    message, so a transaction that keeps failing cannot hold back the rest
+    of its chunk. Scheduled by Celery beat (see CELERY_BEAT_SCHEDULE).
     """
-    logger.info(f"Starting commission calculation for transaction {transaction_id}")
-    
-    try:
-        txn = Transaction.objects.get(id=transaction_id)
-        
-        # Skip if not completed
-        if txn.status != 'COMPLETED':
-            logger.warning(f"Transaction {transaction_id} is not COMPLETED. Skipping.")
-            return
-
-        # Skip if already calculated
-        if hasattr(txn, 'commission_log'):
-            logger.info(f"Commission already calculated for {transaction_id}")
-            return
-
-        amount = float(txn.total_amount)
-        
-        # --- Core Business Logic ---
-        if amount > 100000:
-            rate = 0.10
-            rule = "High Value (>100k)"
-        else:
-            rate = 0.05
-            rule = "Standard Value (<=100k)"
-            
-        total_commission = amount * rate
-        
-        # Staff Splitting Logic
-        staff_members = []
-        if txn.staff_1:
-            staff_members.append(txn.staff_1)
-        if txn.staff_2:
-            staff_members.append(txn.staff_2)
-            
-        if not staff_members:
-            logger.warning("No staff assigned to transaction.")
-            return
-
-        split_amount = total_commission / len(staff_members)
-        
-        # Use atomic transaction to ensure logs are created safely
+    dispatched = 0
+    while True:
+        now = timezone.now()
         with db_transaction.atomic():
-            for staff in staff_members:
-                CommissionLog.objects.create(
-                    transaction=txn,
-                    staff=staff,
-                    amount=split_amount,
-                    calculation_details={
-                        "rule": rule,
-                        "rate": rate,
-                        "total_txn_amount": amount,
-                        "total_commission_pool": total_commission,
-                        "split_count": len(staff_members)
-                    }
+            rows = list(
+                CommissionOutbox.objects.select_for_update(skip_locked=True)
+                .filter(completed_at__isnull=True)
+                .filter(Q(dispatched_at__isnull=True) | Q(dispatched_at__lt=now - OUTBOX_CLAIM_TIMEOUT))
+                .order_by('id')
+                .values_list('id', 'transaction_id', 'attempts')[:batch_size]
+            )
+            if not rows:
+                break
+
+            CommissionOutbox.objects.filter(id__in=[row_id for row_id, _, _ in rows]).update(
+                dispatched_at=now, attempts=F('attempts') + 1,
+            )
+
+            chunks = _chunk_rows([row for row in rows if not row[2]], chunk_size)
+            retried = [row for row in rows if row[2]]
+            if retried:
+                logger.warning(
+                    f"Dispatching {len(retried)} commission outbox row(s) again after an uncompleted claim: "
+                    f"transactions {', '.join(str(txn_id) for _, txn_id, _ in retried[:20])}"
+                )
+                chunks += _chunk_rows(retried, 1)
+            for transaction_ids, outbox_ids in chunks:
+                # Publish only once the claim is committed
+                db_transaction.on_commit(
+                    lambda transaction_ids=transaction_ids, outbox_ids=outbox_ids:
+                        calculate_commissions_batch.delay(transaction_ids, outbox_ids)
                 )
-        
-        logger.info(f"Commission calculated successfully for {transaction_id}")
-        return f"Calculated: {split_amount} per person ({len(staff_members)})"
+                dispatched += len(transaction_ids)
+
+        if len(rows) < batch_size:
+            break
+
+    CommissionOutbox.objects.filter(completed_at__lt=timezone.now() - OUTBOX_RETENTION).delete()
+
+    if dispatched:
+        logger.info(f"Dispatched {dispatched} transaction(s) for commission calculation")
+    return dispatched
 
-    except Transaction.DoesNotExist:
-        logger.error(f"Transaction {transaction_id} not found.")
-    except Exception as e:
-        logger.exception(f"Error calculating commission: {e}")
 
+def _chunk_rows(rows, chunk_size):
+    """Group outbox rows into (transaction_ids, outbox_ids) per `chunk_size` distinct transactions."""
+    by_transaction = {}
+    for row_id, transaction_id, _ in rows:
+        by_transaction.setdefault(str(transaction_id), []).append(row_id)
+    transaction_ids = list(by_transaction)
+    return [
+        (chunk, [row_id for txn_id in chunk for row_id in by_transaction[txn_id]])
+        for chunk in (transaction_ids[start:start + chunk_size] for start in range(0, len(transaction_ids), chunk_size))
+    ]
@@ -0,0 +1,114 @@
+import io
+import os
+from tempfile import SpooledTemporaryFile
+from botocore.exceptions import BotoCoreError, ClientError
+from celery import shared_task
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+from clinic.models import ClinicalImage, ImageDerivative
+from core.services.storage import MinIOService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pillow format -> (file extension, content type, save options)
+FORMATS = {
+    'jpeg': ('jpg', 'image/jpeg', {'optimize': True, 'progressive': True}),
+    'webp': ('webp', 'image/webp', {'method': 4}),
+}
+
+
+def derivative_variant(width, fmt):
+    return f"w{width}.{FORMATS[fmt][0]}"
+
+
+def derivative_key(s3_key, variant):
+    """'uploads/<uuid>.jpg' -> 'uploads/<uuid>.w256.webp'"""
+    return f"{os.path.splitext(s3_key)[0]}.{variant}"
+
+
+def _render(image, fmt):
+    extension, content_type, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=settings.IMAGE_DERIVATIVE_QUALITY, **options)
+    return buffer.getvalue(), content_type
+
+
+@shared_task(bind=True, autoretry_for=(BotoCoreError, ClientError), retry_backoff=True, max_retries=3)
+def generate_image_derivatives(self, image_id):
+    """
+    Generate the sized JPEG/WebP renditions of a ClinicalImage and record
+    them as ImageDerivative rows.
+
+    The original is streamed into a spooled temp file (disk-backed above
+    IMAGE_DERIVATIVE_SPOOL_SIZE) and, for JPEGs, decoded directly at a
+    reduced DCT scale via Image.draft(), so a 40 MP photo never has to be
+    fully decoded. Keys are deterministic and rows are upserted, so retries
+    and re-runs overwrite rather than duplicate; variants that already exist
+    are skipped.
+    """
+    try:
+        image = ClinicalImage.objects.only('id', 's3_key').get(id=image_id)
+    except ClinicalImage.DoesNotExist:
+        logger.warning(f"ClinicalImage {image_id} not found; skipping derivatives")
+        return 0
+
+    widths = sorted(settings.IMAGE_DERIVATIVE_WIDTHS, reverse=True)
+    wanted = {
+        derivative_variant(width, fmt): (width, fmt)
+        for width in widths for fmt in settings.IMAGE_DERIVATIVE_FORMATS
+    }
+    existing = set(image.derivatives.values_list('variant', flat=True))
+    if not wanted.keys() - existing:
+        return 0
+
+    service = MinIOService()
+    derivatives = []
+    with SpooledTemporaryFile(max_size=settings.IMAGE_DERIVATIVE_SPOOL_SIZE) as original:
+        service.download_fileobj(image.s3_key, original)
+        try:
+            source = Image.open(original)
+            # JPEG only: let the decoder downscale by up to 8x while decoding
+            source.draft('RGB', (widths[0], widths[0]))
+            source = ImageOps.exif_transpose(source).convert('RGB')
+        except (UnidentifiedImageError, OSError) as e:
+            logger.warning(f"ClinicalImage {image_id} ({image.s3_key}) is not a decodable image: {e}")
+            return 0
+
+        # Largest first; each smaller size is resampled from the previous one
+        for width in widths:
+            source.thumbnail((width, width), Image.Resampling.LANCZOS)
+            for fmt in settings.IMAGE_DERIVATIVE_FORMATS:
+                variant = derivative_variant(width, fmt)
+                if variant in existing:
+                    continue
+                body, content_type = _render(source, fmt)
+                key = derivative_key(image.s3_key, variant)
+                service.put_object(key, body, content_type)
+                derivatives.append(ImageDerivative(
+                    image_id=image.id, variant=variant, s3_key=key,
+                    width=source.width, height=source.height,
+                    format=fmt, size_bytes=len(body),
+                ))
+
+    ImageDerivative.objects.bulk_create(
+        derivatives,
+        update_conflicts=True,
+        unique_fields=['image', 'variant'],
+        update_fields=['s3_key', 'width', 'height', 'format', 'size_bytes'],
+    )
+    logger.info(f"Generated {len(derivatives)} derivative(s) for ClinicalImage {image_id}")
+    return len(derivatives)
+
+
+def enqueue_image_derivatives(image_ids):
+    """
+    Publish one generate_image_derivatives message per image. A broker
+    outage is logged rather than failing the upload; the
+    generate_image_derivatives management command backfills.
+    """
+    for image_id in image_ids:
+        try:
+            generate_image_derivatives.delay(str(image_id))
+        except Exception as e:
+            logger.error(f"Could not enqueue derivatives for ClinicalImage {image_id}: {e}")
@@ -22,24 +22,18 @@ export const useActivityStore = defineStore('activity', {
             this.loading = true
             this.error = null
             try {
-                // 1. Fetch Transactions (Commerce)
-                const trxRes = await api.get('commerce/transactions/')
-                // 2. Fetch Patients (Clinic)
-                const patRes = await api.get('clinic/patients/')
+                // Server-side merged feed: transactions, new patients, sessions, uploads
+                const res = await api.get('dashboard/activity/', { params: { limit: 10 } })
 
-                const patientsMap = new Map(patRes.data.map((p: any) => [p.id, `${p.first_name} ${p.last_name}`]))
-
-                const transactionActivities = trxRes.data.map((t: any) => ({
-                    id: `trx-${t.id}`,
-                    time: new Date(t.created_at).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
-                    patientName: patientsMap.get(t.patient_id) || 'Unknown Patient',
-                    patientId: t.patient_id,
-                    action: `Paid ${t.amount}`,
-                    status: t.status,
-                    statusClass: t.status === 'completed' ? 'bg-green-100 text-green-700' : 'bg-yellow-100 text-yellow-700'
+                this.activities = res.data.results.map((a: any) => ({
+                    id: a.id,
+                    time: new Date(a.timestamp).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
+                    patientName: a.patient_name,
+                    patientId: a.patient_id,
+                    action: a.action,
+                    status: a.status ?? 'Done',
+                    statusClass: a.status === 'VOID' ? 'bg-red-100 text-red-700' : 'bg-green-100 text-green-700'
                 }))
-
-                this.activities = transactionActivities.reverse().slice(0, 10)
             } catch (err) {
                 console.error('Failed to fetch activities:', err)
                 this.error = 'Failed to load activities'
@@ -0,0 +1,39 @@
+import { defineStore } from 'pinia'
+import api from '../api'
+
+interface MetricValue {
+    value: string | number
+    previous: string | number
+    change_pct: number | null
+}
+
+interface DashboardMetrics {
+    revenue: MetricValue
+    completed_transactions: MetricValue
+    new_patients: MetricValue
+    treatment_sessions: MetricValue
+}
+
+export const useMetricsStore = defineStore('metrics', {
+    state: () => ({
+        metrics: null as DashboardMetrics | null,
+        loading: false,
+        error: null as string | null
+    }),
+    actions: {
+        async fetchMetrics(days = 30) {
+            this.loading = true
+            this.error = null
+            try {
+                // Pre-aggregated daily rollups; no per-row fetching on the client
+                const res = await api.get('dashboard/metrics/', { params: { days } })
+                this.metrics = res.data.metrics
+            } catch (err) {
+                console.error('Failed to fetch dashboard metrics:', err)
+                this.error = 'Failed to load metrics'
+            } finally {
+                this.loading = false
+            }
+        }
+    }
+})